@@ -0,0 +1,222 @@
+#!/usr/bin/env python
+
+##  Copyright (c) 2009-2010 Ethan Rowe (ethan@endpoint.com)
+##  For more information, see http://github.com/ethanrowe/thunderhead
+##
+##  This file is part of Thunderhead.
+##
+##  Thunderhead is free software: you can redistribute it and/or modify
+##  it under the terms of the GNU General Public License as published by
+##  the Free Software Foundation, either version 3 of the License, or
+##  (at your option) any later version.
+##
+##  Thunderhead is distributed in the hope that it will be useful,
+##  but WITHOUT ANY WARRANTY; without even the implied warranty of
+##  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##  GNU General Public License for more details.
+##
+
+"""
+Measures the Rackspace client against a local fake of the servers API (see
+bench/fakeapi.py): requests per second, median and 99th-percentile latency and
+peak memory for each scenario.
+
+    python bench/client.py [--servers N] [--images N] [--flavors N] [--delta N]
+                           [--latency SECONDS] [--iterations N] [--threads N]
+                           [--compact] [--memory] [scenario ...]
+
+Scenarios (all by default):
+    getServers      full servers list, uncached
+    getImages       full images list, uncached
+    getFlavors      full flavors list, uncached
+    parseServers    parsing the full servers list from memory, no socket
+    createServer    POST /servers
+    deleteServer    DELETE /servers/<id>
+    cachedServers   Account.getServers() answered from the cache
+    refreshServers  Account.getServers() refreshing from changes-since each call
+
+Each scenario runs in a process of its own, so that its peak resident size (as
+reported by getrusage) is its own; the fake API runs in another.  With --memory,
+requests go instead to the fake API within the scenario's own process, by way of
+transport.InMemoryTransport, taking sockets (and --latency) out of the picture.
+"""
+
+import sys, os.path, time, threading, resource, signal, cPickle as pickle
+from cStringIO import StringIO
+
+sys.path = [
+    os.path.abspath(
+        os.path.join( os.path.dirname(__file__), '..', 'lib')
+        ) ] + sys.path
+
+import thunderhead
+import thunderhead.rackspace as rackspace
+import thunderhead.rackspace.api as api
+import thunderhead.rackspace.stream as stream
+import thunderhead.rackspace.transport as transport
+import fakeapi
+
+def percentile(ordered, fraction):
+    if not ordered: return 0
+    return ordered[int(round(fraction * (len(ordered) - 1)))]
+
+def timeCalls(call, iterations, threads):
+    """
+    Run <call> <iterations> times spread over <threads> threads, returning the wall
+    time taken and the latency of each call.
+    """
+    latencies = []
+    lock = threading.Lock()
+    def worker(count):
+        mine = []
+        for i in xrange(count):
+            started = time.time()
+            call()
+            mine.append(time.time() - started)
+        lock.acquire()
+        latencies.extend(mine)
+        lock.release()
+    shares = [iterations / threads + (i < iterations % threads) for i in range(threads)]
+    workers = [threading.Thread(target=worker, args=(share,)) for share in shares]
+    started = time.time()
+    for thread in workers: thread.start()
+    for thread in workers: thread.join()
+    return time.time() - started, latencies
+
+class Scenarios(object):
+    """
+    Each scenario method prepares its call (untimed) and returns it.
+    """
+    def __init__(self, opts, service):
+        self.opts = opts
+        self.service = service
+        self.account = thunderhead.Account(rackspace, 'benchmark', 'key')
+
+    def connection(self):
+        return self.account.session.serverManager
+
+    def getServers(self):
+        conn = self.connection()
+        return lambda: api.getServers(conn)
+
+    def getImages(self):
+        conn = self.connection()
+        return lambda: api.getImages(conn)
+
+    def getFlavors(self):
+        conn = self.connection()
+        return lambda: api.getFlavors(conn)
+
+    def parseServers(self):
+        body = self.service.documents['servers']
+        return lambda: api.indexRecords(stream.RecordStream(StringIO(body), api.ServerBuilder()))
+
+    def createServer(self):
+        conn = self.connection()
+        server = api.Server(name='benchmark', imageId=2, flavorId=1)
+        return lambda: api.createServer(conn, server)
+
+    def deleteServer(self):
+        conn = self.connection()
+        return lambda: api.deleteServer(conn, 1)
+
+    def cachedServers(self):
+        self.account.getServers()
+        return self.account.getServers
+
+    def refreshServers(self):
+        self.account.getServers.wrapped.interval = 0
+        self.account.getServers()
+        return self.account.getServers
+
+    names = [
+        'getServers', 'getImages', 'getFlavors', 'parseServers',
+        'createServer', 'deleteServer', 'cachedServers', 'refreshServers',
+    ]
+
+def runScenario(name, opts, service):
+    call = getattr(Scenarios(opts, service), name)()
+    elapsed, latencies = timeCalls(call, opts.iterations, opts.threads)
+    latencies.sort()
+    return {
+        'calls': len(latencies),
+        'rate': len(latencies) / elapsed,
+        'p50': percentile(latencies, 0.5),
+        'p99': percentile(latencies, 0.99),
+        'peak': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }
+
+def isolated(func, *args):
+    """
+    Call <func> in a child process, returning its (picklable) result.
+    """
+    readEnd, writeEnd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(readEnd)
+        try:
+            try:
+                result = (True, func(*args))
+            except Exception, e:
+                result = (False, '%s: %s' % (e.__class__.__name__, e))
+            output = os.fdopen(writeEnd, 'w')
+            pickle.dump(result, output, pickle.HIGHEST_PROTOCOL)
+            output.close()
+        finally:
+            os._exit(0)
+    os.close(writeEnd)
+    input = os.fdopen(readEnd, 'r')
+    try:
+        succeeded, result = pickle.load(input)
+    finally:
+        input.close()
+        os.waitpid(pid, 0)
+    if not succeeded: raise RuntimeError(result)
+    return result
+
+def main(args):
+    parser = fakeapi.options()
+    parser.add_option('--iterations', type='int', default=200, help='calls per scenario')
+    parser.add_option('--threads', type='int', default=1, help='concurrent callers')
+    parser.add_option('--compact', action='store_true', help='use compact records')
+    parser.add_option('--memory', action='store_true', help='call the fake API in-process, without sockets')
+    opts, names = parser.parse_args(args)
+    names = names or Scenarios.names
+    for name in names:
+        if name not in Scenarios.names: parser.error('unknown scenario: ' + name)
+    if opts.compact: api.useCompactRecords()
+
+    rackspace.Authorization.poolSize = max(opts.threads, rackspace.Authorization.poolSize)
+    if opts.memory:
+        service = fakeapi.PayloadService(opts.servers, opts.images, opts.flavors, opts.delta)
+        service.baseURL = 'http://memory'
+        rackspace.Authorization.baseURL = service.baseURL + service.authPath
+        rackspace.Authorization.transport = transport.InMemoryTransport(service.handle)
+        serverPid = None
+        latency = 'in-process'
+    else:
+        server = fakeapi.serverFor(opts)
+        service = server.service
+        rackspace.Authorization.baseURL = server.authURL()
+        serverPid = server.fork()
+        latency = '%.3fs latency' % opts.latency
+    try:
+        baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        print '%d servers, %d images, %d flavors; %s; %d threads; parent process %.1f MB' % (
+            opts.servers, opts.images, opts.flavors, latency, opts.threads, baseline / 1024.0,
+        )
+        print '%-16s %8s %10s %10s %10s %10s' % ('scenario', 'calls', 'req/s', 'p50 ms', 'p99 ms', 'peak MB')
+        for name in names:
+            result = isolated(runScenario, name, opts, service)
+            print '%-16s %8d %10.1f %10.3f %10.3f %10.1f' % (
+                name, result['calls'], result['rate'],
+                result['p50'] * 1000, result['p99'] * 1000, result['peak'] / 1024.0,
+            )
+            sys.stdout.flush()
+    finally:
+        if serverPid:
+            os.kill(serverPid, signal.SIGTERM)
+            os.waitpid(serverPid, 0)
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
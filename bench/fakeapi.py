@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+
+##  Copyright (c) 2009-2010 Ethan Rowe (ethan@endpoint.com)
+##  For more information, see http://github.com/ethanrowe/thunderhead
+##
+##  This file is part of Thunderhead.
+##
+##  Thunderhead is free software: you can redistribute it and/or modify
+##  it under the terms of the GNU General Public License as published by
+##  the Free Software Foundation, either version 3 of the License, or
+##  (at your option) any later version.
+##
+##  Thunderhead is distributed in the hope that it will be useful,
+##  but WITHOUT ANY WARRANTY; without even the implied warranty of
+##  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##  GNU General Public License for more details.
+##
+
+"""
+A multi-threaded local stand-in for the Cloud Servers API, serving generated
+payloads of configurable size with configurable latency.  Used by bench/client.py;
+it can also be run on its own, printing its authentication URL:
+
+    python bench/fakeapi.py [--servers N] [--images N] [--flavors N] [--delta N]
+                            [--latency SECONDS] [--port PORT]
+
+The service answers authentication (GET /v1.0), the servers, images and flavors
+detail lists (a changes-since query gets the first --delta records instead of the
+full list), POST /servers and DELETE /servers/<id>, without keeping any state; see
+thunderhead.rackspace.fake for a stateful service.
+"""
+
+import sys, os.path, re, threading, optparse
+
+sys.path = [
+    os.path.abspath(
+        os.path.join( os.path.dirname(__file__), '..', 'lib')
+        ) ] + sys.path
+
+import thunderhead.rackspace.fake as fake
+
+def serverXML(i):
+    return (
+        '<server id="%d" name="server-%d" imageId="%d" flavorId="%d" status="ACTIVE" progress="100" hostId="%032x">'
+        '<metadata><meta key="Role">%s</meta></metadata>'
+        '<addresses><public><ip addr="67.23.%d.%d"/></public><private><ip addr="10.176.%d.%d"/></private></addresses>'
+        '</server>' % (
+            i, i, i % 20 + 1, i % 7 + 1, i * 2654435761 % (1 << 128), ('web', 'db', 'cache')[i % 3],
+            i / 256 % 256, i % 256, i / 256 % 256, i % 256,
+        )
+    )
+
+def imageXML(i):
+    return (
+        '<image id="%d" name="image-%d" updated="2010-10-10T12:00:00Z" created="2010-08-10T12:00:00Z" status="ACTIVE"/>' % (i, i)
+    )
+
+def flavorXML(i):
+    return '<flavor id="%d" name="%d MB Server" ram="%d" disk="%d"/>' % (i, 256 << i, 256 << i, 10 << i)
+
+def document(tag, items):
+    return ''.join(['<%s xmlns="http://docs.rackspacecloud.com/servers/api/v1.0">' % tag] + items + ['</%s>' % tag])
+
+xmlHeaders = {'Content-Type': 'application/xml'}
+
+class PayloadService(object):
+    """
+    Serves fixed detail lists of the given sizes; created servers get fresh ids but
+    are not remembered.
+    """
+    token = 'benchmark-token'
+    authPath = '/v1.0'
+    baseURL = 'http://localhost'
+
+    def __init__(self, servers=1000, images=100, flavors=8, delta=10):
+        self.documents = {}
+        for name, render, count in (
+                ('servers', serverXML, servers),
+                ('images', imageXML, images),
+                ('flavors', flavorXML, flavors)):
+            items = [render(i) for i in xrange(1, count + 1)]
+            self.documents[name] = document(name, items)
+            self.documents[name + '-delta'] = document(name, items[:delta])
+        self.nextId = servers + 1
+        self.lock = threading.Lock()
+        self.routes = [
+            ('GET', re.compile(r'^/v1\.0/?$'), self.authenticate),
+            ('GET', re.compile(r'^/server/(servers|images|flavors)/detail(\?changes-since=)?'), self.detail),
+            ('POST', re.compile(r'^/server/servers$'), self.createServer),
+            ('DELETE', re.compile(r'^/server/servers/(\d+)$'), self.deleteServer),
+        ]
+
+    def handle(self, method, path, headers, body):
+        for routeMethod, pattern, action in self.routes:
+            if method == routeMethod:
+                match = pattern.match(path)
+                if match: return action(headers, body, *match.groups())
+        return (404, {}, '')
+
+    def authenticate(self, headers, body):
+        return (204, {
+            'X-Auth-Token': self.token,
+            'X-Server-Management-URL': self.baseURL + '/server',
+            'X-Storage-URL': self.baseURL + '/storage',
+            'X-CDN-Management-URL': self.baseURL + '/cdn',
+        }, '')
+
+    def detail(self, headers, body, name, since):
+        if since: name += '-delta'
+        return (200, xmlHeaders, self.documents[name])
+
+    def createServer(self, headers, body):
+        self.lock.acquire()
+        try:
+            id = self.nextId
+            self.nextId += 1
+        finally:
+            self.lock.release()
+        return (202, xmlHeaders, serverXML(id).replace('status="ACTIVE" progress="100"', 'status="BUILD" progress="0"'))
+
+    def deleteServer(self, headers, body, id):
+        return (202, {}, '')
+
+class FakeAPIServer(fake.FakeHTTPServer):
+    def fork(self):
+        """
+        Serve from a child process, returning its pid.
+        """
+        pid = os.fork()
+        if pid == 0:
+            try:
+                self.serve_forever()
+            finally:
+                os._exit(0)
+        self.socket.close()
+        return pid
+
+def options(parser=None):
+    parser = parser or optparse.OptionParser()
+    parser.add_option('--servers', type='int', default=1000, help='servers in the detail list')
+    parser.add_option('--images', type='int', default=100, help='images in the detail list')
+    parser.add_option('--flavors', type='int', default=8, help='flavors in the detail list')
+    parser.add_option('--delta', type='int', default=10, help='records returned for changes-since')
+    parser.add_option('--latency', type='float', default=0, help='seconds added to each response')
+    return parser
+
+def serverFor(opts, port=0):
+    service = PayloadService(opts.servers, opts.images, opts.flavors, opts.delta)
+    return FakeAPIServer(service, opts.latency, port)
+
+def main(args):
+    parser = options()
+    parser.add_option('--port', type='int', default=8080)
+    opts, args = parser.parse_args(args)
+    server = serverFor(opts, opts.port)
+    print server.authURL()
+    server.serve_forever()
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
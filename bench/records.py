@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+
+##  Copyright (c) 2009-2010 Ethan Rowe (ethan@endpoint.com)
+##  For more information, see http://github.com/ethanrowe/thunderhead
+##
+##  This file is part of Thunderhead.
+##
+##  Thunderhead is free software: you can redistribute it and/or modify
+##  it under the terms of the GNU General Public License as published by
+##  the Free Software Foundation, either version 3 of the License, or
+##  (at your option) any later version.
+##
+##  Thunderhead is distributed in the hope that it will be useful,
+##  but WITHOUT ANY WARRANTY; without even the implied warranty of
+##  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##  GNU General Public License for more details.
+##
+##  You should have received a copy of the GNU General Public License
+##  along with Thunderhead.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Compares the memory taken by the standard (dictionary-backed) and compact (slotted)
+record representations for a large inventory.
+
+    python bench/records.py [count]
+"""
+
+import sys, os.path, gc
+
+sys.path = [
+    os.path.abspath(
+        os.path.join( os.path.dirname(__file__), '..', 'lib')
+        ) ] + sys.path
+
+import thunderhead.rackspace.api as api
+
+def deepSize(obj, seen=None):
+    if seen is None: seen = {}
+    if seen.has_key(id(obj)): return 0
+    seen[id(obj)] = 1
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        for key, value in obj.iteritems():
+            size += deepSize(key, seen) + deepSize(value, seen)
+    elif isinstance(obj, (list, tuple)):
+        for item in obj:
+            size += deepSize(item, seen)
+    else:
+        if hasattr(obj, '__dict__'):
+            size += deepSize(obj.__dict__, seen)
+        if hasattr(obj, '__slots__'):
+            for name in api.records.slotNames(obj.__class__):
+                if hasattr(obj, name): size += deepSize(getattr(obj, name), seen)
+    return size
+
+def inventory(count):
+    servers = dict([(i, api.recordTypes['server'](
+        id=i,
+        name='server-%d' % i,
+        status='ACTIVE',
+        hostId='host%d' % (i % 50),
+        imageId=2,
+        flavorId=1,
+        progress=100,
+        publicIPs=['67.23.%d.%d' % (i / 256 % 256, i % 256)],
+        privateIPs=['10.176.%d.%d' % (i / 256 % 256, i % 256)],
+    )) for i in xrange(count)])
+    images = dict([(i, api.records.build(api.recordTypes['image'], {
+        'id': i, 'name': 'image-%d' % i, 'status': 'ACTIVE', 'progress': 100,
+        'created': '2010-01-01T00:00:00Z', 'updated': '2010-01-01T00:00:00Z',
+    })) for i in xrange(count)])
+    return servers, images
+
+def measure(label, count):
+    gc.collect()
+    servers, images = inventory(count)
+    serverBytes = deepSize(servers)
+    imageBytes = deepSize(images)
+    print '%-10s servers: %10d bytes (%5d/record)   images: %10d bytes (%5d/record)' % (
+        label, serverBytes, serverBytes / count, imageBytes, imageBytes / count,
+    )
+    return serverBytes + imageBytes
+
+def main(count=20000):
+    standard = measure('standard', count)
+    api.useCompactRecords()
+    compact = measure('compact', count)
+    api.useCompactRecords(frozen=True)
+    measure('frozen', count)
+    api.useStandardRecords()
+    print 'compact records use %.0f%% of the standard size' % (100.0 * compact / standard)
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:2]])
@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+
+##  Copyright (c) 2009-2010 Ethan Rowe (ethan@endpoint.com)
+##  For more information, see http://github.com/ethanrowe/thunderhead
+##
+##  This file is part of Thunderhead.
+##
+##  Thunderhead is free software: you can redistribute it and/or modify
+##  it under the terms of the GNU General Public License as published by
+##  the Free Software Foundation, either version 3 of the License, or
+##  (at your option) any later version.
+##
+##  Thunderhead is distributed in the hope that it will be useful,
+##  but WITHOUT ANY WARRANTY; without even the implied warranty of
+##  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##  GNU General Public License for more details.
+##
+
+"""
+Soak-tests cached delta merging and bulk operations against a stateful fake of the
+servers API (thunderhead.rackspace.fake) holding a large inventory.
+
+    python bench/soak.py [--servers N] [--rounds N] [--churn N] [--bulk N]
+                         [--fault-rate P] [--latency SECONDS] [--compact]
+
+Each round changes --churn servers behind the client's back (renames, deletions,
+new builds), creates and deletes --bulk servers through the Account's bulk
+operations, then refreshes Account.getServers() from changes-since and checks the
+cached inventory against the service's.  Every API request fails with overLimit or
+serviceUnavailable at --fault-rate; retries are expected to absorb them.
+"""
+
+import sys, os.path, time, random, optparse
+
+sys.path = [
+    os.path.abspath(
+        os.path.join( os.path.dirname(__file__), '..', 'lib')
+        ) ] + sys.path
+
+import thunderhead
+import thunderhead.rackspace as rackspace
+import thunderhead.rackspace.api as api
+from thunderhead.rackspace.fake import FakeService, FakeHTTPServer
+
+def percentile(ordered, fraction):
+    if not ordered: return 0
+    return ordered[int(round(fraction * (len(ordered) - 1)))]
+
+def churn(service, count, rand):
+    ids = service.servers.keys()
+    for i in xrange(count):
+        action = rand.random()
+        if action < 0.4 and ids:
+            id = rand.choice(ids)
+            if service.servers.has_key(id): service.updateServer(id, name='renamed-%d-%d' % (id, i))
+        elif action < 0.7 and ids:
+            id = rand.choice(ids)
+            if service.servers.has_key(id): service.removeServer(id)
+        else:
+            service.addServer(None, 1, 1 + i % 7, {'Role': 'churn'})
+
+def mismatches(cached, service):
+    service.lock.acquire()
+    try:
+        expected = dict([(id, (server.name, server.status)) for id, server in service.servers.iteritems()])
+    finally:
+        service.lock.release()
+    actual = dict([(id, (server.name, server.status)) for id, server in cached.iteritems()])
+    return len([id for id in dict(expected, **actual) if expected.get(id) != actual.get(id)])
+
+def main(args):
+    parser = optparse.OptionParser()
+    parser.add_option('--servers', type='int', default=10000, help='servers to start with')
+    parser.add_option('--rounds', type='int', default=20)
+    parser.add_option('--churn', type='int', default=200, help='servers changed directly per round')
+    parser.add_option('--bulk', type='int', default=50, help='servers created and deleted in bulk per round')
+    parser.add_option('--fault-rate', dest='faultRate', type='float', default=0.02)
+    parser.add_option('--latency', type='float', default=0)
+    parser.add_option('--compact', action='store_true', help='use compact records')
+    opts, args = parser.parse_args(args)
+    if opts.compact: api.useCompactRecords()
+
+    rand = random.Random(1)
+    service = FakeService(seed=1)
+    service.buildTime = 2
+    service.retryAfter = 0
+    for i in xrange(opts.servers):
+        service.addServer(None, 1 + i % 4, 1 + i % 7, {'Role': ('web', 'db', 'cache')[i % 3]}, status='ACTIVE')
+    server = FakeHTTPServer(service, opts.latency).start()
+    rackspace.Authorization.baseURL = server.authURL()
+    account = thunderhead.Account(rackspace, 'soak', 'key')
+    account.session.retryPolicy.backoff = 0.01
+    account.session.retryPolicy.retries = 8
+    account.getServers.wrapped.interval = 0
+    for bulk in (account.createServers, account.deleteServers):
+        bulk.backoff = 0.01
+
+    # changes-since has one-second granularity: let the seeding fall behind the first
+    # fetch, or the first refresh would fetch it all again
+    time.sleep(1)
+    started = time.time()
+    account.getServers()
+    print 'initial fetch of %d servers: %.2fs' % (opts.servers, time.time() - started)
+    service.setFaultRate('overLimit', opts.faultRate / 2)
+    service.setFaultRate('serviceUnavailable', opts.faultRate / 2)
+
+    refreshTimes = []
+    failures = 0
+    errors = 0
+    for round in xrange(opts.rounds):
+        churn(service, opts.churn, rand)
+        template = api.Server(name='bulk', imageId=1, flavorId=1)
+        created = account.createServers([template] * opts.bulk)
+        ids = [result.result.id for result in created if result.succeeded()]
+        deleted = account.deleteServers(ids[:len(ids) / 2])
+        failures += len([r for r in created + deleted if not r.succeeded()])
+        began = time.time()
+        cached = account.getServers()
+        refreshTimes.append(time.time() - began)
+        wrong = mismatches(cached, service)
+        errors += wrong
+        print 'round %3d: %6d servers cached, %4d mismatched, %.3fs refresh' % (round + 1, len(cached), wrong, refreshTimes[-1])
+        sys.stdout.flush()
+
+    refreshTimes.sort()
+    policy = account.session.retryPolicy
+    print 'refresh p50 %.3fs, p99 %.3fs' % (percentile(refreshTimes, 0.5), percentile(refreshTimes, 0.99))
+    print 'requests %d, faults injected %s, retries %d, retries exhausted %d' % (
+        service.requestCount, service.faultCounts, policy.retryCount, policy.exhaustedCount,
+    )
+    print 'bulk failures %d (POSTs are not retried on serviceUnavailable), mismatches %d' % (failures, errors)
+    # close the client side first, so the server's connection threads see EOF
+    for pool in (account.session.serverManager, account.session.storage, account.session.cdn):
+        pool.close()
+    server.stop()
+    return errors and 1 or 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
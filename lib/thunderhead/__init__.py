@@ -16,7 +16,13 @@
 ##  You should have received a copy of the GNU General Public License
 ##  along with Thunderhead.  If not, see <http://www.gnu.org/licenses/>.
 
+import threading, time, Queue
+
 class Account(object):
+    # number of concurrent workers used by the provider's bulk operations
+    bulkWorkers = 4
+    _sessionLock = threading.Lock()
+
     def __init__(self, provider, *creds, **namedCreds):
         if creds: self.credentials = creds
         if namedCreds: self.namedCredentials = namedCreds
@@ -29,8 +35,19 @@ class Account(object):
             for item in interface:
                 info = (hasattr(item, 'has_key') and item) or {'name': item}
                 setattr(self, info['name'], self._getProviderFunction(**info))
+        bulk = getattr(provider.api, 'bulkInterface', None)
+        if bulk:
+            for info in bulk:
+                setattr(self, info['name'], self._getBulkFunction(**info))
         return self.provider
 
+    def _getBulkFunction(self, **kwargs):
+        return BulkOperation(
+            getattr(self, kwargs['function']),
+            self.bulkWorkers,
+            getattr(self.provider.api, 'throttleExceptions', None),
+        )
+
     def _getProviderFunction(self, **kwargs):
         wrap = True
         func = getattr(self.provider.api, kwargs['name'])
@@ -41,16 +58,35 @@ class Account(object):
                 wrap = False
         return (wrap and self._wrapMethod(func)) or func
 
+    def cacheStats(self):
+        """
+        Return the stats() of each of the provider functions that is wrapped in a
+        cache, as a dictionary by function name.
+        """
+        result = {}
+        for item in getattr(self.provider.api, 'serverManagementInterface', None) or ():
+            name = (hasattr(item, 'has_key') and item['name']) or item
+            cache = getattr(getattr(self, name, None), 'wrapped', None)
+            if hasattr(cache, 'stats'): result[name] = cache.stats()
+        return result
+
     def _wrapMethod(self, func):
         def wrappedFunc(*args, **kwargs):
             return func(self.session.serverManager, *args, **kwargs)
+        # leave the wrapped function (a cache wrapper, perhaps) reachable for configuration
+        wrappedFunc.wrapped = func
         return wrappedFunc
 
     def _getSession(self):
         if not hasattr(self, '_session'):
-            args = (getattr(self, 'credentials', None) or [])
-            kwargs = (getattr(self, 'namedCredentials', None) or {})
-            self._session = self.provider.Authorization(*args, **kwargs)
+            self._sessionLock.acquire()
+            try:
+                if not hasattr(self, '_session'):
+                    args = (getattr(self, 'credentials', None) or [])
+                    kwargs = (getattr(self, 'namedCredentials', None) or {})
+                    self._session = self.provider.Authorization(*args, **kwargs)
+            finally:
+                self._sessionLock.release()
         return self._session
 
     session = property(
@@ -60,6 +96,126 @@ class Account(object):
         None,
     )
 
+class BulkResult(object):
+    """
+    Outcome of one item within a BulkOperation: the input item, and either the
+    result of the operation or the exception it raised.
+    """
+    def __init__(self, item, result=None, exception=None):
+        self.item = item
+        self.result = result
+        self.exception = exception
+
+    def succeeded(self):
+        return self.exception is None
+
+class BulkOperation(object):
+    """
+    NAME
+        BulkOperation
+
+    DESCRIPTION
+        Wraps a single-item function so it can be applied to a list of items
+        concurrently, on a bounded pool of worker threads.
+
+        Calling the wrapper with a list of items (plus any additional arguments to
+        pass along to each call) returns a list of BulkResult objects, in the same
+        order as the input items.  A failure on one item does not affect the others;
+        the exception is recorded in that item's result.
+
+        Exceptions in throttleExceptions (the provider's rate-limit faults) are
+        treated specially: all workers pause, the offending item is retried, and
+        only after the retry limit is exhausted is the exception recorded.  The pause
+        honors the exception's retryDelay() hint where available, and otherwise
+        backs off exponentially from the backoff setting.  An exception that has
+        already been retried to exhaustion beneath (one with a true retriesExhausted
+        attribute, as the rackspace RetryPolicy marks them) is recorded at once, so
+        that the two layers' retries do not multiply.
+    """
+    workers = 4
+    retries = 5
+    backoff = 1.0
+    maxBackoff = 60.0
+    throttleExceptions = ()
+
+    def __init__(self, func, workers=None, throttleExceptions=None):
+        self.function = func
+        if workers: self.workers = workers
+        if throttleExceptions: self.throttleExceptions = tuple(throttleExceptions)
+
+    def delayFor(self, exception, attempt):
+        delay = None
+        if hasattr(exception, 'retryDelay'): delay = exception.retryDelay()
+        if delay is None: delay = self.backoff * (2 ** attempt)
+        return min(delay, self.maxBackoff)
+
+    def __call__(self, items, *args, **kwargs):
+        items = list(items)
+        results = [None] * len(items)
+        work = Queue.Queue()
+        for index in range(len(items)):
+            work.put((index, 0))
+        # time before which no worker may issue a call, pushed forward by throttling
+        state = {'resumeAt': 0}
+        lock = threading.Lock()
+
+        def pause(delay):
+            lock.acquire()
+            try:
+                state['resumeAt'] = max(state['resumeAt'], time.time() + delay)
+            finally:
+                lock.release()
+
+        def worker():
+            while True:
+                try:
+                    index, attempt = work.get_nowait()
+                except Queue.Empty:
+                    return
+                wait = state['resumeAt'] - time.time()
+                while wait > 0:
+                    time.sleep(wait)
+                    wait = state['resumeAt'] - time.time()
+                try:
+                    results[index] = BulkResult(items[index], self.function(items[index], *args, **kwargs))
+                except self.throttleExceptions, e:
+                    if attempt < self.retries and not getattr(e, 'retriesExhausted', False):
+                        pause(self.delayFor(e, attempt))
+                        work.put((index, attempt + 1))
+                    else:
+                        results[index] = BulkResult(items[index], exception=e)
+                except Exception, e:
+                    results[index] = BulkResult(items[index], exception=e)
+
+        threads = [threading.Thread(target=worker) for i in range(min(self.workers, len(items)))]
+        for thread in threads:
+            thread.setDaemon(True)
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+class FilteredIterator(object):
+    """
+    Iterates over the items from <source> for which <predicate> is true.  Unlike
+    itertools.ifilter, close() is passed through to the source, so a streaming
+    source can release its resources when the iteration is abandoned early.
+    """
+    def __init__(self, source, predicate):
+        self.source = iter(source)
+        self.predicate = predicate
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        while True:
+            item = self.source.next()
+            if self.predicate(item): return item
+
+    def close(self):
+        if hasattr(self.source, 'close'): self.source.close()
+
 class CachedResource(object):
     """
     NAME
@@ -91,19 +247,82 @@ class CachedResource(object):
         provided to the initial invocation.  This allows for strategies such as the asset
         maintaining a full set of data, maintained by initialize/update, with representation
         returning a subset of the asset data by appying filters based on the arguments.
+
+        Concurrent calls are coalesced: while one thread is in initialize or update,
+        other callers wait for it to finish and then share its result rather than
+        running initialize/update themselves, so an expired cache costs a single
+        upstream request however many threads notice.  (Concurrent callers are thus
+        assumed to be asking for the same thing.)  If initialization fails, a waiting
+        caller takes its turn at it.  callCount counts calls, and coalescedCount
+        those that waited on another's initialize/update instead of running their own;
+        stats() returns these (and whatever else a subclass counts) as a dictionary.
+
+        Once initialized, a call for which answerFromCache returns True skips update
+        and the coalescing above entirely, taking no lock.  By default it returns
+        False, so that every call goes through update; a subclass that can tell
+        cheaply when no update is due should override it.  (Counters bumped on that
+        path are not locked, so may undercount slightly under heavy concurrency.)
     """
     initialized = False
     asset = None
+    inFlight = False
+    callCount = 0
+    coalescedCount = 0
+    _conditionLock = threading.Lock()
 
     def representation(self, *args, **kwargs):
         return self.asset
 
+    def answerFromCache(self, *args, **kwargs):
+        return False
+
+    def stats(self):
+        return {'calls': self.callCount, 'coalesced': self.coalescedCount}
+
+    def _getCondition(self):
+        condition = self.__dict__.get('_condition')
+        if condition is None:
+            self._conditionLock.acquire()
+            try:
+                condition = self.__dict__.get('_condition')
+                if condition is None:
+                    condition = self._condition = threading.Condition(threading.Lock())
+            finally:
+                self._conditionLock.release()
+        return condition
+
     def __call__(self, *args, **kwargs):
-        if not self.initialized:
-            self.initialize(*args, **kwargs)
-            self.initialized = True
-        else:
-            self.update(*args, **kwargs)
+        if self.initialized and self.answerFromCache(*args, **kwargs):
+            self.callCount += 1
+            return self.representation(*args, **kwargs)
+        condition = self._getCondition()
+        condition.acquire()
+        try:
+            self.callCount += 1
+            if self.inFlight:
+                self.coalescedCount += 1
+                while self.inFlight:
+                    condition.wait()
+                lead = not self.initialized
+            else:
+                lead = True
+            if lead: self.inFlight = True
+        finally:
+            condition.release()
+        if lead:
+            try:
+                if not self.initialized:
+                    self.initialize(*args, **kwargs)
+                    self.initialized = True
+                else:
+                    self.update(*args, **kwargs)
+            finally:
+                condition.acquire()
+                try:
+                    self.inFlight = False
+                    condition.notifyAll()
+                finally:
+                    condition.release()
         return self.representation(*args, **kwargs)
 
 class Role(object):
@@ -137,6 +356,10 @@ IMPLEMENTING ROLES
     input, can modify that server object in arbitrary ways.  The result of this method
     will be the result of the Server() call on the role class.
 
+    6. Optionally, define the "memberJoined" and "memberLeft" methods, which getServers()
+    calls with each server that has become, or ceased to be, a member since the last
+    call (the first call finds every member joining).
+
     For now, things should be set at the class level.
 
 METHODS
@@ -144,6 +367,15 @@ METHODS
 
     getServers(): return the dictionary of servers implementing this role.
 
+    The role remembers its members between getServers() calls.  When the account's
+    server set can say which servers changed since the last call (as the cached
+    rackspace getServers can; see recordset.RecordSet), only those are passed through
+    isMember() again, so polling a role costs in proportion to the changes rather than
+    the fleet.  Otherwise every server is checked.
+
+    iterServers(): iterate lazily over the servers implementing this role, as they are
+    retrieved from account.iterServers(), without holding the full server set.
+
     createServer(server): convenience function to pass through the server object <server>
     to account.createServer().
 
@@ -151,6 +383,7 @@ METHODS
 
     serverDefaults = {}
     account = None
+    membershipLock = threading.RLock()
     @classmethod
     def serverInit(self, server): return server
     
@@ -162,7 +395,56 @@ METHODS
     @classmethod
     def getServers(self, *args, **kwargs):
         servers = self.account.getServers(*args, **kwargs)
-        return dict([(id, s) for id, s in servers.iteritems() if self.isMember(s)])
+        self.membershipLock.acquire()
+        try:
+            return dict(self.updateMembership(servers))
+        finally:
+            self.membershipLock.release()
+
+    @classmethod
+    def updateMembership(self, servers):
+        # state belongs to this class alone; a subclass's isMember may differ
+        state = self.__dict__.get('membership')
+        if state and state['servers'] is servers: return state['members']
+        changeLog = getattr(servers, 'changeLog', None)
+        changed = None
+        if state:
+            members = state['members']
+            if changeLog is not None and state['changeLog'] is changeLog:
+                changed = changeLog.changedSince(state['version'], servers.version)
+        else:
+            members = {}
+        if changed is None:
+            changed = set(servers.keys())
+            changed.update(members.keys())
+        joined = []
+        left = []
+        for id in changed:
+            server = servers.get(id)
+            if server is not None and self.isMember(server):
+                if not members.has_key(id): joined.append(server)
+                members[id] = server
+            elif members.has_key(id):
+                left.append(members.pop(id))
+        self.membership = {
+            'servers': servers,
+            'members': members,
+            'changeLog': changeLog,
+            'version': getattr(servers, 'version', None),
+        }
+        for server in joined: self.memberJoined(server)
+        for server in left: self.memberLeft(server)
+        return members
+
+    @classmethod
+    def memberJoined(self, server): pass
+
+    @classmethod
+    def memberLeft(self, server): pass
+
+    @classmethod
+    def iterServers(self, *args, **kwargs):
+        return FilteredIterator(self.account.iterServers(*args, **kwargs), self.isMember)
 
     @classmethod
     def isMember(self, server): return False
@@ -0,0 +1,121 @@
+##  Copyright (c) 2009-2010 Ethan Rowe (ethan@endpoint.com)
+##  For more information, see http://github.com/ethanrowe/thunderhead
+##
+##  This file is part of Thunderhead.
+##
+##  Thunderhead is free software: you can redistribute it and/or modify
+##  it under the terms of the GNU General Public License as published by
+##  the Free Software Foundation, either version 3 of the License, or
+##  (at your option) any later version.
+##
+##  Thunderhead is distributed in the hope that it will be useful,
+##  but WITHOUT ANY WARRANTY; without even the implied warranty of
+##  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##  GNU General Public License for more details.
+##
+##  You should have received a copy of the GNU General Public License
+##  along with Thunderhead.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+NAME
+    thunderhead.clock
+
+DESCRIPTION
+    Clocks for cache freshness checks.  A clock provides two readings:
+    * monotonic(): seconds since an arbitrary point, never going backwards; used to
+      measure refresh intervals, unaffected by adjustments to the system clock
+    * wallTime(): whole seconds since the epoch; used for values sent to the service,
+      such as changes-since
+
+    systemClock is the default wherever a clock is pluggable.  ManualClock is driven
+    by hand, for tests and simulations.
+"""
+
+import sys, time, threading
+
+def monotonicSource():
+    """
+    Return a function reading CLOCK_MONOTONIC through clock_gettime(), or None where
+    that isn't available (anything but Linux, or no ctypes).
+    """
+    if not sys.platform.startswith('linux'): return None
+    try:
+        import ctypes, ctypes.util
+    except ImportError:
+        return None
+
+    class timespec(ctypes.Structure):
+        _fields_ = [('tv_sec', ctypes.c_long), ('tv_nsec', ctypes.c_long)]
+
+    CLOCK_MONOTONIC = 1
+    try:
+        library = ctypes.CDLL(ctypes.util.find_library('rt') or ctypes.util.find_library('c'))
+        clock_gettime = library.clock_gettime
+    except (OSError, AttributeError):
+        return None
+    # no argtypes: checking them costs more than the call itself, and byref() of a
+    # fresh timespec is all that is ever passed
+    byref = ctypes.byref
+
+    def monotonic():
+        # a timespec per call, so that threads need not share (and lock) one
+        spec = timespec()
+        if clock_gettime(CLOCK_MONOTONIC, byref(spec)) != 0:
+            raise OSError('clock_gettime failed')
+        return spec.tv_sec + spec.tv_nsec * 1e-9
+    try:
+        monotonic()
+    except OSError:
+        return None
+    return monotonic
+
+class SystemClock(object):
+    """
+    The system clocks.  Where no monotonic source is available, monotonic() falls
+    back to time.time() with any backward step absorbed into an offset.
+    """
+    def __init__(self):
+        self.source = monotonicSource()
+        self.last = 0
+        self.offset = 0
+        self.lock = threading.Lock()
+        # read the source directly, without the fallback's method call in between
+        if self.source: self.monotonic = self.source
+
+    def monotonic(self):
+        if self.source: return self.source()
+        self.lock.acquire()
+        try:
+            now = time.time() + self.offset
+            if now < self.last:
+                self.offset += self.last - now
+                now = self.last
+            self.last = now
+            return now
+        finally:
+            self.lock.release()
+
+    def wallTime(self):
+        return int(time.time())
+
+class ManualClock(object):
+    """
+    A clock that moves only when told to: advance() moves both readings forward,
+    while setting "wall" directly simulates a jump in the system clock.
+    """
+    def __init__(self, monotonic=0, wall=None):
+        self.now = monotonic
+        if wall is None: wall = int(time.time())
+        self.wall = wall
+
+    def monotonic(self):
+        return self.now
+
+    def wallTime(self):
+        return int(self.wall)
+
+    def advance(self, seconds):
+        self.now += seconds
+        self.wall += seconds
+
+systemClock = SystemClock()
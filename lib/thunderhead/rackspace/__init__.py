@@ -16,13 +16,21 @@
 ##  You should have received a copy of the GNU General Public License
 ##  along with Thunderhead.  If not, see <http://www.gnu.org/licenses/>.
 
-import httplib
+import socket, threading, time, random
 from urlparse import urlparse
 # Change to relative import syntax when we can safely deprecate Python 2.4 support
 import thunderhead.rackspace.exceptions
+import thunderhead.rackspace.stream
 import thunderhead.rackspace.api
+import thunderhead.rackspace.ratelimit
+import thunderhead.rackspace.transport
+import thunderhead.rackspace.metrics
 import xml.dom.minidom as minidom
 import sys
+try:
+    from hashlib import sha1
+except ImportError:
+    from sha import new as sha1
 
 if sys.version_info[0:2] < (2, 5):
     class ParseResult(object):
@@ -38,23 +46,65 @@ if sys.version_info[0:2] < (2, 5):
     def urlparse(*args):
         return ParseResult(nativeUrlparse(*args))
 
+# methods whose requests may safely be sent twice
+idempotentMethods = ('GET', 'HEAD', 'PUT', 'DELETE', 'OPTIONS')
+
 class BoundConnection(object):
+    """
+    NAME
+        BoundConnection
+
+    DESCRIPTION
+        An HTTP/1.1 connection bound to a particular service URL and set of headers
+        (typically the authorization token).
+
+        The underlying connection is kept alive between requests.  Each response is
+        read in full before the next request goes out, and an idle connection that
+        the server has since dropped is reopened (at most once per request) so that
+        callers never see the stale socket.  A request that fails after it was sent
+        is only sent again if its method is idempotent, since the server may have
+        acted on it.
+
+        Faults are retried according to retryPolicy (see RetryPolicy), if one is set.
+        Requests (retries included) are paced by rateLimiter (see
+        ratelimit.RateLimiter), if one is set.
+
+        Connections come from "transport" (see thunderhead.rackspace.transport),
+        httplib by default.
+
+        Each request (each attempt, with retries) is reported to the "observers" as a
+        metrics.RequestTiming, broken down by phase; see thunderhead.rackspace.metrics.
 
-    def __init__(self, url, headers):
+        The api functions build their results from recordTypes (e.g.
+        api.compactRecordTypes), if set, or else the process-wide api.recordTypes.
+
+        Counters:
+        * requestCount: requests that received a response
+        * reuseCount: requests that went out over an already-open connection
+        * reconnectCount: times a stale connection was discarded and reopened
+    """
+    retryPolicy = None
+    rateLimiter = None
+    transport = transport.defaultTransport
+    observers = ()
+    recordTypes = None
+    # whether the request in progress was written out in full
+    requestSent = False
+    # the RequestTiming of the request in progress, if any observers are set
+    timing = None
+
+    def __init__(self, url, headers, transport=None):
         request = urlparse(url)
         self.scheme = request.scheme
         self.host = request.hostname
         self.port = request.port
         self.pathPrefix = request.path
         self.headers = headers
-        self.connection = self.getConnection(request)
-
-    @classmethod
-    def getConnection(self, request):
-        klass = ((request.scheme == 'https' and httplib.HTTPSConnection) or httplib.HTTPConnection)
-        args = [request.hostname]
-        if request.port: args.append(request.port)
-        return klass(*args)
+        if transport is not None: self.transport = transport
+        self.connection = self.transport.connect(self.scheme, self.host, self.port)
+        self.requestCount = 0
+        self.reuseCount = 0
+        self.reconnectCount = 0
 
     def mergeHeaders(self, headers={}):
         return dict(dict(self.standardHeaders, **self.headers), **headers)
@@ -64,30 +114,172 @@ class BoundConnection(object):
         }
 
     def request(self, method, url, body=None, headers={}):
+        return withRetries(self.retryPolicy, method, self.requestOnce, method, url, body, headers)
+
+    def requestOnce(self, method, url, body=None, headers={}):
+        if self.rateLimiter: self.rateLimiter.acquire(method, url)
+        mergedHeaders = self.mergeHeaders(headers)
+        if body:
+            body = self.serializeBody(body)
+            mergedHeaders['Content-Type'] = 'application/xml'
+        self.startTiming(method, url, body)
+        try:
+            result = self.handleResponse(self.getResponse(method, self.pathPrefix + url, body, mergedHeaders))
+        except Exception, e:
+            self.finishTiming(e)
+            raise
+        self.finishTiming()
+        return result
+
+    def requestStream(self, method, url, builder, body=None, headers={}):
+        """
+        Issue a request whose XML response is parsed incrementally, returning a
+        stream.RecordStream of the records produced by <builder>.  Faults are raised
+        immediately, as with request(); a response with no XML body yields no records.
+        """
+        return withRetries(self.retryPolicy, method, self.requestStreamOnce, method, url, builder, body, headers)
+
+    def requestStreamOnce(self, method, url, builder, body=None, headers={}):
+        if self.rateLimiter: self.rateLimiter.acquire(method, url)
         mergedHeaders = self.mergeHeaders(headers)
         if body:
-            body = body.toxml()
+            body = self.serializeBody(body)
             mergedHeaders['Content-Type'] = 'application/xml'
-        # stateful connections are tricky to manage, so for the time being,
-        # do the rather blunt close/reopen strategy here; improve later.
+        timing = self.startTiming(method, url, body)
+        try:
+            resp = self.getResponse(method, self.pathPrefix + url, body, mergedHeaders)
+            if resp.status >= 400 or resp.getheader('content-type', '') != 'application/xml':
+                self.handleResponse(resp)
+                resp = None
+        except Exception, e:
+            self.finishTiming(e)
+            raise
+        records = stream.RecordStream(resp, builder, self.releaseStream)
+        if timing is not None:
+            # the stream reads and parses the body, and finishes the timing with it
+            self.timing = None
+            records.instrument(timing, self.observers)
+        return records
+
+    def startTiming(self, method, url, body):
+        self.timing = None
+        if self.observers: self.timing = metrics.RequestTiming(method, url, len(body or ''))
+        return self.timing
+
+    def finishTiming(self, exception=None):
+        timing = self.timing
+        if timing is None: return
+        self.timing = None
+        metrics.requestFinished(self.observers, timing, exception)
+
+    def serializeBody(self, body):
+        """
+        Request bodies may be DOM nodes or XML already serialized to a string (see the
+        toXMLString() methods of the api classes); either way, UTF-8 encoded bytes result.
+        """
+        if not isinstance(body, basestring): body = body.toxml()
+        if isinstance(body, unicode): body = body.encode('utf-8')
+        return body
+
+    def releaseStream(self, reusable):
+        if not reusable: self.close()
+
+    def isConnected(self):
+        return self.transport.isConnected(self.connection)
+
+    def connectionDropped(self):
+        return self.transport.connectionDropped(self.connection)
+
+    def getResponse(self, method, path, body, headers):
+        reused = self.isConnected()
+        if reused and self.connectionDropped():
+            self.reconnect()
+            reused = False
+        self.requestSent = False
+        try:
+            response = self.sendRequest(method, path, body, headers)
+        except self.transport.staleConnectionErrors, e:
+            # only a reused connection gets a second chance, and never after a timeout,
+            # nor after a non-idempotent request went out, since the server may well
+            # have received (and acted upon) the request.
+            if not reused or isinstance(e, socket.timeout) or (
+                self.requestSent and method.upper() not in idempotentMethods
+            ):
+                self.close()
+                raise
+            self.reconnect()
+            reused = False
+            try:
+                response = self.sendRequest(method, path, body, headers)
+            except self.transport.staleConnectionErrors:
+                self.close()
+                raise
+        self.requestCount += 1
+        if reused: self.reuseCount += 1
+        if self.timing is not None: self.timing.reused = reused
+        return response
+
+    def sendRequest(self, method, path, body, headers):
+        timing = self.timing
+        if timing is None:
+            self.connection.request(method, path, body, headers)
+            self.requestSent = True
+            return self.connection.getresponse()
+        if not self.isConnected():
+            started = metrics.timer()
+            self.connection.connect()
+            timing.add('connect', metrics.timer() - started)
+        started = metrics.timer()
+        self.connection.request(method, path, body, headers)
+        self.requestSent = True
+        sent = metrics.timer()
+        timing.add('send', sent - started)
+        response = self.connection.getresponse()
+        timing.add('wait', metrics.timer() - sent)
+        timing.status = response.status
+        return response
+
+    def reconnect(self):
+        self.reconnectCount += 1
+        self.close()
+
+    def close(self):
         self.connection.close()
-        self.connection.connect()
-        self.connection.request(method, self.pathPrefix + url, body, mergedHeaders)
-        return self.handleResponse()
-
-    def handleResponse(self):
-        resp = self.connection.getresponse()
-        code = resp.status
-        length = int(resp.getheader('content-length', 0))
+
+    def cacheKey(self):
+        # the service URL identifies the account; see api.KeyedCachedResource
+        return (self.scheme, self.host, self.port, self.pathPrefix)
+
+    def handleResponse(self, resp=None):
+        if resp is None: resp = self.connection.getresponse()
+        timing = self.timing
+        if timing is not None: started = metrics.timer()
+        # always drain the response, so the connection is ready for the next request
+        data = resp.read()
+        if timing is not None:
+            read = metrics.timer()
+            timing.add('read', read - started)
+            timing.responseBytes += len(data)
+        try:
+            try:
+                return self.parseResponse(resp.status, resp.getheader('content-type', ''), data)
+            except exceptions.RackspaceException, e:
+                if e.retryAfter is None: e.retryAfter = resp.getheader('retry-after')
+                raise
+        finally:
+            if timing is not None: timing.add('parse', metrics.timer() - read)
+
+    def parseResponse(self, code, contentType, data):
         body = None
-        if length and resp.getheader('content-type', '') == 'application/xml':
-            body = minidom.parseString(resp.read(length)).documentElement
+        if data and contentType == 'application/xml':
+            body = minidom.parseString(data).documentElement
         if code >= 400: self.handleFault(code, body)
         return (body, code)
 
     def handleFault(self, code, xml):
         type = ((xml and xml.nodeName) or '')
         args = []
+        attributes = {}
         if type:
             notes = dict([
                 (n.nodeName, n.firstChild.data) for n in xml.childNodes if n.nodeName in ('message', 'details')
@@ -95,26 +287,453 @@ class BoundConnection(object):
             args.append( (notes.has_key('message') and notes['message']) or None )
             args.append(code)
             if notes.has_key('details'): args.append(notes['details'])
+            if xml.hasAttribute('retryAfter'): attributes['retryAfter'] = xml.getAttribute('retryAfter')
         else:
             args.extend([None, code])
-        exceptions.throw(type, *args)
+        exceptions.throw(type, *args, **attributes)
+
+
+class RetryPolicy(object):
+    """
+    NAME
+        RetryPolicy
+
+    DESCRIPTION
+        Retries requests that fail with a transient fault.
+
+        Only faults in "faults" (by default overLimit and serviceUnavailable) are
+        retried, and only for the idempotent methods in "methods", at most "retries"
+        times per request.  The delay before each retry honors the fault's retryAfter
+        attribute or Retry-After header (see RackspaceException.retryDelay), stretched
+        by up to "jitter" of itself; a hint longer than maxDelay is not waited out, the
+        fault being raised instead.  Without a hint, the delay backs off exponentially
+        from "backoff" seconds, capped at maxDelay, and is shortened by up to "jitter"
+        of itself so that clients throttled together don't retry together.
+
+        Each retry is announced to the "observers" (retryScheduled(); see
+        thunderhead.rackspace.metrics) before the delay.
+
+        A retryable fault raised anyway, retries or patience exhausted, is marked with
+        a true "retriesExhausted" attribute, which tells callers with retries of their
+        own (thunderhead.BulkOperation) not to multiply them.
+
+        Counters (safe to read from any thread):
+        * retryCount: retries performed
+        * faultCounts: retries performed, by fault name
+        * exhaustedCount: retryable faults raised anyway, retries or patience exhausted
+    """
+    retries = 3
+    backoff = 1.0
+    maxDelay = 30.0
+    jitter = 0.5
+    faults = (exceptions.OverLimitException, exceptions.ServiceUnavailableException)
+    methods = idempotentMethods
+    sleep = time.sleep
+    randomFraction = random.random
+    observers = ()
+
+    def __init__(self, retries=None, faults=None, methods=None):
+        if retries is not None: self.retries = retries
+        if faults is not None: self.faults = tuple(faults)
+        if methods is not None: self.methods = tuple(methods)
+        self.lock = threading.Lock()
+        self.retryCount = 0
+        self.faultCounts = {}
+        self.exhaustedCount = 0
+
+    def retryable(self, method, exception):
+        return method.upper() in self.methods and isinstance(exception, self.faults)
+
+    def delayFor(self, exception, attempt):
+        hint = exception.retryDelay()
+        if hint is not None:
+            if hint > self.maxDelay: return None
+            return hint * (1 + self.jitter * self.randomFraction())
+        delay = min(self.backoff * (2 ** attempt), self.maxDelay)
+        return delay * (1 - self.jitter * self.randomFraction())
+
+    def run(self, method, call, *args, **kwargs):
+        attempt = 0
+        while True:
+            try:
+                return call(*args, **kwargs)
+            except exceptions.RackspaceException, e:
+                if not self.retryable(method, e): raise
+                delay = None
+                if attempt < self.retries: delay = self.delayFor(e, attempt)
+                self.lock.acquire()
+                try:
+                    if delay is None:
+                        self.exhaustedCount += 1
+                        e.retriesExhausted = True
+                    else:
+                        self.retryCount += 1
+                        fault = getattr(e, 'fault', e.__class__.__name__)
+                        self.faultCounts[fault] = self.faultCounts.get(fault, 0) + 1
+                finally:
+                    self.lock.release()
+                if delay is None: raise
+                metrics.notify(self.observers, 'retryScheduled', method, e, attempt, delay)
+            self.sleep(delay)
+            attempt += 1
 
+def withRetries(policy, method, call, *args, **kwargs):
+    if policy is None: return call(*args, **kwargs)
+    return policy.run(method, call, *args, **kwargs)
+
+class ConnectionPool(object):
+    """
+    NAME
+        ConnectionPool
+
+    DESCRIPTION
+        A bounded, thread-safe pool of BoundConnection objects for a single service URL.
+
+        The pool presents the same request() interface as BoundConnection, so it can
+        stand in for one anywhere (e.g. as the connection passed to the api functions).
+        Each request checks a connection out, uses it exclusively, and checks it back in;
+        any number of threads may share the pool.
+
+        Settings (class-level defaults, overridable per instance):
+        * size: maximum number of connections open at once
+        * idleTimeout: seconds an unused connection is kept before being closed
+        * checkoutTimeout: seconds to wait for a free connection before raising
+          PoolTimeoutException; None waits indefinitely
+        * retryPolicy: a RetryPolicy for faulted requests, or None; connections are
+          returned to the pool while waiting to retry
+        * rateLimiter: a ratelimit.RateLimiter pacing requests, or None; requests wait
+          for the limiter before checking out a connection
+        * reauthorize: a function called with the X-Auth-Token header's value when a
+          request raises UnauthorizedException; once it returns (having updated the
+          headers), the request is replayed, once.  None lets the fault through.
+        * transport: the transport for new connections (see
+          thunderhead.rackspace.transport), or None for connectionClass's default
+        * observers: metrics observers, given to each new connection (see
+          thunderhead.rackspace.metrics)
+        * recordTypes: the record types the api functions build results from when
+          given the pool, or None for api.recordTypes (see BoundConnection)
+
+        Counters:
+        * createdCount: connections opened by the pool
+        * expiredCount: idle connections closed for exceeding idleTimeout
+        * waitCount: checkouts that had to wait for a connection to be returned
+    """
+    connectionClass = BoundConnection
+    size = 4
+    idleTimeout = 60
+    checkoutTimeout = None
+    retryPolicy = None
+    rateLimiter = None
+    reauthorize = None
+    transport = None
+    observers = ()
+    recordTypes = None
+
+    def __init__(self, url, headers, size=None, idleTimeout=None, checkoutTimeout=None, retryPolicy=None, rateLimiter=None, transport=None):
+        request = urlparse(url)
+        self.url = url
+        self.scheme = request.scheme
+        self.host = request.hostname
+        self.port = request.port
+        self.pathPrefix = request.path
+        self.headers = headers
+        if size is not None: self.size = size
+        if idleTimeout is not None: self.idleTimeout = idleTimeout
+        if checkoutTimeout is not None: self.checkoutTimeout = checkoutTimeout
+        if retryPolicy is not None: self.retryPolicy = retryPolicy
+        if rateLimiter is not None: self.rateLimiter = rateLimiter
+        if transport is not None: self.transport = transport
+        # idle connections as (connection, released-at) pairs, oldest first
+        self.idle = []
+        self.open = 0
+        self.condition = threading.Condition()
+        self.createdCount = 0
+        self.expiredCount = 0
+        self.waitCount = 0
+
+    def newConnection(self):
+        self.createdCount += 1
+        if self.transport is None:
+            connection = self.connectionClass(self.url, self.headers)
+        else:
+            connection = self.connectionClass(self.url, self.headers, self.transport)
+        connection.observers = self.observers
+        return connection
+
+    def expireIdle(self, now):
+        while self.idle and self.idle[0][1] + self.idleTimeout <= now:
+            connection, released = self.idle.pop(0)
+            connection.close()
+            self.open -= 1
+            self.expiredCount += 1
+
+    def checkout(self):
+        deadline = None
+        if self.checkoutTimeout is not None: deadline = time.time() + self.checkoutTimeout
+        waited = False
+        self.condition.acquire()
+        try:
+            while True:
+                now = time.time()
+                self.expireIdle(now)
+                if self.idle:
+                    # most recently used first, so the warmest connections stay busy
+                    return self.idle.pop()[0]
+                if self.open < self.size:
+                    self.open += 1
+                    return self.newConnection()
+                if not waited:
+                    self.waitCount += 1
+                    waited = True
+                if deadline is None:
+                    self.condition.wait()
+                else:
+                    if now >= deadline:
+                        raise exceptions.PoolTimeoutException(
+                            'No connection available for ' + self.url + ' within ' + str(self.checkoutTimeout) + ' seconds'
+                        )
+                    self.condition.wait(deadline - now)
+        finally:
+            self.condition.release()
+
+    def checkin(self, connection):
+        self.condition.acquire()
+        try:
+            self.idle.append((connection, time.time()))
+            self.condition.notify()
+        finally:
+            self.condition.release()
+
+    def discard(self, connection):
+        connection.close()
+        self.condition.acquire()
+        try:
+            self.open -= 1
+            self.condition.notify()
+        finally:
+            self.condition.release()
+
+    def request(self, method, *args, **kwargs):
+        return self.replaying(withRetries, self.retryPolicy, method, self.requestOnce, method, *args, **kwargs)
+
+    def requestOnce(self, method, url, *args, **kwargs):
+        if self.rateLimiter: self.rateLimiter.acquire(method, url)
+        connection = self.checkout()
+        try:
+            result = connection.request(method, url, *args, **kwargs)
+        except exceptions.RackspaceException:
+            # a fault response leaves the connection drained and reusable
+            self.checkin(connection)
+            raise
+        except:
+            self.discard(connection)
+            raise
+        self.checkin(connection)
+        return result
+
+    def requestStream(self, method, *args, **kwargs):
+        return self.replaying(withRetries, self.retryPolicy, method, self.requestStreamOnce, method, *args, **kwargs)
+
+    def replaying(self, call, *args, **kwargs):
+        token = self.headers.get('X-Auth-Token')
+        try:
+            return call(*args, **kwargs)
+        except exceptions.UnauthorizedException:
+            if not self.reauthorize: raise
+        self.reauthorize(token)
+        return call(*args, **kwargs)
+
+    def requestStreamOnce(self, method, url, *args, **kwargs):
+        if self.rateLimiter: self.rateLimiter.acquire(method, url)
+        connection = self.checkout()
+        try:
+            records = connection.requestStream(method, url, *args, **kwargs)
+        except exceptions.RackspaceException:
+            self.checkin(connection)
+            raise
+        except:
+            self.discard(connection)
+            raise
+        # the connection stays checked out until the stream is done with it
+        records.release = lambda (reusable): self.release(connection, reusable)
+        return records
+
+    def cacheKey(self):
+        return (self.scheme, self.host, self.port, self.pathPrefix)
+
+    def release(self, connection, reusable):
+        if reusable:
+            self.checkin(connection)
+        else:
+            self.discard(connection)
+
+    def close(self):
+        self.condition.acquire()
+        try:
+            while self.idle:
+                connection, released = self.idle.pop()
+                connection.close()
+                self.open -= 1
+        finally:
+            self.condition.release()
+
+class AuthResponse(object):
+    """
+    The headers of an authentication response, as kept in a token cache.
+    """
+    def __init__(self, headers):
+        self.headers = dict([(name.lower(), value) for name, value in headers.iteritems()])
+
+    def getheader(self, name, default=None):
+        return self.headers.get(name.lower(), default)
 
-        
-        
 class Authorization(object):
+    """
+    NAME
+        Authorization
+
+    DESCRIPTION
+        An authenticated session, holding a ConnectionPool for each service endpoint
+        (serverManager, storage and cdn).
+
+        Tokens expire; when a request raises UnauthorizedException, the session
+        authenticates again, points its pools at the new token and replays the
+        request.  Concurrent callers hitting the same expired token share a single
+        re-authentication.
+
+        If tokenCache is set (to a store.DiskStore, or anything with the same load
+        and save methods), tokens are kept there keyed on the auth URL and user name,
+        so that other processes (or later ones) for the same user skip authenticating
+        while the cached token is younger than tokenLifetime.  The key's digest is
+        part of the cache key, so that a wrong key is not answered from the cache.  Cached entries hold
+        the token itself, so the cache directory must be private to its owner.
+
+        Observers added with addObserver() see every request, retry and api call of
+        the session; see thunderhead.rackspace.metrics.
+    """
     baseURL = 'https://auth.api.rackspacecloud.com/v1.0'
 
+    # ConnectionPool settings for each service endpoint
+    poolSize = 4
+    poolIdleTimeout = 60
+    poolCheckoutTimeout = None
+    # each Authorization gets its own policy (and so its own retry counters), shared
+    # by its pools; set to None to disable retries
+    retryPolicyClass = RetryPolicy
+    retryPolicy = None
+    # likewise for client-side rate limiting (see ratelimit.RateLimiter), off by
+    # default; setRateLimiter() shares one limiter among several Authorizations
+    rateLimiterClass = None
+    rateLimiter = None
+    # the transport for authentication and each pool's connections (see
+    # thunderhead.rackspace.transport); None for httplib
+    transport = None
+    # shared token cache, and how long a cached token is trusted (tokens last a day)
+    tokenCache = None
+    tokenLifetime = 23 * 3600
+    authHeaders = ('X-Auth-Token', 'X-Server-Management-URL', 'X-Storage-URL', 'X-CDN-Management-URL')
+    reauthCount = 0
+    observers = ()
+
     def __init__(self, name, key):
-        response = self.getAuthorization(name, key)
+        self.name = name
+        self.key = key
+        self.authLock = threading.Lock()
+        # shared with the pools and retry policy, so observers may be added at any time
+        self.observers = []
+        self.bindResponse(self.authenticate())
+
+    def authenticate(self, staleToken=None):
+        """
+        Return the authentication response for this session's credentials, from the
+        token cache if it holds a token other than <staleToken>, or else fresh from
+        the service (updating the cache).
+        """
+        response = self.cachedAuthorization()
+        if response and response.getheader('X-Auth-Token') != staleToken: return response
+        response = self.getAuthorization(self.name, self.key)
+        self.cacheAuthorization(response)
+        return response
+
+    def reauthorize(self, staleToken):
+        """
+        Replace <staleToken> with a new token in each of this session's pools, unless
+        that has already happened.
+        """
+        self.authLock.acquire()
+        try:
+            if staleToken != self.authToken: return
+            self.authToken = self.authenticate(staleToken).getheader('X-Auth-Token')
+            for pool in (self.serverManager, self.storage, self.cdn):
+                if pool: pool.headers['X-Auth-Token'] = self.authToken
+            self.reauthCount += 1
+        finally:
+            self.authLock.release()
+
+    def tokenCacheKey(self):
+        return ('authorization', self.baseURL, self.name, sha1(self.key).hexdigest())
+
+    def cachedAuthorization(self):
+        if not self.tokenCache: return None
+        try:
+            entry = self.tokenCache.load(self.tokenCacheKey())
+        except EnvironmentError:
+            return None
+        if not entry: return None
+        timestamp, headers = entry
+        if time.time() - timestamp >= self.tokenLifetime: return None
+        return AuthResponse(headers)
+
+    def cacheAuthorization(self, response):
+        if not self.tokenCache: return
+        headers = dict([(name, response.getheader(name)) for name in self.authHeaders])
+        try:
+            self.tokenCache.save(self.tokenCacheKey(), int(time.time()), headers)
+        except EnvironmentError:
+            # the cache is an optimization; a session works without it
+            pass
+
+    def bindResponse(self, response):
+        if self.retryPolicy is None and self.retryPolicyClass: self.retryPolicy = self.retryPolicyClass()
+        if self.rateLimiter is None and self.rateLimiterClass: self.rateLimiter = self.rateLimiterClass()
+        if self.retryPolicy is not None: self.retryPolicy.observers = self.observers
         self.manageServerURL = response.getheader('X-Server-Management-URL')
         self.storageURL = response.getheader('X-Storage-URL')
         self.cdnURL = response.getheader('X-CDN-Management-URL')
         self.authToken = response.getheader('X-Auth-Token')
         self.serverManager = self.getBoundConnection(self.manageServerURL)
+        self.storage = self.storageURL and self.getBoundConnection(self.storageURL)
+        self.cdn = self.cdnURL and self.getBoundConnection(self.cdnURL)
 
     def getBoundConnection(self, url):
-        return BoundConnection(url, {'X-Auth-Token': self.authToken})
+        pool = ConnectionPool(
+            url,
+            {'X-Auth-Token': self.authToken},
+            self.poolSize,
+            self.poolIdleTimeout,
+            self.poolCheckoutTimeout,
+            self.retryPolicy,
+            self.rateLimiter,
+            self.transport,
+        )
+        pool.reauthorize = self.reauthorize
+        pool.observers = self.observers
+        return pool
+
+    def addObserver(self, observer):
+        """
+        Report this session's requests, retries and api calls to <observer> (see
+        thunderhead.rackspace.metrics).
+        """
+        self.observers.append(observer)
+
+    def setRateLimiter(self, limiter):
+        """
+        Pace all of this Authorization's requests with <limiter> (None to stop).
+        """
+        self.rateLimiter = limiter
+        for pool in (self.serverManager, self.storage, self.cdn):
+            if pool: pool.rateLimiter = limiter
 
     @classmethod
     def getAuthorization(self, name, key):
@@ -131,8 +750,5 @@ class Authorization(object):
 
     @classmethod
     def getConnection(self, request):
-        klass = ((request.scheme == 'http' and httplib.HTTPConnection) or httplib.HTTPSConnection)
-        args = [request.hostname]
-        if request.port: args.append(request.port)
-        return klass(*args)
+        return (self.transport or transport.defaultTransport).connect(request.scheme, request.hostname, request.port)
 
@@ -17,43 +17,352 @@
 ##  along with Thunderhead.  If not, see <http://www.gnu.org/licenses/>.
 
 import xml.dom.minidom as minidom
-import base64, time, datetime
+from xml.sax.saxutils import escape
+import sys, base64, time, threading
 from thunderhead import CachedResource as BaseCachedResource
+from thunderhead.clock import systemClock
+from thunderhead.rackspace import exceptions, metrics, records, stream
+from thunderhead.rackspace.recordset import RecordSet, IndexedRecordSet
 
 def unixNow():
-    return int(datetime.datetime.now().strftime('%s'))
+    return int(time.time())
 
 class CachedResource(BaseCachedResource):
+    """
+    Caches the dictionary returned by an api function, refreshing it every "interval"
+    seconds by fetching only the changes since the last fetch and merging them in.
+
+    Ordinarily the call that finds the cache stale waits for the refresh.  With
+    backgroundRefresh set, that call returns the stale asset at once and the refresh
+    runs on a separate thread; at most one refresh is in flight at a time.  A failed
+    background refresh is passed to refreshFailed(), which calls errorHandler (if set)
+    with the resource and the sys.exc_info() triple; the first call errorInterval
+    seconds later (by default, a full interval) tries again, so that an unreachable
+    service is not asked on every call.
+    Background refresh needs a connection safe to use from another thread, such as
+    the Authorization's connection pools.
+
+    Given a store (see thunderhead.rackspace.store), the asset and its timestamp are
+    saved after each fetch, and initialization first tries to resume from the store,
+    after which only the changes since the saved timestamp need fetching.  Failures
+    to save are ignored.
+
+    A dictionary asset is kept as a recordset.RecordSet, which tracks the keys each
+    merge changes, so that consumers such as Role can revisit only those.
+
+    With indexed set (off by default), the asset is kept as a recordSetClass
+    (recordset.IndexedRecordSet by default), whose indexes are updated as each delta
+    is merged and which answers queries like asset.where(status='ACTIVE', imageId=12)
+    without scanning every record.  Indexing costs time on initialization and memory
+    throughout, so is worth turning on only for assets queried that way.  Setting
+    recordSetClass to recordset.AddressedRecordSet adds an index by IP address.
+
+    stats() reports, besides calls and coalesced calls:
+    * hits: calls answered from the cache without waiting on a fetch (including
+      those that set a background refresh going, and a first call restored from
+      the store while still fresh)
+    * initializations, restores: full fetches, and resumptions from the store
+    * refreshes, emptyRefreshes: delta fetches, and those that brought no changes
+      (many of those suggest a longer interval would do)
+    * refreshErrors: failed background refreshes
+    * merged, removed: records merged in from deltas, and records they removed
+      (status DELETED)
+    * mergeTime: seconds spent merging
+    * size: records currently cached
+    """
+    # wall-clock time of the last fetch, sent as changes-since on the next
     timestamp = None
+    # clock.monotonic() reading of the last fetch, for measuring the interval
+    refreshedAt = None
     interval = 60
+    clock = systemClock
+    backgroundRefresh = False
+    errorHandler = None
+    errorInterval = None
+    refreshing = False
+    refreshThread = None
+    lastError = None
+    store = None
+    indexed = False
+    recordSetClass = IndexedRecordSet
+    hitCount = 0
+    initializeCount = 0
+    restoreCount = 0
+    refreshCount = 0
+    emptyRefreshCount = 0
+    refreshErrorCount = 0
+    mergedCount = 0
+    removedCount = 0
+    mergeTime = 0.0
 
     def __init__(self, basefunc):
         self.baseFunction = basefunc
+        self.refreshLock = threading.Lock()
+
+    def prepare(self, asset):
+        recordSetClass = RecordSet
+        if self.indexed: recordSetClass = self.recordSetClass
+        if isinstance(asset, dict) and asset.__class__ is not recordSetClass:
+            return recordSetClass(asset)
+        return asset
 
     def merge(self, values):
-        newset = dict(self.asset or {})
+        if isinstance(self.asset, RecordSet):
+            newset = self.asset.copy()
+        else:
+            newset = self.prepare(dict(self.asset or {}))
+        merged = removed = 0
         for key, value in values.iteritems():
             if getattr(value, 'status', None) == 'DELETED' or (
                 hasattr(value, 'has_key') and value.has_key('status') and value['status'] == 'DELETED'
             ):
-                newset.pop(key, None)
+                if newset.pop(key, None) is not None: removed += 1
             else:
                 newset[key] = value
+                merged += 1
+        self.mergedCount += merged
+        self.removedCount += removed
         return newset
 
     def needsUpdate(self):
-        return self.timestamp and (self.timestamp + self.interval) <= unixNow()
+        return self.refreshedAt is not None and (self.refreshedAt + self.interval) <= self.clock.monotonic()
+
+    def answerFromCache(self, *args, **kwargs):
+        # fresh, or stale with a background refresh already under way: a hit either
+        # way, with no call to coalesce
+        if self.needsUpdate() and not (self.backgroundRefresh and self.refreshing): return False
+        self.hitCount += 1
+        return True
 
     def initialize(self, *args, **kwargs):
-        self.timestamp = unixNow()
-        self.asset = self.baseFunction(*args, **kwargs)
+        if self.store and self.restore(args, kwargs):
+            self.restoreCount += 1
+            self.update(*args, **kwargs)
+            return
+        self.refreshedAt = self.clock.monotonic()
+        self.timestamp = self.clock.wallTime()
+        self.asset = self.prepare(self.baseFunction(*args, **kwargs))
+        self.initializeCount += 1
+        self.save(args, kwargs)
 
     def update(self, *args, **kwargs):
         if self.needsUpdate():
-            timestamp = unixNow()
-            self.asset = self.merge(self.baseFunction(*args, **dict({'since': self.timestamp}, **kwargs)))
-            self.timestamp = timestamp
-        
+            if self.backgroundRefresh:
+                self.hitCount += 1
+                self.startRefresh(args, kwargs)
+            else:
+                self.refresh(*args, **kwargs)
+        else:
+            self.hitCount += 1
+
+    def refresh(self, *args, **kwargs):
+        refreshedAt = self.clock.monotonic()
+        timestamp = self.clock.wallTime()
+        changes = self.baseFunction(*args, **dict({'since': self.timestamp}, **kwargs))
+        started = metrics.timer()
+        self.asset = self.merge(changes)
+        self.mergeTime += metrics.timer() - started
+        self.refreshCount += 1
+        if not changes: self.emptyRefreshCount += 1
+        self.refreshedAt = refreshedAt
+        self.timestamp = timestamp
+        self.save(args, kwargs)
+
+    def stats(self):
+        stats = BaseCachedResource.stats(self)
+        stats.update({
+            'hits': self.hitCount,
+            'initializations': self.initializeCount,
+            'restores': self.restoreCount,
+            'refreshes': self.refreshCount,
+            'emptyRefreshes': self.emptyRefreshCount,
+            'refreshErrors': self.refreshErrorCount,
+            'merged': self.mergedCount,
+            'removed': self.removedCount,
+            'mergeTime': self.mergeTime,
+            'size': len(self.asset or ()),
+        })
+        return stats
+
+    def storeKey(self, args, kwargs):
+        return (getattr(self.baseFunction, '__name__', None), normalizeKey(args), normalizeKey(kwargs))
+
+    def restore(self, args, kwargs):
+        stored = self.store.load(self.storeKey(args, kwargs))
+        if stored is None: return False
+        (self.timestamp, self.asset) = stored
+        self.asset = self.prepare(self.asset)
+        # age the monotonic reading to match the stored wall-clock time
+        self.refreshedAt = self.clock.monotonic() - max(self.clock.wallTime() - self.timestamp, 0)
+        return True
+
+    def save(self, args, kwargs):
+        if not self.store: return
+        try:
+            self.store.save(self.storeKey(args, kwargs), self.timestamp, self.asset)
+        except EnvironmentError:
+            pass
+
+    def startRefresh(self, args, kwargs):
+        self.refreshLock.acquire()
+        try:
+            if self.refreshing: return False
+            self.refreshing = True
+        finally:
+            self.refreshLock.release()
+        try:
+            self.refreshThread = threading.Thread(target=self.backgroundUpdate, args=(args, kwargs))
+            self.refreshThread.setDaemon(True)
+            self.refreshThread.start()
+        except:
+            self.refreshing = False
+            raise
+        return True
+
+    def backgroundUpdate(self, args, kwargs):
+        try:
+            try:
+                self.refresh(*args, **kwargs)
+                self.lastError = None
+            except Exception:
+                self.lastError = sys.exc_info()
+                self.holdOff()
+                self.refreshFailed(self.lastError)
+        finally:
+            self.refreshing = False
+
+    def holdOff(self):
+        # make the asset due for refresh again errorInterval seconds from now
+        wait = self.errorInterval
+        if wait is None: wait = self.interval
+        self.refreshedAt = self.clock.monotonic() - self.interval + wait
+
+    def refreshFailed(self, excInfo):
+        self.refreshErrorCount += 1
+        if self.errorHandler: self.errorHandler(self, excInfo)
+
+def addStats(total, stats):
+    for name, value in stats.iteritems():
+        total[name] = total.get(name, 0) + value
+
+def normalizeKey(value):
+    """
+    Reduce a call argument to a hashable cache key component.  Objects may supply
+    their own through a cacheKey() method; connections do, so that calls against
+    the same account share entries.
+    """
+    if hasattr(value, 'cacheKey'):
+        return value.cacheKey()
+    if isinstance(value, dict):
+        items = [(k, normalizeKey(v)) for (k, v) in value.iteritems()]
+        items.sort()
+        return tuple(items)
+    if isinstance(value, (list, tuple)):
+        return tuple([normalizeKey(v) for v in value])
+    return value
+
+class KeyedCachedResource(object):
+    """
+    NAME
+        KeyedCachedResource
+
+    DESCRIPTION
+        A function wrapper keeping a separate CachedResource for each distinct set of
+        call arguments, so that calls for different accounts or queries neither share
+        nor clobber each other's cached state.  Arguments are normalized by
+        normalizeKey() to form the key.
+
+        At most maxEntries entries are kept; beyond that, the least recently used entry
+        is discarded.  Each new entry takes the settings named in resourceSettings
+        (interval, clock, backgroundRefresh, errorHandler, errorInterval, store, indexed
+        and recordSetClass) from the wrapper.
+
+        stats() sums the entries' CachedResource stats, those of discarded entries
+        included (but not their size), adding the number of entries and evictions.
+    """
+    resourceClass = CachedResource
+    resourceSettings = (
+        'interval', 'clock', 'backgroundRefresh', 'errorHandler', 'errorInterval', 'store', 'indexed', 'recordSetClass',
+    )
+    maxEntries = 32
+    interval = CachedResource.interval
+    clock = CachedResource.clock
+    backgroundRefresh = CachedResource.backgroundRefresh
+    errorHandler = None
+    errorInterval = None
+    store = None
+    indexed = CachedResource.indexed
+    recordSetClass = CachedResource.recordSetClass
+
+    def __init__(self, basefunc, maxEntries=None):
+        self.baseFunction = basefunc
+        if maxEntries: self.maxEntries = maxEntries
+        self.entries = {}
+        self.recent = []
+        self.lock = threading.Lock()
+        self.evictionCount = 0
+        # stats of discarded entries, carried into stats()
+        self.retiredStats = {}
+
+    def cacheKey(self, *args, **kwargs):
+        return (normalizeKey(args), normalizeKey(kwargs))
+
+    def newResource(self):
+        resource = self.resourceClass(self.baseFunction)
+        for name in self.resourceSettings:
+            setattr(resource, name, getattr(self, name))
+        return resource
+
+    def resourceFor(self, *args, **kwargs):
+        key = self.cacheKey(*args, **kwargs)
+        self.lock.acquire()
+        try:
+            resource = self.entries.get(key)
+            if resource is None:
+                resource = self.entries[key] = self.newResource()
+                while len(self.recent) >= self.maxEntries:
+                    self.retire(self.entries.pop(self.recent.pop(0)))
+                    self.evictionCount += 1
+            else:
+                self.recent.remove(key)
+            self.recent.append(key)
+        finally:
+            self.lock.release()
+        return resource
+
+    def clear(self):
+        self.lock.acquire()
+        try:
+            for resource in self.entries.values():
+                self.retire(resource)
+            self.entries.clear()
+            del self.recent[:]
+        finally:
+            self.lock.release()
+
+    def retire(self, resource):
+        stats = resource.stats()
+        stats['size'] = 0
+        addStats(self.retiredStats, stats)
+
+    def stats(self):
+        self.lock.acquire()
+        try:
+            resources = self.entries.values()
+            # every figure present, even before the first call
+            stats = dict.fromkeys(self.newResource().stats().keys(), 0)
+            addStats(stats, self.retiredStats)
+        finally:
+            self.lock.release()
+        for resource in resources:
+            addStats(stats, resource.stats())
+        stats['entries'] = len(resources)
+        stats['evictions'] = self.evictionCount
+        return stats
+
+    def __call__(self, *args, **kwargs):
+        return self.resourceFor(*args, **kwargs)(*args, **kwargs)
+
 
 xmlns = 'http://docs.rackspacecloud.com/servers/api/v1.0'
 
@@ -63,146 +372,412 @@ serverManagementInterface = [
     'createSharedIPGroup',
     'deleteServer',
     'deleteSharedIPGroup',
-    {'name': 'getFlavors', 'wrapper': CachedResource},
-    {'name': 'getImages', 'wrapper': CachedResource},
+    {'name': 'getFlavors', 'wrapper': KeyedCachedResource},
+    {'name': 'getImages', 'wrapper': KeyedCachedResource},
     'getPublicIPs',
-    {'name': 'getServers', 'wrapper': CachedResource},
-    {'name': 'getSharedIPGroups', 'wrapper': CachedResource},
+    {'name': 'getServers', 'wrapper': KeyedCachedResource},
+    {'name': 'getSharedIPGroups', 'wrapper': KeyedCachedResource},
+    'iterFlavors',
+    'iterImages',
+    'iterServers',
     'shareIP',
+    'waitForServers',
+]
+
+# batch variants of the single-item functions above, run concurrently by the Account
+bulkInterface = [
+    {'name': 'createServers', 'function': 'createServer'},
+    {'name': 'deleteServers', 'function': 'deleteServer'},
+    {'name': 'getPublicIPsMany', 'function': 'getPublicIPs'},
 ]
 
+# faults that mean "slow down" rather than "failed"
+throttleExceptions = (exceptions.OverLimitException,)
+
+# The api functions below that return complete results report each call to the
+# connection's observers, if any; see thunderhead.rackspace.metrics.
+
 def queryString(since):
     return (since and '?changes-since=' + str(since)) or ''
 
+@metrics.instrumented
 def deleteServer(conn, server):
     (body, code) = conn.request('DELETE', '/servers/' + server)
     return code
 
+@metrics.instrumented
 def deleteSharedIPGroup(conn, group):
     (body, code) = conn.request('DELETE', '/shared_ip_groups/' + group)
     return code
 
+@metrics.instrumented
 def getSharedIPGroups(conn, since=None):
     (data, code) = conn.request('GET', '/shared_ip_groups' + queryString(since))
+    return sharedIPGroupsFromXML(data, recordTypesFor(conn))
+
+def sharedIPGroupsFromXML(data, types=None):
     if data:
         nodes = data.getElementsByTagName('sharedIpGroup')
-        result = ((nodes and [SharedIPGroup.fromXML(node) for node in nodes]) or [])
+        groupClass = (types or recordTypes)['sharedIpGroup']
+        result = ((nodes and [groupClass.fromXML(node) for node in nodes]) or [])
         result = dict([(s.id, s) for s in result])
     else:
         result = {}
     return result
 
+@metrics.instrumented
 def createSharedIPGroup(conn, sharedipgroup):
-    (data, code) = conn.request('POST', '/shared_ip_groups', sharedipgroup.toXML())
+    (data, code) = conn.request('POST', '/shared_ip_groups', sharedipgroup.toXMLString())
     return data
 
+@metrics.instrumented
 def shareIP(conn, sharedip, serverId, address):
-    (body, code) = conn.request('PUT', '/servers/' + serverId + '/ips/public/' + address, sharedip.toXML())
+    (body, code) = conn.request('PUT', '/servers/' + serverId + '/ips/public/' + address, sharedip.toXMLString())
     return code
 
 # This just dumbly fetches public IPs for the moment
 # TODO: figure out a way to determine whether an IP has been shared or not
+@metrics.instrumented
 def getPublicIPs(conn, server):
-    (ips, code) = conn.request('GET', '/servers/' + server + '/ips/public')
-    return manualIndexedChildHash(
-        ips,
-        'ip',
-        {
-            'addr': str,
-        },
-    )
+    (ips, code) = conn.request('GET', '/servers/' + str(getattr(server, 'id', server)) + '/ips/public')
+    return publicIPsFromXML(ips, recordTypesFor(conn))
+
+publicIPAttributes = {
+    'addr': str,
+}
 
+def publicIPsFromXML(ips, types=None):
+    return manualIndexedChildHash(ips, 'ip', publicIPAttributes, (types or recordTypes)['ip'])
+
+@metrics.instrumented
 def getServers(conn, since=None):
-    (data, code) = conn.request('GET', '/servers/detail' + queryString(since))
+    return indexRecords(iterServers(conn, since))
+
+# The iter* functions yield records lazily as the response is parsed; close the
+# resulting iterator if abandoning it before the end.
+def iterServers(conn, since=None):
+    builder = ServerBuilder()
+    builder.serverClass = recordTypesFor(conn)['server']
+    return conn.requestStream('GET', '/servers/detail' + queryString(since), builder)
+
+def serversFromXML(data, types=None):
     if data:
         nodes = data.getElementsByTagName('server')
-        result = ((nodes and [Server.fromXML(node) for node in nodes]) or [])
+        serverClass = (types or recordTypes)['server']
+        result = ((nodes and [serverClass.fromXML(node) for node in nodes]) or [])
         result = dict([(s.id, s) for s in result])
     else:
         result = {}
     return result
 
+@metrics.instrumented
 def createServer(conn, server):
-    (created, code) = conn.request('POST', '/servers', server.toXML())
-    return Server.fromXML(created)
+    (created, code) = conn.request('POST', '/servers', server.toXMLString())
+    return serverFromXML(created, recordTypesFor(conn))
 
+def serverFromXML(data, types=None):
+    return (types or recordTypes)['server'].fromXML(data)
+
+@metrics.instrumented
 def deleteServer(conn, server):
     (result, code) = conn.request('DELETE', '/servers/' + str(getattr(server, 'id', server)))
     return True
 
+def waitForServers(conn, servers, status='ACTIVE', timeout=None, since=None, callback=None):
+    """
+    Wait for each of <servers> (servers or server ids) to reach <status> (or any of a
+    list of statuses), returning a dictionary of the servers as last seen, by id.
+    See ServerWaiter.
+    """
+    return ServerWaiter(conn, servers, status, timeout, since, callback).wait()
+
+class ServerWaiter(object):
+    """
+    NAME
+        ServerWaiter
+
+    DESCRIPTION
+        Polls the server list until each of a set of servers reaches a target status,
+        sharing one poll among all the servers.  After the first poll (a full listing,
+        unless a "since" time is given), each poll asks only for the changes since the
+        previous one.
+
+        A server also finishes, so as not to be waited on in vain, if it reaches one of
+        failedStatuses; the caller should check the status of each server returned.
+        The callback, if any, is called with each server as it finishes.
+
+        The delay between polls adapts to the build progress reported: from the rate
+        at which each pending server's progress has been advancing, the next poll is
+        timed for the earliest expected completion.  Without progress to go on, the
+        delay starts at initialInterval and doubles.  Delays are kept between
+        minInterval and maxInterval; every poll after the first is a changes-since
+        request, which the service allows only 3 a minute (see
+        ratelimit.defaultLimits), so minInterval stays at 20 seconds.
+
+        An id absent from the first poll's full listing (a server already deleted,
+        or a mistaken id) would never turn up; it is dropped from the wait and
+        recorded in "missing" rather than waited on.  With a "since" time, the first
+        poll is not a full listing and no such check is possible.
+
+        If a timeout (in seconds) expires first, WaitTimeoutException is raised, with
+        the finished servers in its "servers" attribute and the ids still pending in
+        "pending".
+
+        A "since" time given must predate the servers reaching their target status
+        (take it before creating them, for instance), or they will never be seen to.
+    """
+    initialInterval = 20
+    minInterval = 20
+    maxInterval = 120
+    failedStatuses = ('ERROR', 'DELETED', 'UNKNOWN')
+    clock = systemClock
+    sleep = time.sleep
+
+    def __init__(self, conn, servers, status='ACTIVE', timeout=None, since=None, callback=None):
+        self.conn = conn
+        self.pending = set([int(getattr(server, 'id', server)) for server in servers])
+        if isinstance(status, basestring): status = [status]
+        self.targets = tuple(status)
+        self.timeout = timeout
+        self.since = since
+        self.callback = callback
+        self.servers = {}
+        self.finished = {}
+        self.missing = set()
+        # (monotonic time, progress) as last reported, and progress per second, by id
+        self.samples = {}
+        self.rates = {}
+        self.delay = None
+        self.pollCount = 0
+
+    def fetch(self, since):
+        return getServers(self.conn, since)
+
+    def poll(self):
+        timestamp = self.clock.wallTime()
+        complete = self.since is None
+        servers = self.fetch(self.since)
+        self.since = timestamp
+        self.pollCount += 1
+        now = self.clock.monotonic()
+        for id in list(self.pending):
+            server = servers.get(id)
+            if server is None:
+                if complete:
+                    self.pending.discard(id)
+                    self.missing.add(id)
+                continue
+            self.servers[id] = server
+            self.observe(id, server, now)
+            status = getattr(server, 'status', None)
+            if status in self.targets or status in self.failedStatuses:
+                self.pending.discard(id)
+                self.finished[id] = server
+                if self.callback: self.callback(server)
+
+    def observe(self, id, server, now):
+        progress = getattr(server, 'progress', None)
+        if progress is None: return
+        if self.samples.has_key(id):
+            (then, before) = self.samples[id]
+            if progress > before and now > then:
+                self.rates[id] = (progress - before) / float(now - then)
+        self.samples[id] = (now, progress)
+
+    def nextDelay(self):
+        now = self.clock.monotonic()
+        estimates = []
+        for id in self.pending:
+            if not self.samples.has_key(id): continue
+            (then, progress) = self.samples[id]
+            if progress >= 100:
+                estimates.append(self.minInterval)
+            elif self.rates.has_key(id):
+                estimates.append(then + (100 - progress) / self.rates[id] - now)
+        if estimates:
+            delay = min(estimates)
+        elif self.delay:
+            delay = self.delay * 2
+        else:
+            delay = self.initialInterval
+        self.delay = max(self.minInterval, min(self.maxInterval, delay))
+        return self.delay
+
+    def wait(self):
+        deadline = None
+        if self.timeout is not None: deadline = self.clock.monotonic() + self.timeout
+        while True:
+            self.poll()
+            if not self.pending: return self.servers
+            delay = self.nextDelay()
+            if deadline is not None:
+                remaining = deadline - self.clock.monotonic()
+                if remaining <= 0:
+                    exception = exceptions.WaitTimeoutException(
+                        '%d of %d servers still pending' % (len(self.pending), len(self.pending) + len(self.finished))
+                    )
+                    exception.servers = self.finished
+                    exception.pending = self.pending
+                    raise exception
+                delay = min(delay, remaining)
+            self.sleep(delay)
+
+def indexRecords(records):
+    result = {}
+    for record in records:
+        if hasattr(record, 'has_key'):
+            result[record['id']] = record
+        else:
+            result[record.id] = record
+    return result
+
 def attributeHash(node, attrs):
     ident = lambda (x): x
     return dict([
         (k, (t or ident)(node.getAttribute(k))) for (k, t) in attrs.iteritems() if node.hasAttribute(k)
     ])
 
-def indexedChildHash(node, tag, attrs):
+def indexedChildHash(node, tag, attrs, recordClass=dict):
     result = {}
     if node:
         for child in node.getElementsByTagName(tag):
-            item = attributeHash(child, attrs)
+            item = records.build(recordClass, attributeHash(child, attrs))
             result[item['id']] = item
     return result
 
-def manualIndexedChildHash(node, tag, attrs):
+def manualIndexedChildHash(node, tag, attrs, recordClass=dict):
     result = {}
     myid = 1
     for child in node.getElementsByTagName(tag):
-        item = attributeHash(child, attrs)
+        item = records.build(recordClass, attributeHash(child, attrs))
         result[myid] = item
         myid += 1
     return result
  
  
+flavorAttributes = {
+    'id': int,
+    'ram': int,
+    'disk': int,
+    'name': False,
+}
+
+@metrics.instrumented
 def getFlavors(conn, since=None):
-    (flavors, code) = conn.request('GET', '/flavors/detail' + queryString(since))
-    return indexedChildHash(
-        flavors,
-        'flavor',
-        {
-            'id': int, 
-            'ram': int,
-            'disk': int,
-            'name': False,
-        },
+    return indexRecords(iterFlavors(conn, since))
+
+def iterFlavors(conn, since=None):
+    return conn.requestStream(
+        'GET',
+        '/flavors/detail' + queryString(since),
+        stream.AttributeRecordBuilder('flavor', flavorAttributes, recordTypesFor(conn)['flavor']),
     )
 
+def flavorsFromXML(flavors, types=None):
+    return indexedChildHash(flavors, 'flavor', flavorAttributes, (types or recordTypes)['flavor'])
+
 # timezones are a mess, so for now, we'll leave these as strings.
 def convertTimestamp(ts):
     return str(ts)
 
+imageAttributes = {
+    'id': int,
+    'name': str,
+    'status': str,
+    'updated': convertTimestamp,
+    'created': convertTimestamp,
+    'progress': int,
+    'serverId': int,
+}
+
+@metrics.instrumented
 def getImages(conn, since=None):
-    (images, code) = conn.request('GET', '/images/detail' + queryString(since))
-    return indexedChildHash(
-        images,
-        'image',
-        {
-            'id': int,
-            'name': str,
-            'status': str,
-            'updated': convertTimestamp,
-            'created': convertTimestamp,
-            'progress': int,
-            'serverId': int,
-        },
+    return indexRecords(iterImages(conn, since))
+
+def iterImages(conn, since=None):
+    return conn.requestStream(
+        'GET',
+        '/images/detail' + queryString(since),
+        stream.AttributeRecordBuilder('image', imageAttributes, recordTypesFor(conn)['image']),
     )
 
+def imagesFromXML(images, types=None):
+    return indexedChildHash(images, 'image', imageAttributes, (types or recordTypes)['image'])
+
+# Request bodies are serialized straight to strings by toXMLString(), producing the
+# same document as toXML().toxml() without building a DOM first.
+attributeEntities = {'"': '&quot;', '\n': '&#10;', '\r': '&#13;', '\t': '&#9;'}
+
+def textValue(value):
+    if isinstance(value, basestring): return value
+    return str(value)
+
+def escapeText(value):
+    return escape(textValue(value))
+
+def escapeAttribute(value):
+    return escape(textValue(value), attributeEntities)
+
+def xmlElement(tag, attributes={}, content=''):
+    """
+    Serialize the element <tag> with the given attribute dictionary (written in
+    sorted order, as minidom does) and <content>, which must be serialized already.
+    """
+    names = attributes.keys()
+    names.sort()
+    attrs = ''.join([' %s="%s"' % (name, escapeAttribute(attributes[name])) for name in names])
+    if content: return '<%s%s>%s</%s>' % (tag, attrs, content, tag)
+    return '<%s%s/>' % (tag, attrs)
+
+def xmlString(markup):
+    if isinstance(markup, unicode): return markup.encode('utf-8')
+    return markup
 
 class APIObject(object):
+    __slots__ = ()
     simpleAttributes = []
     integerAttributes = []
     xmlAttributes = []
+    frozen = False
 
     def __init__(self, *args, **kwargs):
         self.initializeAttributes(*args, **kwargs)
 
     def initializeAttributes(self, *args, **kwargs):
         for simpleAttr in self.simpleAttributes:
-            if kwargs.has_key(simpleAttr): setattr(self, simpleAttr, kwargs[simpleAttr])
+            if kwargs.has_key(simpleAttr): object.__setattr__(self, simpleAttr, kwargs[simpleAttr])
         for intAttr in self.integerAttributes:
-            if kwargs.has_key(intAttr): setattr(self, intAttr, int(kwargs[intAttr]))
+            if kwargs.has_key(intAttr): object.__setattr__(self, intAttr, int(kwargs[intAttr]))
+
+    def __setattr__(self, name, value):
+        if self.frozen: raise AttributeError(self.__class__.__name__ + ' is immutable')
+        object.__setattr__(self, name, value)
+
+    def __delattr__(self, name):
+        if self.frozen: raise AttributeError(self.__class__.__name__ + ' is immutable')
+        object.__delattr__(self, name)
+
+    # slotted subclasses have no __dict__ for pickle to fall back on
+    def __getstate__(self):
+        state = dict(getattr(self, '__dict__', {}))
+        for name in records.slotNames(self.__class__):
+            if hasattr(self, name): state[name] = getattr(self, name)
+        return state
 
-class Server(APIObject):
+    def __setstate__(self, state):
+        for name, value in state.iteritems():
+            object.__setattr__(self, name, value)
+
+    def xmlAttributeValues(self):
+        values = dict([(attr, getattr(self, attr)) for attr in self.xmlAttributes if hasattr(self, attr)])
+        values['xmlns'] = xmlns
+        return values
+
+class BaseServer(APIObject):
+    """
+    Behavior common to Server and its compact variants; see Server.
+    """
+    __slots__ = ()
     simpleAttributes = ['name', 'status', 'hostId', 'metadata', 'publicIPs', 'privateIPs', 'files', 'adminPass']
     integerAttributes = ['id', 'imageId', 'flavorId', 'progress', 'sharedIpGroupId']
     xmlAttributes = [
@@ -270,6 +845,68 @@ class Server(APIObject):
             if personality.hasChildNodes(): node.appendChild(personality)
         return node 
 
+    def toXMLString(self):
+        content = []
+        addresses = []
+        for (attr, name) in (('privateIPs', 'private'), ('publicIPs', 'public')):
+            ips = getattr(self, attr, None)
+            if ips: addresses.append(xmlElement(name, {}, ''.join([xmlElement('ip', {'addr': ip}) for ip in ips])))
+        if addresses: content.append(xmlElement('addresses', {}, ''.join(addresses)))
+        metadata = getattr(self, 'metadata', None)
+        if metadata:
+            content.append(xmlElement('metadata', {}, ''.join([
+                xmlElement('meta', {'key': key}, escapeText(val)) for (key, val) in metadata.iteritems()
+            ])))
+        files = getattr(self, 'files', None)
+        if files:
+            content.append(xmlElement('personality', {}, ''.join([
+                xmlElement('file', {'path': key}, escapeText(base64.encodestring(val))) for (key, val) in files.iteritems()
+            ])))
+        return xmlString(xmlElement('server', self.xmlAttributeValues(), ''.join(content)))
+
+class Server(BaseServer):
+    pass
+
+class CompactServer(BaseServer):
+    """
+    A Server holding its attributes in slots instead of an instance dictionary.  Only
+    the attributes named in simpleAttributes and integerAttributes can be set.
+    """
+    __slots__ = tuple(BaseServer.simpleAttributes + BaseServer.integerAttributes)
+
+FrozenServer = records.frozen(CompactServer, 'FrozenServer')
+
+class ServerBuilder(stream.RecordBuilder):
+    """
+    Builds Server objects from a streamed server list, equivalent to Server.fromXML.
+    The class built is recordTypes['server'] unless serverClass is set.
+    """
+    tag = 'server'
+    serverClass = None
+
+    def startRecord(self, attrs):
+        self.metaText = None
+        return stream.RecordBuilder.startRecord(self, attrs)
+
+    def startChild(self, path, attrs):
+        if path == ['metadata', 'meta']:
+            self.metaKey = attrs.get('key', '')
+            self.metaText = []
+        elif len(path) == 3 and path[0] == 'addresses' and path[2] == 'ip':
+            key = ((path[1] == 'public' and 'publicIPs') or 'privateIPs')
+            self.record.setdefault(key, []).append(attrs.get('addr', ''))
+
+    def text(self, path, data):
+        if path == ['metadata', 'meta']: self.metaText.append(data)
+
+    def endChild(self, path):
+        if path == ['metadata', 'meta']:
+            self.record.setdefault('metadata', {})[self.metaKey] = ''.join(self.metaText) or None
+            self.metaText = None
+
+    def finishRecord(self, record):
+        return (self.serverClass or recordTypes['server'])(**record)
+
 class SharedIP(APIObject):
     simpleAttributes = ['configureServer']
     integerAttributes = ['sharedIpGroupId']
@@ -284,8 +921,15 @@ class SharedIP(APIObject):
                 node.setAttribute(attr, str(getattr(self, attr)))
         return node
 
+    def toXMLString(self):
+        return xmlString(xmlElement('shareIp', self.xmlAttributeValues()))
 
-class SharedIPGroup(APIObject):
+
+class BaseSharedIPGroup(APIObject):
+    """
+    Behavior common to SharedIPGroup and its compact variants; see SharedIPGroup.
+    """
+    __slots__ = ()
     simpleAttributes = ['name']
     integerAttributes = ['id']
     xmlAttributes = ['name', 'id']
@@ -296,7 +940,7 @@ class SharedIPGroup(APIObject):
         if kwargs.has_key('server_id'): servers[kwargs['server_id']] = 1
         servers = servers.keys()
         servers.sort()
-        self.servers = servers
+        object.__setattr__(self, 'servers', servers)
 
     def _XMLifyServer(self, id):
         server = minidom.Element('server')
@@ -320,6 +964,12 @@ class SharedIPGroup(APIObject):
             node.appendChild(servers)
         return node
 
+    def toXMLString(self):
+        servers = [xmlElement('server', {'id': id}) for id in self.servers]
+        if len(servers) > 1:
+            servers = [xmlElement('servers', {}, ''.join(servers))]
+        return xmlString(xmlElement('sharedIpGroup', self.xmlAttributeValues(), ''.join(servers)))
+
     @classmethod
     def fromXML(self, xml):
         hash = dict([(str(attr.name), attr.value) for attr in xml.attributes.values()])
@@ -332,3 +982,58 @@ class SharedIPGroup(APIObject):
         if servers: hash['servers'] = servers
         return self(**hash)
 
+class SharedIPGroup(BaseSharedIPGroup):
+    pass
+
+class CompactSharedIPGroup(BaseSharedIPGroup):
+    __slots__ = tuple(BaseSharedIPGroup.simpleAttributes + BaseSharedIPGroup.integerAttributes + ['servers'])
+
+FrozenSharedIPGroup = records.frozen(CompactSharedIPGroup, 'FrozenSharedIPGroup')
+
+# The classes the api functions build their results from.  By default servers and
+# shared IP groups are dictionary-backed objects and images, flavors and IPs are plain
+# dictionaries; compactRecordTypes and frozenRecordTypes are slotted records, which
+# take a fraction of the memory for large inventories.
+#
+# A connection whose recordTypes attribute is set builds that connection's results
+# from it; any other uses the process-wide recordTypes, which useCompactRecords()
+# and useStandardRecords() change for every such connection at once.  Switching
+# those while other threads are making requests gives them a mix of record types,
+# so call them during start-up, or set recordTypes on the connection instead.  The
+# *FromXML functions take the record types as an optional argument likewise.
+recordTypes = {}
+
+standardRecordTypes = {
+    'server': Server,
+    'sharedIpGroup': SharedIPGroup,
+    'image': dict,
+    'flavor': dict,
+    'ip': dict,
+}
+
+compactRecordTypes = {
+    'server': CompactServer,
+    'sharedIpGroup': CompactSharedIPGroup,
+    'image': records.Image,
+    'flavor': records.Flavor,
+    'ip': records.PublicIP,
+}
+
+frozenRecordTypes = {
+    'server': FrozenServer,
+    'sharedIpGroup': FrozenSharedIPGroup,
+    'image': records.FrozenImage,
+    'flavor': records.FrozenFlavor,
+    'ip': records.FrozenPublicIP,
+}
+
+def recordTypesFor(conn):
+    return getattr(conn, 'recordTypes', None) or recordTypes
+
+def useCompactRecords(frozen=False):
+    recordTypes.update((frozen and frozenRecordTypes) or compactRecordTypes)
+
+def useStandardRecords():
+    recordTypes.update(standardRecordTypes)
+
+useStandardRecords()
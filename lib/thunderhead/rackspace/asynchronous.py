@@ -0,0 +1,503 @@
+##  Copyright (c) 2009-2010 Ethan Rowe (ethan@endpoint.com)
+##  For more information, see http://github.com/ethanrowe/thunderhead
+##
+##  This file is part of Thunderhead.
+##
+##  Thunderhead is free software: you can redistribute it and/or modify
+##  it under the terms of the GNU General Public License as published by
+##  the Free Software Foundation, either version 3 of the License, or
+##  (at your option) any later version.
+##
+##  Thunderhead is distributed in the hope that it will be useful,
+##  but WITHOUT ANY WARRANTY; without even the implied warranty of
+##  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##  GNU General Public License for more details.
+##
+##  You should have received a copy of the GNU General Public License
+##  along with Thunderhead.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+NAME
+    thunderhead.rackspace.asynchronous
+
+DESCRIPTION
+    Non-blocking counterparts to BoundConnection, Authorization and the api functions,
+    built on the standard library's asyncore event loop.
+
+    Every request returns an AsyncResult immediately; the work happens as the asyncore
+    loop runs, whether driven by AsyncResult.wait() or by an application's own
+    asyncore.loop() over the same socket map.  Each AsyncBoundConnection keeps up to
+    maxConnections keep-alive HTTP/1.1 connections open and queues any requests beyond
+    that, so many requests can be in flight from a single thread.
+
+    Responses go through the same parsing and fault handling as BoundConnection, and the
+    api functions here produce the same Server/SharedIPGroup objects and dictionaries as
+    their blocking equivalents in thunderhead.rackspace.api.
+
+        auth = AsyncAuthorization.authorize(name, key).wait()
+        pending = [deleteServer(auth.serverManager, id) for id in ids]
+        gather(pending).wait()
+
+    Requires Python 2.6 or later (for the asynchat socket map and the ssl module).
+    Host names are resolved with a blocking lookup when a connection is opened.
+"""
+
+import asyncore, asynchat, socket, sys, time
+from collections import deque
+from thunderhead.rackspace import api, exceptions, urlparse, BoundConnection, Authorization
+
+try:
+    import ssl
+except ImportError:
+    ssl = None
+
+class AsyncResult(object):
+    """
+    The eventual outcome of an asynchronous operation: either a value or an exception.
+
+    Callbacks added with addCallback() receive the AsyncResult itself once it is done.
+    then() derives a new AsyncResult by applying a function to the value (exceptions pass
+    straight through); if the function returns another AsyncResult, the derived result
+    follows that one instead.
+    """
+    pollInterval = 0.05
+
+    def __init__(self, map=None):
+        self.map = map
+        self.done = False
+        self.value = None
+        self.exception = None
+        self.callbacks = []
+
+    def addCallback(self, func):
+        if self.done:
+            func(self)
+        else:
+            self.callbacks.append(func)
+        return self
+
+    def succeed(self, value):
+        self.finish(value, None)
+
+    def fail(self, exception):
+        self.finish(None, exception)
+
+    def finish(self, value, exception):
+        if self.done: return
+        self.done = True
+        self.value = value
+        self.exception = exception
+        callbacks, self.callbacks = self.callbacks, []
+        for callback in callbacks:
+            callback(self)
+
+    def follow(self, other):
+        other.addCallback(lambda (source): self.finish(source.value, source.exception))
+
+    def then(self, func):
+        result = AsyncResult(self.map)
+        def chain(source):
+            if source.exception is not None:
+                result.fail(source.exception)
+                return
+            try:
+                value = func(source.value)
+            except Exception, e:
+                result.fail(e)
+            else:
+                if isinstance(value, AsyncResult):
+                    result.follow(value)
+                else:
+                    result.succeed(value)
+        self.addCallback(chain)
+        return result
+
+    def get(self):
+        if self.exception is not None: raise self.exception
+        return self.value
+
+    def wait(self, timeout=None):
+        """
+        Run the asyncore loop until this result is done, then return its value
+        (or raise its exception).
+        """
+        map = self.map
+        if map is None: map = asyncore.socket_map
+        deadline = None
+        if timeout is not None: deadline = time.time() + timeout
+        while not self.done:
+            if not map:
+                raise exceptions.ConnectionClosedException('Nothing in progress to complete the request')
+            poll = self.pollInterval
+            if deadline is not None:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    raise exceptions.RequestTimeoutException('Request incomplete after ' + str(timeout) + ' seconds')
+                poll = min(poll, remaining)
+            asyncore.loop(timeout=poll, map=map, count=1)
+        return self.get()
+
+def gather(results, map=None):
+    """
+    Combine a list of AsyncResults into one whose value is the list of their values,
+    in order; it fails with the first exception encountered.
+    """
+    results = list(results)
+    combined = AsyncResult((results and results[0].map) or map)
+    state = {'remaining': len(results)}
+    def collect(source):
+        if source.exception is not None:
+            combined.fail(source.exception)
+            return
+        state['remaining'] -= 1
+        if not state['remaining']:
+            combined.succeed([r.value for r in results])
+    if not results: combined.succeed([])
+    for result in results:
+        result.addCallback(collect)
+    return combined
+
+class Response(object):
+    def __init__(self, status, headers, body):
+        self.status = status
+        self.headers = headers
+        self.body = body
+
+    def getheader(self, name, default=None):
+        return self.headers.get(name.lower(), default)
+
+class PendingRequest(object):
+    def __init__(self, method, path, body, headers, result):
+        self.method = method
+        self.path = path
+        self.body = body
+        self.headers = headers
+        self.result = result
+        self.retried = False
+
+    def serialize(self):
+        lines = [self.method + ' ' + self.path + ' HTTP/1.1']
+        for name, value in self.headers.iteritems():
+            lines.append(name + ': ' + str(value))
+        return '\r\n'.join(lines) + '\r\n\r\n' + (self.body or '')
+
+class HTTPChannel(asynchat.async_chat):
+    """
+    A single keep-alive HTTP/1.1 connection, carrying one request at a time on behalf
+    of an AsyncBoundConnection.
+    """
+    def __init__(self, owner, map=None):
+        asynchat.async_chat.__init__(self, map=map)
+        self.owner = owner
+        self.current = None
+        self.served = 0
+        self.received = False
+        self.handshaking = False
+        self.create_socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.connect((owner.host, owner.port or owner.defaultPort()))
+
+    def start(self, request):
+        self.current = request
+        self.received = False
+        self.state = 'Headers'
+        self.buffer = []
+        self.set_terminator('\r\n\r\n')
+        self.push(request.serialize())
+
+    def handle_connect(self):
+        if self.owner.scheme == 'https':
+            if ssl is None: raise exceptions.RackspaceException('HTTPS requires the ssl module')
+            self.socket = ssl.wrap_socket(self.socket, do_handshake_on_connect=False)
+            self.handshaking = True
+            self.handshake()
+
+    def handshake(self):
+        try:
+            self.socket.do_handshake()
+        except ssl.SSLError, e:
+            if e.args[0] in (ssl.SSL_ERROR_WANT_READ, ssl.SSL_ERROR_WANT_WRITE): return
+            raise
+        self.handshaking = False
+        self.initiate_send()
+
+    def handle_read(self):
+        if self.handshaking: return self.handshake()
+        asynchat.async_chat.handle_read(self)
+        # decrypted data may be buffered inside the SSL object, invisible to select()
+        while self.handshaking is False and self.connected and hasattr(self.socket, 'pending') and self.socket.pending():
+            asynchat.async_chat.handle_read(self)
+
+    def handle_write(self):
+        if self.handshaking: return self.handshake()
+        asynchat.async_chat.handle_write(self)
+
+    def collect_incoming_data(self, data):
+        self.received = True
+        self.buffer.append(data)
+
+    def takeBuffer(self):
+        data = ''.join(self.buffer)
+        self.buffer = []
+        return data
+
+    def found_terminator(self):
+        getattr(self, 'read' + self.state)()
+
+    def readHeaders(self):
+        lines = self.takeBuffer().split('\r\n')
+        status = lines[0].split(None, 2)
+        self.version = status[0]
+        self.status = int(status[1])
+        self.headers = {}
+        for line in lines[1:]:
+            if ':' in line:
+                name, value = line.split(':', 1)
+                self.headers[name.strip().lower()] = value.strip()
+        length = self.headers.get('content-length')
+        if self.current.method == 'HEAD' or self.status in (204, 304) or self.status < 200:
+            self.finishResponse()
+        elif self.headers.get('transfer-encoding', '').lower() == 'chunked':
+            self.body = []
+            self.state = 'ChunkSize'
+            self.set_terminator('\r\n')
+        elif length is not None:
+            if int(length):
+                self.state = 'Body'
+                self.set_terminator(int(length))
+            else:
+                self.finishResponse()
+        else:
+            # no framing; the body runs until the server closes the connection
+            self.state = 'Unframed'
+            self.set_terminator(None)
+
+    def readBody(self):
+        self.finishResponse(self.takeBuffer())
+
+    def readChunkSize(self):
+        size = int(self.takeBuffer().split(';', 1)[0].strip() or '0', 16)
+        if size:
+            self.state = 'Chunk'
+            self.set_terminator(size)
+        else:
+            self.state = 'Trailer'
+            self.set_terminator('\r\n')
+
+    def readChunk(self):
+        self.body.append(self.takeBuffer())
+        self.state = 'ChunkEnd'
+        self.set_terminator('\r\n')
+
+    def readChunkEnd(self):
+        self.takeBuffer()
+        self.state = 'ChunkSize'
+
+    def readTrailer(self):
+        if not self.takeBuffer():
+            self.finishResponse(''.join(self.body))
+
+    def keepAlive(self):
+        connection = self.headers.get('connection', '').lower()
+        if self.version == 'HTTP/1.0': return connection == 'keep-alive'
+        return connection != 'close'
+
+    def finishResponse(self, body=''):
+        request, self.current = self.current, None
+        self.served += 1
+        response = Response(self.status, self.headers, body)
+        if self.keepAlive():
+            self.owner.channelIdle(self)
+        else:
+            self.close()
+            self.owner.channelClosed(self, None, None)
+        request.result.succeed(response)
+
+    def handle_close(self):
+        if self.current and self.state == 'Headers' and self.buffer:
+            # the server closed without finishing the header block; as httplib does,
+            # take what arrived as the complete set of headers
+            self.readHeaders()
+        if self.current and self.state == 'Unframed':
+            self.close()
+            self.owner.channelClosed(self, None, None)
+            request, self.current = self.current, None
+            request.result.succeed(Response(self.status, self.headers, self.takeBuffer()))
+            return
+        self.abandon(exceptions.ConnectionClosedException('Connection closed by server'))
+
+    def handle_error(self):
+        error = sys.exc_info()[1]
+        if ssl and isinstance(error, ssl.SSLError) and error.args[0] in (ssl.SSL_ERROR_WANT_READ, ssl.SSL_ERROR_WANT_WRITE):
+            return
+        self.abandon(error)
+
+    def abandon(self, error):
+        self.close()
+        request, self.current = self.current, None
+        # a request that went out over a previously-used connection, and got nothing back,
+        # most likely hit a connection the server had already dropped; it may be retried.
+        self.owner.channelClosed(self, request, error, self.served > 0 and not self.received)
+
+class AsyncBoundConnection(BoundConnection):
+    """
+    NAME
+        AsyncBoundConnection
+
+    DESCRIPTION
+        The non-blocking counterpart of BoundConnection: request() returns an AsyncResult
+        for the usual (body, code) pair, or for the fault exception.
+
+        Up to maxConnections connections are opened to the service on demand; requests
+        beyond that wait in a queue for the next free connection.  As with
+        BoundConnection, a request that fails because a reused connection had gone
+        stale is retried once on a new connection.
+    """
+    maxConnections = 8
+
+    def __init__(self, url, headers, maxConnections=None, map=None):
+        request = urlparse(url)
+        self.scheme = request.scheme
+        self.host = request.hostname
+        self.port = request.port
+        self.pathPrefix = request.path
+        self.headers = headers
+        self.map = map
+        if maxConnections: self.maxConnections = maxConnections
+        self.pending = deque()
+        self.channels = []
+        self.idleChannels = []
+        self.requestCount = 0
+        self.reuseCount = 0
+        self.reconnectCount = 0
+
+    def defaultPort(self):
+        return (self.scheme == 'https' and 443) or 80
+
+    def hostHeader(self):
+        return self.host + ((self.port and ':' + str(self.port)) or '')
+
+    def rawRequest(self, method, url, body=None, headers={}):
+        """
+        Issue a request, returning an AsyncResult for the unparsed Response.
+        """
+        mergedHeaders = self.mergeHeaders(headers)
+        if body:
+            body = self.serializeBody(body)
+            mergedHeaders['Content-Type'] = 'application/xml'
+        mergedHeaders['Host'] = self.hostHeader()
+        mergedHeaders['Content-Length'] = len(body or '')
+        result = AsyncResult(self.map)
+        self.pending.append(PendingRequest(method, (self.pathPrefix + url) or '/', body, mergedHeaders, result))
+        self.dispatch()
+        return result
+
+    def request(self, method, url, body=None, headers={}):
+        return self.rawRequest(method, url, body, headers).then(self.handleResponse)
+
+    def handleResponse(self, resp):
+        return self.parseResponse(resp.status, resp.getheader('content-type', ''), resp.body)
+
+    def dispatch(self):
+        while self.pending:
+            if self.idleChannels:
+                channel = self.idleChannels.pop()
+                self.reuseCount += 1
+            elif len(self.channels) < self.maxConnections:
+                channel = HTTPChannel(self, self.map)
+                self.channels.append(channel)
+            else:
+                return
+            self.requestCount += 1
+            channel.start(self.pending.popleft())
+
+    def channelIdle(self, channel):
+        self.idleChannels.append(channel)
+        self.dispatch()
+
+    def channelClosed(self, channel, request, error, retry=False):
+        if channel in self.channels: self.channels.remove(channel)
+        if channel in self.idleChannels: self.idleChannels.remove(channel)
+        if request:
+            if retry and not request.retried:
+                request.retried = True
+                self.reconnectCount += 1
+                self.pending.appendleft(request)
+            else:
+                request.result.fail(error)
+        self.dispatch()
+
+    def close(self):
+        for channel in self.channels[::]:
+            channel.close()
+        self.channels = []
+        self.idleChannels = []
+
+class AsyncAuthorization(Authorization):
+    """
+    NAME
+        AsyncAuthorization
+
+    DESCRIPTION
+        The non-blocking counterpart of Authorization.  Use the authorize() class method,
+        which returns an AsyncResult for the AsyncAuthorization; its serverManager,
+        storage and cdn members are AsyncBoundConnections, each allowed poolSize
+        concurrent connections.
+    """
+    def __init__(self, response, map=None):
+        self.map = map
+        self.bindResponse(response)
+
+    def getBoundConnection(self, url):
+        return AsyncBoundConnection(url, {'X-Auth-Token': self.authToken}, self.poolSize, self.map)
+
+    @classmethod
+    def authorize(self, name, key, map=None):
+        connection = AsyncBoundConnection(self.baseURL, {}, 1, map)
+        def bind(response):
+            connection.close()
+            if response.status == 401: raise exceptions.BadCredentialsException()
+            return self(response, map)
+        return connection.rawRequest('GET', '', None, {'X-Auth-User': name, 'X-Auth-Key': key}).then(bind)
+
+def parser(conn, parse):
+    """
+    <parse> (an api *FromXML function) bound to <conn>'s record types.
+    """
+    types = api.recordTypesFor(conn)
+    return lambda data: parse(data, types)
+
+def responseBody(result):
+    return result[0]
+
+def responseCode(result):
+    return result[1]
+
+def getServers(conn, since=None):
+    return conn.request('GET', '/servers/detail' + api.queryString(since)).then(responseBody).then(parser(conn, api.serversFromXML))
+
+def createServer(conn, server):
+    return conn.request('POST', '/servers', server.toXMLString()).then(responseBody).then(parser(conn, api.serverFromXML))
+
+def deleteServer(conn, server):
+    return conn.request('DELETE', '/servers/' + str(getattr(server, 'id', server))).then(lambda (result): True)
+
+def getPublicIPs(conn, server):
+    return conn.request('GET', '/servers/' + str(getattr(server, 'id', server)) + '/ips/public').then(responseBody).then(parser(conn, api.publicIPsFromXML))
+
+def shareIP(conn, sharedip, serverId, address):
+    return conn.request('PUT', '/servers/' + str(serverId) + '/ips/public/' + address, sharedip.toXMLString()).then(responseCode)
+
+def getSharedIPGroups(conn, since=None):
+    return conn.request('GET', '/shared_ip_groups' + api.queryString(since)).then(responseBody).then(parser(conn, api.sharedIPGroupsFromXML))
+
+def createSharedIPGroup(conn, sharedipgroup):
+    return conn.request('POST', '/shared_ip_groups', sharedipgroup.toXMLString()).then(responseBody)
+
+def deleteSharedIPGroup(conn, group):
+    return conn.request('DELETE', '/shared_ip_groups/' + str(group)).then(responseCode)
+
+def getFlavors(conn, since=None):
+    return conn.request('GET', '/flavors/detail' + api.queryString(since)).then(responseBody).then(parser(conn, api.flavorsFromXML))
+
+def getImages(conn, since=None):
+    return conn.request('GET', '/images/detail' + api.queryString(since)).then(responseBody).then(parser(conn, api.imagesFromXML))
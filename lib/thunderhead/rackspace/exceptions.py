@@ -16,6 +16,8 @@
 ##  You should have received a copy of the GNU General Public License
 ##  along with Thunderhead.  If not, see <http://www.gnu.org/licenses/>.
 
+import time, calendar
+
 _typeRegistry = {}
 
 def registerHandler(type, klass):
@@ -25,13 +27,42 @@ def registerHandler(type, klass):
 def handlerFor(type):
     return ((_typeRegistry.has_key(type) and _typeRegistry[type]) or None)
 
-def throw(type, *args):
+def throw(type, *args, **attributes):
     klass = handlerFor(type) or UnknownExceptionType
-    raise klass(*args)
+    exception = klass(*args)
+    for name, value in attributes.iteritems():
+        setattr(exception, name, value)
+    raise exception
+
+class RackspaceException(Exception):
+    # the fault's retryAfter attribute, if any: either a count of seconds or
+    # a UTC timestamp (e.g. "2010-08-01T00:00:00Z")
+    retryAfter = None
+
+    def retryDelay(self, now=None):
+        """
+        Seconds to wait before retrying, per the fault's retryAfter hint, or None
+        if the fault gave no (intelligible) hint.
+        """
+        hint = self.retryAfter
+        if not hint: return None
+        try:
+            return max(0, float(hint))
+        except ValueError:
+            pass
+        try:
+            when = calendar.timegm(time.strptime(str(hint).strip(), '%Y-%m-%dT%H:%M:%SZ'))
+        except ValueError:
+            return None
+        return max(0, when - (now or time.time()))
 
-class RackspaceException(Exception): pass
 class BadCredentialsException(RackspaceException): pass
 class UnknownExceptionType(RackspaceException): pass
+class PoolTimeoutException(RackspaceException): pass
+class RequestTimeoutException(RackspaceException): pass
+class ConnectionClosedException(RackspaceException): pass
+class WaitTimeoutException(RackspaceException): pass
+class RateLimitException(RackspaceException): pass
 
 # base list of Rackspace Cloud Servers faults; each maps
 # to a similarly-named exception (e.g. "cloudServersFault" => "CloudServersFaultException")
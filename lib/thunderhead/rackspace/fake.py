@@ -0,0 +1,585 @@
+##  Copyright (c) 2009-2010 Ethan Rowe (ethan@endpoint.com)
+##  For more information, see http://github.com/ethanrowe/thunderhead
+##
+##  This file is part of Thunderhead.
+##
+##  Thunderhead is free software: you can redistribute it and/or modify
+##  it under the terms of the GNU General Public License as published by
+##  the Free Software Foundation, either version 3 of the License, or
+##  (at your option) any later version.
+##
+##  Thunderhead is distributed in the hope that it will be useful,
+##  but WITHOUT ANY WARRANTY; without even the implied warranty of
+##  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##  GNU General Public License for more details.
+##
+##  You should have received a copy of the GNU General Public License
+##  along with Thunderhead.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+NAME
+    thunderhead.rackspace.fake
+
+DESCRIPTION
+    A stateful, in-memory stand-in for the Cloud Servers API, for load and soak
+    testing without touching the real cloud.
+
+    A FakeService keeps servers, images, flavors and shared IP groups, and answers
+    requests given as (method, path, headers, body) with (status, headers, body).
+    FakeHTTPServer puts one behind a threaded HTTP/1.1 server; point an
+    Authorization's baseURL at its authURL().
+
+    Beyond canned responses, the service:
+    * issues tokens and rejects requests without a current one, so expireTokens()
+      exercises re-authentication
+    * honors changes-since on the servers, images and shared IP group lists,
+      returning DELETED tombstones for removed servers and images (shared IP groups
+      have no status to carry one)
+    * builds new servers: status BUILD, with progress rising to 100 over buildTime
+      seconds and then ACTIVE; each step counts as a change
+    * injects the faults named in exceptions.faultList, at random per request
+      (faultRates, e.g. {'overLimit': 0.01}) or on demand (injectFault())
+
+    Time comes from "clock" (see thunderhead.clock), so a ManualClock can drive
+    builds and changes-since.  Besides the HTTP interface, addServer, updateServer,
+    removeServer, addImage and removeImage change the state directly, to seed large
+    inventories or simulate activity from elsewhere.  The service is thread-safe.
+
+    FakeHTTPServer requires Python 2.6 or later (for SocketServer's shutdown()), and
+    disables Nagle's algorithm on its connections only from Python 2.7; FakeService
+    alone, as used with transport.InMemoryTransport, has no such requirement.
+"""
+
+import re, random, threading, time
+import xml.dom.minidom as minidom
+import BaseHTTPServer, SocketServer
+from thunderhead.clock import systemClock
+from thunderhead.rackspace import api, exceptions
+
+# the status each fault is returned with
+faultCodes = {
+    'cloudServersFault': 500,
+    'serviceUnavailable': 503,
+    'unauthorized': 401,
+    'badRequest': 400,
+    'overLimit': 413,
+    'badMediaType': 415,
+    'badMethod': 405,
+    'itemNotFound': 404,
+    'buildInProgress': 409,
+    'serverCapacityUnavailable': 503,
+    'backupOrResizeInProgress': 409,
+    'resizeNotAllowed': 403,
+    'notImplemented': 501,
+}
+
+xmlHeaders = {'Content-Type': 'application/xml'}
+
+defaultFlavors = [
+    {'id': i + 1, 'name': '%d MB Server' % (256 << i), 'ram': 256 << i, 'disk': 10 << i}
+    for i in range(7)
+]
+
+defaultImages = ['CentOS 5.4', 'Debian 5.0 (lenny)', 'Fedora 13', 'Ubuntu 10.04 LTS (lucid)']
+
+class Fault(Exception):
+    """
+    Raised by a request handler to answer with the fault named <fault>.
+    """
+    def __init__(self, fault, message, details=None, retryAfter=None):
+        Exception.__init__(self, fault, message)
+        if fault not in exceptions.faultList: raise ValueError('unknown fault: ' + fault)
+        self.fault = fault
+        self.message = message
+        self.details = details
+        self.retryAfter = retryAfter
+
+    def response(self):
+        attributes = {'xmlns': api.xmlns, 'code': faultCodes[self.fault]}
+        if self.retryAfter: attributes['retryAfter'] = self.retryAfter
+        content = api.xmlElement('message', {}, api.escapeText(self.message))
+        if self.details: content += api.xmlElement('details', {}, api.escapeText(self.details))
+        return (faultCodes[self.fault], xmlHeaders, api.xmlString(api.xmlElement(self.fault, attributes, content)))
+
+def header(headers, name):
+    """
+    Look up <name> in <headers>, either a mimetools.Message or a dictionary.
+    """
+    if hasattr(headers, 'getheader'): return headers.getheader(name)
+    name = name.lower()
+    for key, value in headers.iteritems():
+        if key.lower() == name: return value
+    return None
+
+def routeArgument(value):
+    if value.isdigit(): return int(value)
+    return value
+
+def documentElement(body):
+    try:
+        return minidom.parseString(body).documentElement
+    except Exception:
+        raise Fault('badRequest', 'Malformed request body')
+
+def listDocument(tag, items):
+    return api.xmlString(api.xmlElement(tag, {'xmlns': api.xmlns}, ''.join(items)))
+
+class FakeService(object):
+    """
+    NAME
+        FakeService
+
+    DESCRIPTION
+        The state and request handling of the fake API; see the module description.
+
+        Settings:
+        * buildTime: seconds a new server takes to become ACTIVE
+        * faultRates: fault name to the probability of any request raising it
+        * retryAfter: seconds ahead of now that overLimit faults say to retry (None
+          for no hint)
+        * authPath, managementPath: where authentication and the API are served
+        * credentials: user name to key; None accepts any credentials
+
+        Counters:
+        * requestCount: requests handled, faulted or not
+        * faultCounts: faults returned, by name
+    """
+    buildTime = 60
+    retryAfter = 1
+    authPath = '/v1.0'
+    managementPath = '/v1.0/1000'
+    baseURL = 'http://localhost'
+    credentials = None
+
+    routes = [
+        ('GET', r'/servers/detail', 'listServers'),
+        ('GET', r'/servers/(\d+)', 'showServer'),
+        ('POST', r'/servers', 'createServer'),
+        ('DELETE', r'/servers/(\d+)', 'deleteServer'),
+        ('GET', r'/servers/(\d+)/ips/public', 'showPublicIPs'),
+        ('PUT', r'/servers/(\d+)/ips/public/([\d.]+)', 'shareIP'),
+        ('GET', r'/images/detail', 'listImages'),
+        ('POST', r'/images', 'createImage'),
+        ('DELETE', r'/images/(\d+)', 'deleteImage'),
+        ('GET', r'/flavors/detail', 'listFlavors'),
+        ('GET', r'/shared_ip_groups(?:/detail)?', 'listSharedIPGroups'),
+        ('POST', r'/shared_ip_groups', 'createSharedIPGroup'),
+        ('DELETE', r'/shared_ip_groups/(\d+)', 'deleteSharedIPGroup'),
+    ]
+
+    def __init__(self, clock=None, seed=None, faultRates=None, images=None, flavors=None):
+        self.clock = clock or systemClock
+        self.random = random.Random(seed)
+        self.faultRates = {}
+        for fault, rate in (faultRates or {}).iteritems():
+            self.setFaultRate(fault, rate)
+        self.lock = threading.RLock()
+        self.compiledRoutes = [(method, re.compile(pattern + r'\Z'), action) for (method, pattern, action) in self.routes]
+        self.servers = {}
+        self.images = {}
+        self.groups = {}
+        self.flavors = dict([(flavor['id'], dict(flavor)) for flavor in (flavors or defaultFlavors)])
+        # id to the wall-clock time of its last change, and of removal for tombstones
+        self.changed = {'servers': {}, 'images': {}, 'groups': {}}
+        self.deleted = {'servers': {}, 'images': {}}
+        # id of each building server to the wall-clock time its build started
+        self.building = {}
+        self.lastIds = {'servers': 0, 'images': 0, 'groups': 0}
+        self.tokens = {}
+        self.queuedFaults = []
+        self.requestCount = 0
+        self.faultCounts = {}
+        if images is None: images = defaultImages
+        for name in images:
+            self.addImage(name)
+
+    def setFaultRate(self, fault, rate):
+        if fault not in exceptions.faultList: raise ValueError('unknown fault: ' + fault)
+        self.faultRates[fault] = rate
+
+    def injectFault(self, fault, count=1):
+        """
+        Answer the next <count> API requests with <fault>.
+        """
+        if fault not in exceptions.faultList: raise ValueError('unknown fault: ' + fault)
+        self.lock.acquire()
+        try:
+            self.queuedFaults.extend([fault] * count)
+        finally:
+            self.lock.release()
+
+    def expireTokens(self):
+        self.lock.acquire()
+        try:
+            self.tokens.clear()
+        finally:
+            self.lock.release()
+
+    def now(self):
+        return self.clock.wallTime()
+
+    def nextId(self, kind):
+        self.lastIds[kind] += 1
+        return self.lastIds[kind]
+
+    def touch(self, kind, id):
+        self.changed[kind][id] = self.now()
+
+    # requests
+
+    def handle(self, method, path, headers, body):
+        self.lock.acquire()
+        try:
+            self.requestCount += 1
+            try:
+                if path.split('?')[0] == self.authPath: return self.authenticate(headers)
+                prefix = self.managementPath + '/'
+                if not path.startswith(prefix): raise Fault('itemNotFound', 'No such resource')
+                self.authorize(headers)
+                self.checkFaults()
+                self.advance()
+                return self.route(method, path[len(prefix) - 1:], body)
+            except Fault, fault:
+                self.faultCounts[fault.fault] = self.faultCounts.get(fault.fault, 0) + 1
+                return fault.response()
+        finally:
+            self.lock.release()
+
+    def authenticate(self, headers):
+        user, key = header(headers, 'X-Auth-User'), header(headers, 'X-Auth-Key')
+        if not user or (self.credentials is not None and self.credentials.get(user) != key):
+            return (401, {}, '')
+        token = '%032x' % self.random.getrandbits(128)
+        self.tokens[token] = user
+        return (204, {
+            'X-Auth-Token': token,
+            'X-Server-Management-URL': self.baseURL + self.managementPath,
+            'X-Storage-URL': self.baseURL + '/storage',
+            'X-CDN-Management-URL': self.baseURL + '/cdn',
+        }, '')
+
+    def authorize(self, headers):
+        if not self.tokens.has_key(header(headers, 'X-Auth-Token')):
+            raise Fault('unauthorized', 'Invalid or expired token')
+
+    def checkFaults(self):
+        fault = None
+        if self.queuedFaults:
+            fault = self.queuedFaults.pop(0)
+        else:
+            for name, rate in self.faultRates.iteritems():
+                if rate and self.random.random() < rate:
+                    fault = name
+                    break
+        if fault is None: return
+        retryAfter = None
+        if fault == 'overLimit' and self.retryAfter is not None:
+            retryAfter = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(self.now() + self.retryAfter))
+        raise Fault(fault, 'Injected ' + fault, retryAfter=retryAfter)
+
+    def route(self, method, path, body):
+        resource, query = (path.split('?', 1) + [''])[:2]
+        matched = False
+        for routeMethod, pattern, action in self.compiledRoutes:
+            match = pattern.match(resource)
+            if not match: continue
+            matched = True
+            if routeMethod == method:
+                args = [routeArgument(arg) for arg in match.groups()]
+                return getattr(self, action)(query=query, body=body, *args)
+        if matched: raise Fault('badMethod', 'Method not allowed')
+        raise Fault('itemNotFound', 'No such resource')
+
+    def since(self, query):
+        for pair in query.split('&'):
+            if pair.startswith('changes-since='):
+                try:
+                    return int(pair[len('changes-since='):])
+                except ValueError:
+                    raise Fault('badRequest', 'Invalid changes-since value')
+        return None
+
+    def changedSince(self, kind, records, since):
+        """
+        Records of <kind> (with tombstones, as (id, None)) changed at or after <since>,
+        or all current records when <since> is None.
+        """
+        if since is None:
+            ids = records.keys()
+            ids.sort()
+            return [(id, records[id]) for id in ids]
+        changed = self.changed[kind]
+        result = [(id, records[id]) for id in records.keys() if changed[id] >= since]
+        for id, when in self.deleted.get(kind, {}).iteritems():
+            if when >= since: result.append((id, None))
+        result.sort()
+        return result
+
+    def server(self, id):
+        if not self.servers.has_key(id): raise Fault('itemNotFound', 'Server not found')
+        return self.servers[id]
+
+    def serverXML(self, id, server):
+        if server is None: return api.Server(id=id, status='DELETED').toXMLString()
+        return server.toXMLString()
+
+    def listServers(self, query, body):
+        items = self.changedSince('servers', self.servers, self.since(query))
+        return (200, xmlHeaders, listDocument('servers', [self.serverXML(id, server) for id, server in items]))
+
+    def showServer(self, id, query, body):
+        return (200, xmlHeaders, self.server(id).toXMLString())
+
+    def createServer(self, query, body):
+        node = documentElement(body)
+        if node.nodeName != 'server': raise Fault('badRequest', 'Expected a server element')
+        name = node.getAttribute('name')
+        try:
+            imageId = int(node.getAttribute('imageId'))
+            flavorId = int(node.getAttribute('flavorId'))
+        except ValueError:
+            raise Fault('badRequest', 'imageId and flavorId are required')
+        metadata = dict([
+            (meta.getAttribute('key'), ''.join([text.data for text in meta.childNodes if text.nodeType == text.TEXT_NODE]))
+            for meta in node.getElementsByTagName('meta')
+        ])
+        groupId = node.getAttribute('sharedIpGroupId')
+        server = self.addServer(name, imageId, flavorId, metadata, groupId=(groupId and int(groupId)) or None)
+        created = api.Server(adminPass=name + 'SecretPass', **server.__dict__)
+        return (202, xmlHeaders, created.toXMLString())
+
+    def deleteServer(self, id, query, body):
+        self.server(id)
+        self.removeServer(id)
+        return (202, {}, '')
+
+    def showPublicIPs(self, id, query, body):
+        ips = [api.xmlElement('ip', {'addr': addr}) for addr in self.server(id).publicIPs]
+        return (200, xmlHeaders, api.xmlString(api.xmlElement('public', {'xmlns': api.xmlns}, ''.join(ips))))
+
+    def shareIP(self, id, address, query, body):
+        self.server(id)
+        node = documentElement(body)
+        try:
+            groupId = int(node.getAttribute('sharedIpGroupId'))
+        except ValueError:
+            raise Fault('badRequest', 'sharedIpGroupId is required')
+        if not self.groups.has_key(groupId): raise Fault('badRequest', 'Shared IP group not found')
+        self.joinGroup(groupId, id)
+        return (202, {}, '')
+
+    def listImages(self, query, body):
+        items = []
+        for id, image in self.changedSince('images', self.images, self.since(query)):
+            if image is None: image = {'id': id, 'status': 'DELETED'}
+            items.append(api.xmlElement('image', image))
+        return (200, xmlHeaders, listDocument('images', items))
+
+    def createImage(self, query, body):
+        node = documentElement(body)
+        try:
+            serverId = int(node.getAttribute('serverId'))
+        except ValueError:
+            raise Fault('badRequest', 'serverId is required')
+        self.server(serverId)
+        image = self.addImage(node.getAttribute('name'), serverId)
+        return (202, xmlHeaders, api.xmlString(api.xmlElement('image', dict(image, xmlns=api.xmlns))))
+
+    def deleteImage(self, id, query, body):
+        if not self.images.has_key(id): raise Fault('itemNotFound', 'Image not found')
+        self.removeImage(id)
+        return (204, {}, '')
+
+    def listFlavors(self, query, body):
+        ids = self.flavors.keys()
+        ids.sort()
+        return (200, xmlHeaders, listDocument('flavors', [api.xmlElement('flavor', self.flavors[id]) for id in ids]))
+
+    def listSharedIPGroups(self, query, body):
+        items = self.changedSince('groups', self.groups, self.since(query))
+        return (200, xmlHeaders, listDocument('sharedIpGroups', [group.toXMLString() for id, group in items if group]))
+
+    def createSharedIPGroup(self, query, body):
+        node = documentElement(body)
+        group = api.SharedIPGroup.fromXML(node)
+        if not getattr(group, 'name', None): raise Fault('badRequest', 'name is required')
+        for serverId in group.servers:
+            self.server(serverId)
+        id = self.nextId('groups')
+        self.groups[id] = api.SharedIPGroup(id=id, name=group.name, servers=group.servers)
+        self.touch('groups', id)
+        return (201, xmlHeaders, self.groups[id].toXMLString())
+
+    def deleteSharedIPGroup(self, id, query, body):
+        if not self.groups.has_key(id): raise Fault('itemNotFound', 'Shared IP group not found')
+        del self.groups[id]
+        del self.changed['groups'][id]
+        return (204, {}, '')
+
+    # direct state changes
+
+    def advance(self):
+        """
+        Move each building server's progress along to the present.
+        """
+        self.lock.acquire()
+        try:
+            now = self.now()
+            for id, started in self.building.items():
+                server = self.servers[id]
+                progress = min(100, int((now - started) * 100 / max(self.buildTime, 1)))
+                if progress == server.progress: continue
+                server.progress = progress
+                if progress == 100:
+                    server.status = 'ACTIVE'
+                    del self.building[id]
+                self.touch('servers', id)
+        finally:
+            self.lock.release()
+
+    def addServer(self, name, imageId, flavorId, metadata=None, status='BUILD', groupId=None):
+        """
+        Add a server, building unless <status> says otherwise; returns the api.Server.
+        """
+        self.lock.acquire()
+        try:
+            if not self.images.has_key(imageId): raise Fault('badRequest', 'Image not found')
+            if not self.flavors.has_key(flavorId): raise Fault('badRequest', 'Flavor not found')
+            if groupId is not None and not self.groups.has_key(groupId):
+                raise Fault('badRequest', 'Shared IP group not found')
+            id = self.nextId('servers')
+            progress = 100
+            if status == 'BUILD': progress = 0
+            server = api.Server(
+                id=id,
+                name=name or 'server-%d' % id,
+                imageId=imageId,
+                flavorId=flavorId,
+                status=status,
+                progress=progress,
+                hostId='%032x' % (id * 2654435761 % (1 << 128)),
+                publicIPs=['67.%d.%d.%d' % (23 + id / 65536 % 200, id / 256 % 256, id % 256)],
+                privateIPs=['10.%d.%d.%d' % (176 + id / 65536 % 64, id / 256 % 256, id % 256)],
+            )
+            if metadata: server.metadata = dict(metadata)
+            self.servers[id] = server
+            if status == 'BUILD': self.building[id] = self.now()
+            if groupId is not None: self.joinGroup(groupId, id)
+            self.touch('servers', id)
+            return server
+        finally:
+            self.lock.release()
+
+    def updateServer(self, id, **attributes):
+        """
+        Change a server's attributes (name, status, metadata and so on), as a change.
+        """
+        self.lock.acquire()
+        try:
+            server = self.server(id)
+            for name, value in attributes.iteritems():
+                setattr(server, name, value)
+            if attributes.has_key('status') and attributes['status'] != 'BUILD': self.building.pop(id, None)
+            self.touch('servers', id)
+            return server
+        finally:
+            self.lock.release()
+
+    def removeServer(self, id):
+        self.lock.acquire()
+        try:
+            del self.servers[id]
+            self.building.pop(id, None)
+            del self.changed['servers'][id]
+            self.deleted['servers'][id] = self.now()
+            for groupId, group in self.groups.items():
+                if id in group.servers:
+                    group.servers = [server for server in group.servers if server != id]
+                    self.touch('groups', groupId)
+        finally:
+            self.lock.release()
+
+    def joinGroup(self, groupId, serverId):
+        group = self.groups[groupId]
+        if serverId not in group.servers:
+            group.servers = group.servers + [serverId]
+            group.servers.sort()
+            self.touch('groups', groupId)
+
+    def addImage(self, name, serverId=None):
+        self.lock.acquire()
+        try:
+            id = self.nextId('images')
+            stamp = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(self.now()))
+            image = {'id': id, 'name': name, 'status': 'ACTIVE', 'created': stamp, 'updated': stamp}
+            if serverId is not None: image['serverId'] = serverId
+            self.images[id] = image
+            self.touch('images', id)
+            return image
+        finally:
+            self.lock.release()
+
+    def removeImage(self, id):
+        self.lock.acquire()
+        try:
+            del self.images[id]
+            del self.changed['images'][id]
+            self.deleted['images'][id] = self.now()
+        finally:
+            self.lock.release()
+
+class FakeHTTPHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # buffer each response, and send the last segment of a large one without waiting
+    # on Nagle's algorithm, which would otherwise stall against delayed ACKs (the
+    # latter honored by Python 2.7 and later; earlier versions ignore it)
+    wbufsize = -1
+    disable_nagle_algorithm = True
+
+    def respond(self):
+        length = int(self.headers.getheader('content-length') or 0)
+        body = (length and self.rfile.read(length)) or ''
+        if self.server.latency: time.sleep(self.server.latency)
+        status, headers, content = self.server.service.handle(self.command, self.path, self.headers, body)
+        self.send_response(status)
+        for name, value in headers.iteritems():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    do_GET = do_POST = do_PUT = do_DELETE = respond
+
+    def log_message(self, *args):
+        pass
+
+class FakeHTTPServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """
+    Serves <service> (anything with FakeService's handle()) over HTTP/1.1 on the
+    loopback interface, a thread per connection, each request delayed by <latency>
+    seconds.  start() serves from a daemon thread until stop().
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, service, latency=0, port=0):
+        BaseHTTPServer.HTTPServer.__init__(self, ('127.0.0.1', port), FakeHTTPHandler)
+        self.service = service
+        self.latency = latency
+        self.url = 'http://localhost:%d' % self.server_port
+        service.baseURL = self.url
+        self.thread = None
+
+    def authURL(self):
+        return self.url + self.service.authPath
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever)
+        self.thread.setDaemon(True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        self.thread.join()
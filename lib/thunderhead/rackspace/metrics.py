@@ -0,0 +1,343 @@
+##  Copyright (c) 2009-2010 Ethan Rowe (ethan@endpoint.com)
+##  For more information, see http://github.com/ethanrowe/thunderhead
+##
+##  This file is part of Thunderhead.
+##
+##  Thunderhead is free software: you can redistribute it and/or modify
+##  it under the terms of the GNU General Public License as published by
+##  the Free Software Foundation, either version 3 of the License, or
+##  (at your option) any later version.
+##
+##  Thunderhead is distributed in the hope that it will be useful,
+##  but WITHOUT ANY WARRANTY; without even the implied warranty of
+##  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##  GNU General Public License for more details.
+##
+##  You should have received a copy of the GNU General Public License
+##  along with Thunderhead.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+NAME
+    thunderhead.rackspace.metrics
+
+DESCRIPTION
+    Instrumentation of requests and api calls.
+
+    Observers are added to an Authorization (addObserver()), which shares them with
+    its connection pools, their connections and its RetryPolicy; a standalone
+    BoundConnection or ConnectionPool takes them in its "observers" list.  An
+    observer implements any of:
+    * requestFinished(timing): a request (one attempt of it) completed or failed,
+      described by a RequestTiming
+    * retryScheduled(method, exception, attempt, delay): RetryPolicy is about to wait
+      <delay> seconds and retry after a fault
+    * callFinished(timing): an api function returned or raised, described by a
+      CallTiming
+
+    A request's phases, in seconds, are "connect" (opening a connection, when one
+    was needed), "send", "wait" (for the response status and headers), "read" and
+    "parse".  Streamed responses are read, parsed and built into records a chunk at
+    a time as the caller iterates, and the request finishes when the stream does;
+    building records is timed as a "build" phase of its own, apart from "parse".
+    An api call's "build" time is what remains of its total after its requests
+    (their own "build" phases excepted): building results from parsed responses.
+
+    Aggregator is an observer keeping counters and latency histograms, for scraping
+    (snapshot()) or dumping (dump()) periodically.
+
+    Observers are called on the requesting thread, and must not raise.
+"""
+
+import sys, time, threading
+
+timer = time.time
+
+class RequestTiming(object):
+    """
+    One request: method and path (relative to the service URL), status (None if no
+    response arrived), fault (the fault name for fault responses), error (the class
+    name of any other exception), whether it reused an open connection, bytes sent
+    and received, and a dictionary of phase timings.
+    """
+    __slots__ = ('method', 'path', 'status', 'fault', 'error', 'reused', 'requestBytes', 'responseBytes', 'phases', 'started', 'finished')
+
+    def __init__(self, method, path, requestBytes=0):
+        self.method = method
+        self.path = path
+        self.status = None
+        self.fault = None
+        self.error = None
+        self.reused = False
+        self.requestBytes = requestBytes
+        self.responseBytes = 0
+        self.phases = {}
+        self.started = timer()
+        self.finished = None
+
+    def add(self, phase, seconds):
+        self.phases[phase] = self.phases.get(phase, 0) + seconds
+
+    def finish(self, exception=None):
+        self.finished = timer()
+        if exception is not None:
+            fault = getattr(exception, 'fault', None)
+            if fault: self.fault = fault
+            else: self.error = exception.__class__.__name__
+
+    def total(self):
+        return (self.finished or timer()) - self.started
+
+class CallTiming(object):
+    """
+    One api function call: its name, total and request time, the size of its result
+    (where it has one), and the class name of any exception it raised.
+    """
+    __slots__ = ('name', 'started', 'finished', 'requestTime', 'records', 'error')
+
+    def __init__(self, name):
+        self.name = name
+        self.started = timer()
+        self.finished = None
+        self.requestTime = 0
+        self.records = None
+        self.error = None
+
+    def total(self):
+        return (self.finished or timer()) - self.started
+
+    def build(self):
+        return max(0, self.total() - self.requestTime)
+
+current = threading.local()
+
+def notify(observers, event, *args):
+    for observer in observers:
+        handler = getattr(observer, event, None)
+        if handler: handler(*args)
+
+def requestFinished(observers, timing, exception=None):
+    timing.finish(exception)
+    call = getattr(current, 'call', None)
+    # records built as a stream is parsed count towards the call's build time
+    if call is not None: call.requestTime += timing.total() - timing.phases.get('build', 0)
+    notify(observers, 'requestFinished', timing)
+
+def instrumented(func):
+    """
+    Wrap the api function <func>, whose first argument is a connection, to report a
+    CallTiming to the connection's observers.
+    """
+    name = func.__name__
+    def wrapper(conn, *args, **kwargs):
+        observers = getattr(conn, 'observers', None)
+        if not observers: return func(conn, *args, **kwargs)
+        outer = getattr(current, 'call', None)
+        timing = current.call = CallTiming(name)
+        try:
+            try:
+                result = func(conn, *args, **kwargs)
+            except Exception, e:
+                timing.error = e.__class__.__name__
+                raise
+            if hasattr(result, '__len__'): timing.records = len(result)
+            return result
+        finally:
+            current.call = outer
+            timing.finished = timer()
+            if outer is not None: outer.requestTime += timing.total()
+            notify(observers, 'callFinished', timing)
+    wrapper.__name__ = name
+    wrapper.__doc__ = func.__doc__
+    wrapper.wrapped = func
+    return wrapper
+
+class Histogram(object):
+    """
+    Counts of observed values (seconds) in fixed, roughly logarithmic buckets, plus
+    count, sum, minimum and maximum.  Percentiles are estimated as the upper bound
+    of the bucket they fall in.
+    """
+    bounds = (
+        0.0005, 0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5,
+        1.0, 2.0, 5.0, 10.0, 20.0, 60.0,
+    )
+
+    def __init__(self):
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+
+    def observe(self, value):
+        index = 0
+        for bound in self.bounds:
+            if value <= bound: break
+            index += 1
+        self.counts[index] += 1
+        self.count += 1
+        self.sum += value
+        if self.min is None or value < self.min: self.min = value
+        if self.max is None or value > self.max: self.max = value
+
+    def percentile(self, fraction):
+        if not self.count: return None
+        rank = fraction * self.count
+        seen = 0
+        for index in range(len(self.counts)):
+            seen += self.counts[index]
+            if seen >= rank and self.counts[index]:
+                if index < len(self.bounds): return min(self.bounds[index], self.max)
+                return self.max
+        return self.max
+
+    def snapshot(self):
+        mean = None
+        if self.count: mean = self.sum / self.count
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'min': self.min,
+            'max': self.max,
+            'mean': mean,
+            'p50': self.percentile(0.5),
+            'p90': self.percentile(0.9),
+            'p99': self.percentile(0.99),
+            'buckets': zip(list(self.bounds) + [None], self.counts),
+        }
+
+def increment(counts, key, amount=1):
+    counts[key] = counts.get(key, 0) + amount
+
+class Aggregator(object):
+    """
+    NAME
+        Aggregator
+
+    DESCRIPTION
+        An observer accumulating request and api call metrics, safe to share among
+        threads and sessions.
+
+        snapshot() returns the current figures as a dictionary:
+        * requests, bytesSent, bytesReceived, reusedConnections: totals
+        * statuses, faults, errors, retries: counts by status code, fault name,
+          exception class and retried fault name
+        * phases: a Histogram snapshot for each request phase, and for "total"
+        * calls: for each api function, its count, errors, records returned and
+          Histogram snapshots of its "total" and "build" time
+
+        dump() writes the same as text; reset() starts over.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.lock.acquire()
+        try:
+            self.requests = 0
+            self.bytesSent = 0
+            self.bytesReceived = 0
+            self.reusedConnections = 0
+            self.statuses = {}
+            self.faults = {}
+            self.errors = {}
+            self.retries = {}
+            self.phases = {}
+            self.calls = {}
+        finally:
+            self.lock.release()
+
+    def histogram(self, table, name):
+        if not table.has_key(name): table[name] = Histogram()
+        return table[name]
+
+    def requestFinished(self, timing):
+        self.lock.acquire()
+        try:
+            self.requests += 1
+            self.bytesSent += timing.requestBytes
+            self.bytesReceived += timing.responseBytes
+            if timing.reused: self.reusedConnections += 1
+            if timing.status is not None: increment(self.statuses, timing.status)
+            if timing.fault: increment(self.faults, timing.fault)
+            if timing.error: increment(self.errors, timing.error)
+            for phase, seconds in timing.phases.iteritems():
+                self.histogram(self.phases, phase).observe(seconds)
+            self.histogram(self.phases, 'total').observe(timing.total())
+        finally:
+            self.lock.release()
+
+    def retryScheduled(self, method, exception, attempt, delay):
+        self.lock.acquire()
+        try:
+            increment(self.retries, getattr(exception, 'fault', exception.__class__.__name__))
+        finally:
+            self.lock.release()
+
+    def callFinished(self, timing):
+        self.lock.acquire()
+        try:
+            if not self.calls.has_key(timing.name):
+                self.calls[timing.name] = {'count': 0, 'errors': 0, 'records': 0, 'total': Histogram(), 'build': Histogram()}
+            call = self.calls[timing.name]
+            call['count'] += 1
+            if timing.error: call['errors'] += 1
+            if timing.records: call['records'] += timing.records
+            call['total'].observe(timing.total())
+            call['build'].observe(timing.build())
+        finally:
+            self.lock.release()
+
+    def snapshot(self):
+        self.lock.acquire()
+        try:
+            calls = {}
+            for name, call in self.calls.iteritems():
+                calls[name] = dict(call, total=call['total'].snapshot(), build=call['build'].snapshot())
+            return {
+                'requests': self.requests,
+                'bytesSent': self.bytesSent,
+                'bytesReceived': self.bytesReceived,
+                'reusedConnections': self.reusedConnections,
+                'statuses': dict(self.statuses),
+                'faults': dict(self.faults),
+                'errors': dict(self.errors),
+                'retries': dict(self.retries),
+                'phases': dict([(name, histogram.snapshot()) for name, histogram in self.phases.iteritems()]),
+                'calls': calls,
+            }
+        finally:
+            self.lock.release()
+
+    def dump(self, out=None):
+        out = out or sys.stdout
+        data = self.snapshot()
+        out.write('requests %(requests)d, sent %(bytesSent)d bytes, received %(bytesReceived)d bytes, '
+            '%(reusedConnections)d over reused connections\n' % data)
+        for label in ('statuses', 'faults', 'errors', 'retries'):
+            if data[label]:
+                items = data[label].items()
+                items.sort()
+                out.write('%s: %s\n' % (label, ', '.join(['%s=%d' % item for item in items])))
+        names = data['phases'].keys()
+        names.sort()
+        for name in names:
+            out.write(histogramLine('phase ' + name, data['phases'][name]))
+        names = data['calls'].keys()
+        names.sort()
+        for name in names:
+            call = data['calls'][name]
+            out.write('call %s: %d calls, %d errors, %d records\n' % (name, call['count'], call['errors'], call['records']))
+            out.write(histogramLine('  total', call['total']))
+            out.write(histogramLine('  build', call['build']))
+
+def milliseconds(value):
+    if value is None: return '-'
+    return '%.2fms' % (value * 1000)
+
+def histogramLine(label, snapshot):
+    return '%-16s count %6d  mean %9s  p50 %9s  p90 %9s  p99 %9s  max %9s\n' % (
+        label, snapshot['count'], milliseconds(snapshot['mean']), milliseconds(snapshot['p50']),
+        milliseconds(snapshot['p90']), milliseconds(snapshot['p99']), milliseconds(snapshot['max']),
+    )
@@ -0,0 +1,204 @@
+##  Copyright (c) 2009-2010 Ethan Rowe (ethan@endpoint.com)
+##  For more information, see http://github.com/ethanrowe/thunderhead
+##
+##  This file is part of Thunderhead.
+##
+##  Thunderhead is free software: you can redistribute it and/or modify
+##  it under the terms of the GNU General Public License as published by
+##  the Free Software Foundation, either version 3 of the License, or
+##  (at your option) any later version.
+##
+##  Thunderhead is distributed in the hope that it will be useful,
+##  but WITHOUT ANY WARRANTY; without even the implied warranty of
+##  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##  GNU General Public License for more details.
+##
+##  You should have received a copy of the GNU General Public License
+##  along with Thunderhead.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+NAME
+    thunderhead.rackspace.ratelimit
+
+DESCRIPTION
+    Client-side rate limiting, to stay under the service's published limits rather
+    than running into overLimit faults.
+
+    A RateLimiter holds a list of Limits, each matching requests by HTTP method and a
+    regular expression on the request path (query string included), and each with a
+    SlidingWindow of its own.  A request needs room in every limit it matches,
+    waiting as needed; the limiter is safe to share among threads, and among the
+    pools of an Authorization (see Authorization.setRateLimiter).
+
+    A window allowing <count> requests per <period> remembers the times of the
+    requests it has granted within the last <period> seconds, and grants another as
+    soon as that leaves no span of <period> seconds, wherever it falls, with more
+    than <count> requests.  A burst of <count> goes out at once, and the full
+    published rate is sustained.  Callers reserve times in arrival order: a caller
+    that has to wait takes its slot up front and sleeps until it falls due, so
+    concurrent callers are served first come, first served.
+"""
+
+import bisect, re, threading, time
+from thunderhead.clock import systemClock
+from thunderhead.rackspace import exceptions
+
+class SlidingWindow(object):
+    """
+    The request times (past, or reserved for the future) that count against a limit
+    of <count> requests per <period> seconds.  Not locked; RateLimiter serializes
+    access.
+    """
+    def __init__(self, count, period):
+        self.count = count
+        self.period = period
+        self.times = []
+
+    def prune(self, now):
+        # a request <period> or more ago shares no window with one now or later
+        del self.times[:bisect.bisect_right(self.times, now - self.period)]
+
+    def fits(self, when):
+        """
+        Whether a request at <when> leaves every span shorter than <period> with no
+        more than <count> requests.
+        """
+        times = self.times
+        position = bisect.bisect_right(times, when)
+        # each run of count + 1 consecutive times that would include <when>
+        for before in range(self.count + 1):
+            after = self.count - before
+            if before > position or after > len(times) - position: continue
+            first = when
+            if before: first = times[position - before]
+            last = when
+            if after: last = times[position + after - 1]
+            if last - first < self.period: return False
+        return True
+
+    def earliest(self, when):
+        """
+        The first time from <when> on at which a request fits.
+        """
+        if len(self.times) < self.count or self.fits(when): return when
+        # otherwise room opens only as an earlier request leaves the window
+        for time in self.times:
+            if time + self.period > when and self.fits(time + self.period): return time + self.period
+        return self.times[-1] + self.period
+
+    def delay(self, now):
+        """
+        Seconds from <now> until a request fits.
+        """
+        self.prune(now)
+        return self.earliest(now) - now
+
+    def reserve(self, when):
+        bisect.insort(self.times, when)
+
+class Limit(object):
+    """
+    <count> requests per <period> seconds for requests whose method is <method> (or
+    any method, given '*') and whose path matches the regular expression <pattern>.
+    """
+    def __init__(self, method, pattern, count, period):
+        self.method = method.upper()
+        self.pattern = pattern
+        self.regex = re.compile(pattern)
+        self.count = count
+        self.period = period
+
+    def matches(self, method, path):
+        return self.method in ('*', method.upper()) and self.regex.search(path) is not None
+
+    def window(self):
+        return SlidingWindow(self.count, self.period)
+
+    def __repr__(self):
+        return 'Limit(%r, %r, %r, %r)' % (self.method, self.pattern, self.count, self.period)
+
+# the Cloud Servers API's published absolute rate limits
+defaultLimits = (
+    Limit('POST', '.', 10, 60),
+    Limit('POST', r'^/servers/?(\?|$)', 50, 86400),
+    Limit('PUT', '.', 10, 60),
+    Limit('GET', r'changes-since', 3, 60),
+    Limit('DELETE', '.', 100, 60),
+)
+
+class RateLimiter(object):
+    """
+    NAME
+        RateLimiter
+
+    DESCRIPTION
+        Paces requests to within a set of Limits (by default defaultLimits).
+
+        acquire(method, path) blocks until the request may go out.  If the wait would
+        exceed maxWait seconds, RateLimitException is raised instead, without taking
+        a slot; maxWait of None waits as long as it takes.
+
+        Counters:
+        * grantCount: requests allowed through
+        * delayCount: requests that had to wait
+        * delayTime: total seconds spent waiting
+        * refusedCount: requests refused for exceeding maxWait
+    """
+    maxWait = None
+    clock = systemClock
+    sleep = time.sleep
+
+    def __init__(self, limits=None, maxWait=None, clock=None):
+        if clock is not None: self.clock = clock
+        if maxWait is not None: self.maxWait = maxWait
+        if limits is None: limits = defaultLimits
+        self.limits = [(limit, limit.window()) for limit in limits]
+        self.lock = threading.Lock()
+        self.grantCount = 0
+        self.delayCount = 0
+        self.delayTime = 0
+        self.refusedCount = 0
+
+    def windowsFor(self, method, path):
+        return [window for limit, window in self.limits if limit.matches(method, path)]
+
+    def reserve(self, method, path):
+        """
+        Reserve the earliest time at which the request fits every window it matches,
+        returning the seconds to wait before sending it.
+        """
+        self.lock.acquire()
+        try:
+            windows = self.windowsFor(method, path)
+            now = self.clock.monotonic()
+            when = now
+            for window in windows:
+                window.prune(now)
+            # a time one window allows may not suit another; settle on one all allow
+            settled = False
+            while not settled:
+                settled = True
+                for window in windows:
+                    earliest = window.earliest(when)
+                    if earliest > when:
+                        when = earliest
+                        settled = False
+            delay = when - now
+            if self.maxWait is not None and delay > self.maxWait:
+                self.refusedCount += 1
+                raise exceptions.RateLimitException(
+                    '%s %s would wait %.1f seconds' % (method, path, delay), delay)
+            for window in windows:
+                window.reserve(when)
+            self.grantCount += 1
+            if delay:
+                self.delayCount += 1
+                self.delayTime += delay
+            return delay
+        finally:
+            self.lock.release()
+
+    def acquire(self, method, path):
+        delay = self.reserve(method, path)
+        if delay: self.sleep(delay)
+        return delay
@@ -0,0 +1,151 @@
+##  Copyright (c) 2009-2010 Ethan Rowe (ethan@endpoint.com)
+##  For more information, see http://github.com/ethanrowe/thunderhead
+##
+##  This file is part of Thunderhead.
+##
+##  Thunderhead is free software: you can redistribute it and/or modify
+##  it under the terms of the GNU General Public License as published by
+##  the Free Software Foundation, either version 3 of the License, or
+##  (at your option) any later version.
+##
+##  Thunderhead is distributed in the hope that it will be useful,
+##  but WITHOUT ANY WARRANTY; without even the implied warranty of
+##  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##  GNU General Public License for more details.
+##
+##  You should have received a copy of the GNU General Public License
+##  along with Thunderhead.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+NAME
+    thunderhead.rackspace.records
+
+DESCRIPTION
+    Compact record types for the data the api functions return.
+
+    Each record keeps its fields in __slots__ rather than a per-instance dictionary,
+    which matters when caching tens of thousands of them.  The Image, Flavor and
+    PublicIP records stand in for the dictionaries the api otherwise returns: they
+    support the read side of the mapping interface and compare equal to a dictionary
+    with the same items.  Fields are also available as attributes.
+
+    frozen() derives an immutable (and hashable) variant of a record class.
+"""
+
+def slotNames(klass):
+    names = []
+    for base in klass.__mro__:
+        for name in getattr(base, '__slots__', ()):
+            if name not in names and name not in ('__dict__', '__weakref__'):
+                names.append(name)
+    return names
+
+def frozen(klass, name=None):
+    return type(name or 'Frozen' + klass.__name__, (klass,), {
+        '__slots__': (),
+        '__module__': klass.__module__,
+        'frozen': True,
+    })
+
+def build(klass, values):
+    """
+    Instantiate <klass> from the dictionary <values>, or simply return <values>
+    when <klass> is dict.
+    """
+    if klass is dict: return values
+    return klass(**values)
+
+class Record(object):
+    """
+    Base class for slotted records; subclasses name their fields in both __slots__
+    and "fields".  Unset fields are simply absent, as with a dictionary key.
+    """
+    __slots__ = ()
+    fields = ()
+    frozen = False
+
+    def __init__(self, **values):
+        for name, value in values.iteritems():
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name, value):
+        if self.frozen: raise AttributeError(self.__class__.__name__ + ' is immutable')
+        object.__setattr__(self, name, value)
+
+    def __delattr__(self, name):
+        if self.frozen: raise AttributeError(self.__class__.__name__ + ' is immutable')
+        object.__delattr__(self, name)
+
+    def keys(self):
+        return [name for name in self.fields if hasattr(self, name)]
+
+    def values(self):
+        return [getattr(self, name) for name in self.keys()]
+
+    def items(self):
+        return [(name, getattr(self, name)) for name in self.keys()]
+
+    def iteritems(self):
+        return iter(self.items())
+
+    def has_key(self, key):
+        return key in self.fields and hasattr(self, key)
+
+    __contains__ = has_key
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def __getitem__(self, key):
+        if key not in self.fields: raise KeyError(key)
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        setattr(self, key, value)
+
+    def get(self, key, default=None):
+        if self.has_key(key): return getattr(self, key)
+        return default
+
+    def __eq__(self, other):
+        if hasattr(other, 'items') and hasattr(other, 'has_key'):
+            return dict(self.items()) == dict(other.items())
+        return NotImplemented
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        if result is NotImplemented: return result
+        return not result
+
+    def __hash__(self):
+        if not self.frozen: raise TypeError('unhashable type: ' + self.__class__.__name__)
+        return hash(tuple(self.items()))
+
+    def __repr__(self):
+        return self.__class__.__name__ + '(' + ', '.join(['%s=%r' % item for item in self.items()]) + ')'
+
+    def __getstate__(self):
+        return dict(self.items())
+
+    def __setstate__(self, state):
+        for name, value in state.iteritems():
+            object.__setattr__(self, name, value)
+
+class Image(Record):
+    __slots__ = fields = ('id', 'name', 'status', 'updated', 'created', 'progress', 'serverId')
+
+class Flavor(Record):
+    __slots__ = fields = ('id', 'name', 'ram', 'disk')
+
+class PublicIP(Record):
+    __slots__ = fields = ('addr',)
+
+FrozenImage = frozen(Image)
+FrozenFlavor = frozen(Flavor)
+FrozenPublicIP = frozen(PublicIP)
@@ -0,0 +1,301 @@
+##  Copyright (c) 2009-2010 Ethan Rowe (ethan@endpoint.com)
+##  For more information, see http://github.com/ethanrowe/thunderhead
+##
+##  This file is part of Thunderhead.
+##
+##  Thunderhead is free software: you can redistribute it and/or modify
+##  it under the terms of the GNU General Public License as published by
+##  the Free Software Foundation, either version 3 of the License, or
+##  (at your option) any later version.
+##
+##  Thunderhead is distributed in the hope that it will be useful,
+##  but WITHOUT ANY WARRANTY; without even the implied warranty of
+##  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##  GNU General Public License for more details.
+##
+##  You should have received a copy of the GNU General Public License
+##  along with Thunderhead.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+NAME
+    thunderhead.rackspace.recordset
+
+DESCRIPTION
+    RecordSet: a dictionary of records by id (servers, images, flavors) that keeps
+    track of the keys changed in each copy of it (see below).
+
+    IndexedRecordSet: a RecordSet that also maintains secondary indexes as entries
+    are added, replaced and removed, so that where() can answer queries without
+    scanning every record.
+
+    Indexes, by name:
+    * status, imageId, flavorId: the attribute (or key) of that name
+    * metadataKey: each key of the record's metadata
+    * metadata: each (key, value) pair of the record's metadata
+
+    The defaults index values shared by many records.  Nearly unique values (names,
+    addresses) would cost a bucket per record; a subclass wanting them anyway can
+    add fieldExtractor('name') or addresses to its extractors.  AddressedRecordSet
+    does the latter, adding:
+    * ip: each public and private IP address of the record
+
+    copy() is cheap apart from copying the records dictionary itself: the copy shares
+    each index, and each index's buckets, with the original until either one changes
+    them.  CachedResource relies on this to merge deltas into a new set without
+    re-indexing the records that did not change.
+
+    Each copy of a RecordSet, indexed or not, gets a fresh version number from a ChangeLog shared by the original
+    and all its copies, which records the keys set or removed in each version.  A
+    consumer that remembers the version it last saw can then visit only the records
+    changed since (see Role.getServers), even when the set it now sees was copied
+    from an older one.
+"""
+
+class ChangeLog(object):
+    """
+    The keys changed in each version of a lineage of record sets, and the version
+    each was copied from.  Versions come from a single counter, so copying an older
+    set starts a new branch rather than reusing a number.  Only the latest "size"
+    versions are retained.
+    """
+    size = 64
+
+    def __init__(self):
+        self.versions = {}
+        self.parents = {0: None}
+        self.latest = 0
+        self.oldest = 0
+
+    def begin(self, parent):
+        """
+        Allocate the version of a copy of <parent>.
+        """
+        self.latest += 1
+        version = self.latest
+        self.versions[version] = set()
+        self.parents[version] = parent
+        while self.oldest <= version - self.size:
+            self.versions.pop(self.oldest, None)
+            self.parents.pop(self.oldest, None)
+            self.oldest += 1
+        return version
+
+    def record(self, version, key):
+        self.versions.setdefault(version, set()).add(key)
+
+    def changedSince(self, version, current):
+        """
+        The keys that may differ between <version> and <current>: those changed on
+        the way from their common ancestor to either.  None if either path is no
+        longer retained.
+        """
+        keys = set()
+        while version != current:
+            # a copy's version always exceeds its parent's, so the later of the
+            # two cannot be an ancestor of the other
+            if version > current:
+                step = version
+            else:
+                step = current
+            if not self.parents.has_key(step): return None
+            keys.update(self.versions.get(step, ()))
+            if step == version:
+                version = self.parents[step]
+            else:
+                current = self.parents[step]
+            if version is None or current is None: return None
+        return keys
+
+def fieldValue(record, name):
+    if hasattr(record, 'has_key'): return record.get(name)
+    return getattr(record, name, None)
+
+def fieldExtractor(name):
+    def extract(record):
+        value = fieldValue(record, name)
+        if value is None: return ()
+        return (value,)
+    return extract
+
+def metadataKeys(record):
+    return (fieldValue(record, 'metadata') or {}).keys()
+
+def metadataItems(record):
+    return (fieldValue(record, 'metadata') or {}).items()
+
+def addresses(record):
+    return (fieldValue(record, 'publicIPs') or []) + (fieldValue(record, 'privateIPs') or [])
+
+class RecordSet(dict):
+    # index name: function returning the values a record is indexed under
+    extractors = {}
+
+    def __init__(self, items=None, **kwargs):
+        dict.__init__(self)
+        self.indexes = dict([(name, {}) for name in self.extractors.keys()])
+        # indexes, and buckets (index name, value), this set may modify in place;
+        # others are shared with copies
+        self.ownedIndexes = dict.fromkeys(self.indexes.keys(), True)
+        self.owned = {}
+        self.version = 0
+        self.changeLog = None
+        if self.indexes:
+            self.update(items or {}, **kwargs)
+        else:
+            # nothing to index or log yet
+            dict.update(self, items or {}, **kwargs)
+        self.changeLog = ChangeLog()
+
+    def copy(self):
+        other = self.__class__()
+        dict.update(other, self)
+        other.indexes = dict(self.indexes)
+        other.ownedIndexes = {}
+        self.ownedIndexes = {}
+        other.version = self.changeLog.begin(self.version)
+        other.changeLog = self.changeLog
+        self.owned = {}
+        return other
+
+    def changed(self, key):
+        if self.changeLog: self.changeLog.record(self.version, key)
+
+    def __reduce__(self):
+        return (self.__class__, (dict(self),))
+
+    def writableIndex(self, name):
+        if not self.ownedIndexes.has_key(name):
+            self.indexes[name] = dict(self.indexes[name])
+            self.ownedIndexes[name] = True
+        return self.indexes[name]
+
+    def bucket(self, name, value):
+        index = self.writableIndex(name)
+        if not self.owned.has_key((name, value)):
+            index[value] = set(index.get(value, ()))
+            self.owned[(name, value)] = True
+        return index[value]
+
+    def addKey(self, key, name, values):
+        for value in values:
+            self.bucket(name, value).add(key)
+
+    def removeKey(self, key, name, values):
+        for value in values:
+            bucket = self.bucket(name, value)
+            bucket.discard(key)
+            if not bucket:
+                del self.writableIndex(name)[value]
+                del self.owned[(name, value)]
+
+    def unindex(self, key, record):
+        for (name, extract) in self.extractors.iteritems():
+            self.removeKey(key, name, extract(record))
+
+    def __setitem__(self, key, record):
+        replacing = dict.has_key(self, key)
+        if replacing: previous = dict.__getitem__(self, key)
+        dict.__setitem__(self, key, record)
+        for (name, extract) in self.extractors.iteritems():
+            values = set(extract(record))
+            if replacing:
+                # touch only the buckets whose membership changes
+                old = set(extract(previous))
+                self.removeKey(key, name, old - values)
+                values = values - old
+            self.addKey(key, name, values)
+        self.changed(key)
+
+    def __delitem__(self, key):
+        self.unindex(key, dict.__getitem__(self, key))
+        dict.__delitem__(self, key)
+        self.changed(key)
+
+    def pop(self, key, *default):
+        if dict.has_key(self, key):
+            record = dict.__getitem__(self, key)
+            del self[key]
+            return record
+        if default: return default[0]
+        raise KeyError(key)
+
+    def popitem(self):
+        (key, record) = dict.popitem(self)
+        dict.__setitem__(self, key, record)
+        del self[key]
+        return (key, record)
+
+    def setdefault(self, key, default=None):
+        if not dict.has_key(self, key): self[key] = default
+        return dict.__getitem__(self, key)
+
+    def update(self, items=None, **kwargs):
+        if items:
+            if hasattr(items, 'iteritems'): items = items.iteritems()
+            for (key, record) in items:
+                self[key] = record
+        for (key, record) in kwargs.iteritems():
+            self[key] = record
+
+    def clear(self):
+        for key in self.keys(): self.changed(key)
+        dict.clear(self)
+        self.indexes = dict([(name, {}) for name in self.extractors.keys()])
+        self.ownedIndexes = dict.fromkeys(self.indexes.keys(), True)
+        self.owned = {}
+
+    def keysWhere(self, name, value):
+        """
+        The keys of the records whose index <name> includes <value>, or any one of
+        <value> if that is a list or set.  The set returned may belong to the
+        index, so must not be modified.
+        """
+        index = self.indexes[name]
+        if isinstance(value, (list, set, frozenset)):
+            keys = set()
+            for item in value:
+                keys.update(index.get(item, ()))
+            return keys
+        return index.get(value, set())
+
+    def where(self, **criteria):
+        """
+        Return a dictionary of the records matching all of <criteria>, each an index
+        name and a value (or list of alternative values); see keysWhere().  Criteria
+        naming no index are checked against each candidate's attribute of that name.
+        The indexed criterion with the fewest matches is evaluated first.
+        """
+        indexed = [(name, value) for (name, value) in criteria.iteritems() if self.indexes.has_key(name)]
+        others = [(name, value) for (name, value) in criteria.iteritems() if not self.indexes.has_key(name)]
+        if indexed:
+            candidates = [self.keysWhere(name, value) for (name, value) in indexed]
+            candidates.sort(lambda a, b: cmp(len(a), len(b)))
+            keys = candidates[0]
+            for other in candidates[1:]:
+                keys = keys.intersection(other)
+        else:
+            keys = self.keys()
+        result = {}
+        for key in keys:
+            record = dict.__getitem__(self, key)
+            if not [name for (name, value) in others if fieldValue(record, name) != value]:
+                result[key] = record
+        return result
+
+    def indexValues(self, name):
+        """
+        The distinct values in index <name>.
+        """
+        return self.indexes[name].keys()
+
+class IndexedRecordSet(RecordSet):
+    extractors = {
+        'status': fieldExtractor('status'),
+        'imageId': fieldExtractor('imageId'),
+        'flavorId': fieldExtractor('flavorId'),
+        'metadataKey': metadataKeys,
+        'metadata': metadataItems,
+    }
+
+class AddressedRecordSet(IndexedRecordSet):
+    extractors = dict(IndexedRecordSet.extractors, ip=addresses)
@@ -0,0 +1,275 @@
+##  Copyright (c) 2009-2010 Ethan Rowe (ethan@endpoint.com)
+##  For more information, see http://github.com/ethanrowe/thunderhead
+##
+##  This file is part of Thunderhead.
+##
+##  Thunderhead is free software: you can redistribute it and/or modify
+##  it under the terms of the GNU General Public License as published by
+##  the Free Software Foundation, either version 3 of the License, or
+##  (at your option) any later version.
+##
+##  Thunderhead is distributed in the hope that it will be useful,
+##  but WITHOUT ANY WARRANTY; without even the implied warranty of
+##  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##  GNU General Public License for more details.
+##
+##  You should have received a copy of the GNU General Public License
+##  along with Thunderhead.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+NAME
+    thunderhead.rackspace.snapshot
+
+DESCRIPTION
+    A compact, memory-mappable file format for a server inventory (the getServers
+    asset), for large fleets where unpickling or reparsing everything at startup is
+    too slow.  Opening a snapshot maps the file read-only and reads only its small
+    index tables; servers are materialized individually as they are looked up, and
+    one file can be shared read-only by any number of processes.
+
+    Layout (all integers little-endian):
+    * header: magic, format version, record count, and the offsets of the sections
+    * record table: one fixed-size record per server, sorted by id, holding a bitmask
+      of the attributes present, the integer attributes, and (offset, length)
+      references into the string pool for name, status, hostId and an "extra" blob
+      (a pickle of the remaining attributes: addresses, metadata, etc.)
+    * string pool: UTF-8 strings, each distinct value stored once
+    * status index and imageId index: a table of the distinct keys, each pointing at
+      a sorted list of record numbers
+
+    writeSnapshot() writes a file, atomically replacing any existing one;
+    ServerSnapshot reads one.
+
+    Requires Python 2.5 or later (for struct.Struct, whose unpack_from() reads the
+    mapped file in place).
+"""
+
+import mmap, struct, cPickle as pickle
+from cStringIO import StringIO
+from thunderhead.rackspace import api
+from thunderhead.rackspace.store import replaceFile
+
+magic = 'THSNAP\0\0'
+formatVersion = 1
+
+integerFields = ('id', 'imageId', 'flavorId', 'progress', 'sharedIpGroupId')
+stringFields = ('name', 'status', 'hostId')
+header = struct.Struct('<8sIIIIII')
+record = struct.Struct('<I' + 'i' * len(integerFields) + 'II' * (len(stringFields) + 1))
+count = struct.Struct('<I')
+stringKey = struct.Struct('<IIII')
+integerKey = struct.Struct('<iII')
+
+def encodeString(value):
+    if isinstance(value, unicode): return value.encode('utf-8')
+    return str(value)
+
+class StringPool(object):
+    def __init__(self):
+        self.data = StringIO()
+        self.offsets = {}
+        self.size = 0
+
+    def add(self, value):
+        if not self.offsets.has_key(value):
+            self.offsets[value] = self.size
+            self.data.write(value)
+            self.size += len(value)
+        return (self.offsets[value], len(value))
+
+def writeSnapshot(servers, path):
+    """
+    Write <servers> (a dictionary of servers by id, such as the getServers asset, or
+    any sequence of servers) to a snapshot file at <path>.
+    """
+    if hasattr(servers, 'itervalues'): servers = servers.itervalues()
+    servers = [(int(server.id), server) for server in servers]
+    servers.sort()
+    pool = StringPool()
+    records = StringIO()
+    byStatus = {}
+    byImage = {}
+    number = 0
+    for (id, server) in servers:
+        present = 0
+        bit = 1
+        values = []
+        for name in integerFields:
+            value = getattr(server, name, None)
+            if value is not None: present |= bit
+            values.append(int(value or 0))
+            bit <<= 1
+        for name in stringFields:
+            value = getattr(server, name, None)
+            if value is not None: present |= bit
+            values.extend(pool.add(encodeString(value or '')))
+            bit <<= 1
+        extra = dict([
+            (name, getattr(server, name)) for name in server.simpleAttributes
+            if name not in stringFields and hasattr(server, name)
+        ])
+        values.extend(pool.add((extra and pickle.dumps(extra, pickle.HIGHEST_PROTOCOL)) or ''))
+        records.write(record.pack(present, *values))
+        if getattr(server, 'status', None) is not None:
+            byStatus.setdefault(encodeString(server.status), []).append(number)
+        if getattr(server, 'imageId', None) is not None:
+            byImage.setdefault(int(server.imageId), []).append(number)
+        number += 1
+
+    recordOffset = header.size
+    poolOffset = recordOffset + len(servers) * record.size
+    statusOffset = poolOffset + pool.size
+    # status values are all in the pool already, from the records
+    statusIndex = packIndex(statusOffset, byStatus, stringKey, lambda key: pool.offsets[key], len)
+    imageOffset = statusOffset + len(statusIndex)
+    imageIndex = packIndex(imageOffset, byImage, integerKey, lambda key: key)
+
+    output = StringIO()
+    output.write(header.pack(magic, formatVersion, len(servers), recordOffset, poolOffset, statusOffset, imageOffset))
+    output.write(records.getvalue())
+    output.write(pool.data.getvalue())
+    output.write(statusIndex)
+    output.write(imageIndex)
+    replaceFile(path, output.getvalue())
+
+def packIndex(offset, index, entry, *keyParts):
+    """
+    Pack an index of key => record numbers starting at <offset>: the key count, then
+    an <entry> per key (the key, as given by the <keyParts> functions, followed by
+    the offset and length of its postings), then the postings themselves.
+    """
+    keys = index.keys()
+    keys.sort()
+    postingsOffset = offset + count.size + entry.size * len(keys)
+    entries = [count.pack(len(keys))]
+    postings = []
+    for key in keys:
+        numbers = index[key]
+        entries.append(entry.pack(*([part(key) for part in keyParts] + [postingsOffset, len(numbers)])))
+        postings.append(struct.pack('<%dI' % len(numbers), *numbers))
+        postingsOffset += 4 * len(numbers)
+    return ''.join(entries + postings)
+
+class ServerSnapshot(object):
+    """
+    NAME
+        ServerSnapshot
+
+    DESCRIPTION
+        Read-only access to a server snapshot file written by writeSnapshot().
+
+        Lookups by id are a binary search of the record table; withStatus() and
+        withImage() read the corresponding index.  Only the servers returned are
+        materialized, as instances of api.recordTypes['server'].  asset() materializes
+        everything, giving a dictionary like that getServers returns.
+
+        Methods:
+        * get(id, default=None), snapshot[id], id in snapshot, len(snapshot)
+        * ids(): the server ids, in ascending order
+        * statuses(), imageIds(): the distinct keys of each index
+        * withStatus(status), withImage(imageId): lists of matching servers
+        * close(): unmap the file
+    """
+    def __init__(self, path):
+        handle = open(path, 'rb')
+        try:
+            self.map = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+        finally:
+            handle.close()
+        if len(self.map) < header.size or header.unpack_from(self.map)[:2] != (magic, formatVersion):
+            self.close()
+            raise ValueError('%s is not a version %d server snapshot' % (path, formatVersion))
+        (fileMagic, version, self.count, self.recordOffset, self.poolOffset, statusOffset, imageOffset) = \
+            header.unpack_from(self.map)
+        self.statusIndex = self.readIndex(statusOffset, stringKey, lambda offset, length: self.string(offset, length).decode('utf-8'))
+        self.imageIndex = self.readIndex(imageOffset, integerKey, lambda key: key)
+
+    def readIndex(self, offset, entry, decodeKey):
+        (keys,) = count.unpack_from(self.map, offset)
+        offset += count.size
+        index = {}
+        for i in xrange(keys):
+            values = entry.unpack_from(self.map, offset)
+            index[decodeKey(*values[:-2])] = values[-2:]
+            offset += entry.size
+        return index
+
+    def string(self, offset, length):
+        start = self.poolOffset + offset
+        return self.map[start:start + length]
+
+    def idAt(self, number):
+        return struct.unpack_from('<i', self.map, self.recordOffset + number * record.size + 4)[0]
+
+    def find(self, id):
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self.idAt(middle) < id:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self.count and self.idAt(low) == id: return low
+        return None
+
+    def serverAt(self, number):
+        values = record.unpack_from(self.map, self.recordOffset + number * record.size)
+        present = values[0]
+        attributes = {}
+        bit = 1
+        position = 1
+        for name in integerFields:
+            if present & bit: attributes[name] = values[position]
+            position += 1
+            bit <<= 1
+        for name in stringFields:
+            if present & bit: attributes[name] = self.string(*values[position:position + 2]).decode('utf-8')
+            position += 2
+            bit <<= 1
+        (offset, length) = values[position:position + 2]
+        if length: attributes.update(pickle.loads(self.string(offset, length)))
+        return api.recordTypes['server'](**attributes)
+
+    def postings(self, index, key):
+        if not index.has_key(key): return ()
+        (offset, length) = index[key]
+        return struct.unpack_from('<%dI' % length, self.map, offset)
+
+    def __len__(self):
+        return self.count
+
+    def has_key(self, id):
+        return self.find(id) is not None
+
+    __contains__ = has_key
+
+    def get(self, id, default=None):
+        number = self.find(id)
+        if number is None: return default
+        return self.serverAt(number)
+
+    def __getitem__(self, id):
+        number = self.find(id)
+        if number is None: raise KeyError(id)
+        return self.serverAt(number)
+
+    def ids(self):
+        return [self.idAt(number) for number in xrange(self.count)]
+
+    def statuses(self):
+        return self.statusIndex.keys()
+
+    def imageIds(self):
+        return self.imageIndex.keys()
+
+    def withStatus(self, status):
+        return [self.serverAt(number) for number in self.postings(self.statusIndex, status)]
+
+    def withImage(self, imageId):
+        return [self.serverAt(number) for number in self.postings(self.imageIndex, imageId)]
+
+    def asset(self):
+        return dict([(server.id, server) for server in [self.serverAt(number) for number in xrange(self.count)]])
+
+    def close(self):
+        self.map.close()
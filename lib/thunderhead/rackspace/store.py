@@ -0,0 +1,161 @@
+##  Copyright (c) 2009-2010 Ethan Rowe (ethan@endpoint.com)
+##  For more information, see http://github.com/ethanrowe/thunderhead
+##
+##  This file is part of Thunderhead.
+##
+##  Thunderhead is free software: you can redistribute it and/or modify
+##  it under the terms of the GNU General Public License as published by
+##  the Free Software Foundation, either version 3 of the License, or
+##  (at your option) any later version.
+##
+##  Thunderhead is distributed in the hope that it will be useful,
+##  but WITHOUT ANY WARRANTY; without even the implied warranty of
+##  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##  GNU General Public License for more details.
+##
+##  You should have received a copy of the GNU General Public License
+##  along with Thunderhead.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+NAME
+    thunderhead.rackspace.store
+
+DESCRIPTION
+    Persistent storage for cached api results, so that a new process can resume a
+    CachedResource from disk and fetch only the changes since it was saved.
+
+    A DiskStore keeps one file per cache entry (that is, per account, function and
+    arguments) in a directory.  Each file holds a header line (format version and the
+    entry's timestamp) followed by a pickle of the entry's key, its timestamp and its
+    asset.  Files are written to a temporary name and renamed into place, so readers
+    never see a partial file; where fcntl is available, writers also lock the entry
+    (through a "<name>.lock" file beside it) so that an older asset never replaces a
+    newer one, which takes reading only the header of the file being replaced.
+    Unreadable, mismatched or foreign-version files are ignored.
+
+    Since the files are unpickled, the directory must be writable only by trusted
+    users; it is created accessible only to its owner.
+"""
+
+import os, errno, tempfile, cPickle as pickle
+try:
+    from hashlib import sha1
+except ImportError:
+    from sha import new as sha1
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+def replaceFile(path, data):
+    """
+    Write <data> to <path> by way of a temporary file renamed into place, so that
+    readers see either the old contents or the new, never a mixture.
+    """
+    handle, temporary = tempfile.mkstemp('.tmp', '', os.path.dirname(path) or '.')
+    try:
+        try:
+            written = 0
+            while written < len(data):
+                written += os.write(handle, buffer(data, written))
+            os.fsync(handle)
+        finally:
+            os.close(handle)
+        if os.name == 'nt' and os.path.exists(path): os.remove(path)
+        os.rename(temporary, path)
+    except:
+        if os.path.exists(temporary): os.remove(temporary)
+        raise
+
+class DiskStore(object):
+    formatVersion = 2
+    magic = 'thunderhead-cache'
+
+    def __init__(self, directory):
+        self.directory = directory
+        try:
+            os.makedirs(directory, 0700)
+        except OSError, e:
+            if e.errno != errno.EEXIST: raise
+
+    def path(self, key):
+        return os.path.join(self.directory, sha1(repr(key)).hexdigest() + '.cache')
+
+    def header(self, timestamp):
+        return '%s %d %r\n' % (self.magic, self.formatVersion, timestamp)
+
+    def readHeader(self, stored):
+        """
+        Read the header line from the file <stored>, returning the timestamp it gives,
+        or None if the file is not in this format.
+        """
+        fields = stored.readline().split()
+        if len(fields) != 3 or fields[:2] != [self.magic, str(self.formatVersion)]: return None
+        try:
+            return float(fields[2])
+        except ValueError:
+            return None
+
+    def storedTimestamp(self, path):
+        try:
+            stored = open(path, 'rb')
+        except IOError:
+            return None
+        try:
+            return self.readHeader(stored)
+        finally:
+            stored.close()
+
+    def load(self, key):
+        """
+        Return the (timestamp, asset) pair saved for <key>, or None.
+        """
+        try:
+            stored = open(self.path(key), 'rb')
+        except IOError:
+            return None
+        try:
+            try:
+                if self.readHeader(stored) is None: return None
+                entry = pickle.load(stored)
+            except Exception:
+                return None
+        finally:
+            stored.close()
+        if entry.get('key') != key: return None
+        return (entry['timestamp'], entry['asset'])
+
+    def save(self, key, timestamp, asset):
+        """
+        Store <asset> fetched at wall-clock <timestamp> for <key>, unless a newer one
+        is there already.  Returns whether the asset was written.
+        """
+        path = self.path(key)
+        lock = self.lock(path)
+        try:
+            current = self.storedTimestamp(path)
+            if current is not None and current > timestamp: return False
+            replaceFile(path, self.header(timestamp) + pickle.dumps(
+                {'key': key, 'timestamp': timestamp, 'asset': asset},
+                pickle.HIGHEST_PROTOCOL,
+            ))
+            return True
+        finally:
+            self.unlock(lock)
+
+    def delete(self, key):
+        path = self.path(key)
+        for name in (path, path + '.lock'):
+            try:
+                os.remove(name)
+            except OSError, e:
+                if e.errno != errno.ENOENT: raise
+
+    def lock(self, path):
+        if not fcntl: return None
+        lock = open(path + '.lock', 'a')
+        fcntl.flock(lock.fileno(), fcntl.LOCK_EX)
+        return lock
+
+    def unlock(self, lock):
+        if lock: lock.close()
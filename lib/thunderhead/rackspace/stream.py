@@ -0,0 +1,222 @@
+##  Copyright (c) 2009-2010 Ethan Rowe (ethan@endpoint.com)
+##  For more information, see http://github.com/ethanrowe/thunderhead
+##
+##  This file is part of Thunderhead.
+##
+##  Thunderhead is free software: you can redistribute it and/or modify
+##  it under the terms of the GNU General Public License as published by
+##  the Free Software Foundation, either version 3 of the License, or
+##  (at your option) any later version.
+##
+##  Thunderhead is distributed in the hope that it will be useful,
+##  but WITHOUT ANY WARRANTY; without even the implied warranty of
+##  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##  GNU General Public License for more details.
+##
+##  You should have received a copy of the GNU General Public License
+##  along with Thunderhead.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+NAME
+    thunderhead.rackspace.stream
+
+DESCRIPTION
+    Incremental parsing of list responses (servers, images, flavors, etc.).
+
+    Rather than building a DOM for the whole document, a RecordStream feeds the
+    response body to an expat parser a chunk at a time.  A RecordBuilder watches
+    the parse events and produces one record each time a top-level element of its
+    tag closes; the stream hands records out as they become available.  Memory in
+    use at any point is therefore one chunk plus the record under construction.
+"""
+
+import sys
+import xml.parsers.expat as expat
+from collections import deque
+from thunderhead.rackspace import metrics
+
+class RecordBuilder(object):
+    """
+    Base class for building records from the children of a document's root element.
+
+    Subclasses set "tag" and implement any of the hooks below; each receives the path
+    of element names beneath the record element (empty for the record element itself).
+    * startRecord(attrs): returns the initial state for a new record
+    * startChild(path, attrs): a descendant element opened
+    * text(path, data): character data within a descendant
+    * endChild(path): a descendant element closed
+    * finishRecord(record): returns the finished record
+    """
+    tag = None
+
+    def __init__(self):
+        self.ready = deque()
+        self.stack = []
+        self.record = None
+
+    def startElement(self, name, attrs):
+        self.stack.append(name)
+        if len(self.stack) == 2 and name == self.tag:
+            self.record = self.startRecord(attrs)
+        elif self.record is not None:
+            self.startChild(self.stack[2:], attrs)
+
+    def endElement(self, name):
+        if self.record is not None:
+            if len(self.stack) == 2:
+                self.ready.append(self.finishRecord(self.record))
+                self.record = None
+            else:
+                self.endChild(self.stack[2:])
+        self.stack.pop()
+
+    def characters(self, data):
+        if self.record is not None and len(self.stack) > 2:
+            self.text(self.stack[2:], data)
+
+    def startRecord(self, attrs):
+        return dict([(str(k), v) for k, v in attrs.iteritems()])
+
+    def startChild(self, path, attrs): pass
+
+    def text(self, path, data): pass
+
+    def endChild(self, path): pass
+
+    def finishRecord(self, record):
+        return record
+
+class AttributeRecordBuilder(RecordBuilder):
+    """
+    Builds a dictionary per record from the record element's attributes, given a map
+    of attribute name to conversion function (or False to keep the value as-is).
+    Attributes not in the map are ignored.  If a recordClass is given, each finished
+    dictionary is passed to it as keyword arguments.
+    """
+    recordClass = None
+
+    def __init__(self, tag, attributes, recordClass=None):
+        RecordBuilder.__init__(self)
+        self.tag = tag
+        self.attributes = attributes
+        if recordClass is not dict: self.recordClass = recordClass
+
+    def startRecord(self, attrs):
+        record = {}
+        for name, convert in self.attributes.iteritems():
+            if attrs.has_key(name):
+                value = attrs[name]
+                if convert: value = convert(value)
+                record[name] = value
+        return record
+
+    def finishRecord(self, record):
+        if self.recordClass: return self.recordClass(**record)
+        return record
+
+class RecordStream(object):
+    """
+    NAME
+        RecordStream
+
+    DESCRIPTION
+        An iterator over the records a RecordBuilder produces from a response body.
+
+        The source needs only a read(size) method (an httplib response, for instance);
+        a source of None yields nothing.  Once the body is exhausted, or the stream is
+        closed early, the release callback is invoked with a flag indicating whether
+        the underlying connection was left in a reusable state.  A stream abandoned
+        before exhaustion should be closed explicitly; close() drains the rest of the
+        body without parsing it.  A stream dropped without being closed releases its
+        connection as unusable when it is garbage collected, rather than read the rest
+        of the body from a finalizer, so a pooled connection is never lost for good.
+
+        A stream given a metrics.RequestTiming (see instrument()) adds its reading,
+        parsing and record building to it, and reports it to its observers when done.
+    """
+    chunkSize = 8192
+    timing = None
+    observers = ()
+
+    def __init__(self, source, builder, release=None, chunkSize=None):
+        self.source = source
+        self.builder = builder
+        self.release = release
+        if chunkSize: self.chunkSize = chunkSize
+        self.finished = source is None
+        self.closed = False
+        self.parser = expat.ParserCreate()
+        self.parser.buffer_text = True
+        self.parser.StartElementHandler = builder.startElement
+        self.parser.EndElementHandler = builder.endElement
+        self.parser.CharacterDataHandler = builder.characters
+
+    def instrument(self, timing, observers):
+        """
+        Time this stream into <timing>, reporting it to <observers> once finished.
+        The builder's callbacks are timed as the "build" phase, apart from "parse".
+        """
+        self.timing = timing
+        self.observers = observers
+        def timed(handler):
+            def call(*args):
+                started = metrics.timer()
+                try:
+                    handler(*args)
+                finally:
+                    timing.add('build', metrics.timer() - started)
+            return call
+        self.parser.StartElementHandler = timed(self.builder.startElement)
+        self.parser.EndElementHandler = timed(self.builder.endElement)
+        self.parser.CharacterDataHandler = timed(self.builder.characters)
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        ready = self.builder.ready
+        while not ready:
+            if self.finished:
+                self.close()
+                raise StopIteration
+            self.feed()
+        return ready.popleft()
+
+    def feed(self):
+        timing = self.timing
+        try:
+            if timing is not None: started = metrics.timer()
+            chunk = self.source.read(self.chunkSize)
+            if timing is not None:
+                read = metrics.timer()
+                timing.add('read', read - started)
+                timing.responseBytes += len(chunk)
+                built = timing.phases.get('build', 0)
+            if chunk:
+                self.parser.Parse(chunk, 0)
+            else:
+                self.parser.Parse('', 1)
+                self.finished = True
+            if timing is not None:
+                timing.add('parse', metrics.timer() - read - (timing.phases.get('build', 0) - built))
+        except:
+            if timing is not None: timing.finish(sys.exc_info()[1])
+            self.finished = True
+            self.close(False)
+            raise
+
+    def __del__(self):
+        if not self.closed: self.close(False)
+
+    def close(self, reusable=True):
+        if self.closed: return
+        self.closed = True
+        if reusable and not self.finished:
+            try:
+                while self.source.read(self.chunkSize): pass
+            except:
+                reusable = False
+            self.finished = True
+        self.builder.ready.clear()
+        if self.release: self.release(reusable)
+        if self.timing is not None: metrics.requestFinished(self.observers, self.timing)
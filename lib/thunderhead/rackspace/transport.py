@@ -0,0 +1,125 @@
+##  Copyright (c) 2009-2010 Ethan Rowe (ethan@endpoint.com)
+##  For more information, see http://github.com/ethanrowe/thunderhead
+##
+##  This file is part of Thunderhead.
+##
+##  Thunderhead is free software: you can redistribute it and/or modify
+##  it under the terms of the GNU General Public License as published by
+##  the Free Software Foundation, either version 3 of the License, or
+##  (at your option) any later version.
+##
+##  Thunderhead is distributed in the hope that it will be useful,
+##  but WITHOUT ANY WARRANTY; without even the implied warranty of
+##  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##  GNU General Public License for more details.
+##
+##  You should have received a copy of the GNU General Public License
+##  along with Thunderhead.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+NAME
+    thunderhead.rackspace.transport
+
+DESCRIPTION
+    The layer beneath BoundConnection that actually carries requests.
+
+    A transport makes connections (connect(scheme, host, port)) with the parts of
+    the httplib.HTTPConnection interface that BoundConnection uses: connect(),
+    request(method, path, body, headers), getresponse() and close(), responses
+    offering status, getheader(name, default) and read(size).  It also answers,
+    for a connection it made, whether it is open (isConnected) and whether an idle
+    open connection has been dropped by the far end (connectionDropped).
+
+    HTTPTransport, the default, uses httplib.  InMemoryTransport passes each request
+    to a Python function in the same process instead; a FakeService's handle() (see
+    thunderhead.rackspace.fake) will do.  With no sockets involved, benchmarks and
+    tests of parsing, caching and merging measure only those.
+"""
+
+import httplib, socket, select
+from cStringIO import StringIO
+
+class HTTPTransport(object):
+    # errors indicating that a reused connection went away underneath us
+    staleConnectionErrors = (httplib.HTTPException, socket.error)
+
+    def connect(self, scheme, host, port=None):
+        klass = ((scheme == 'https' and httplib.HTTPSConnection) or httplib.HTTPConnection)
+        args = [host]
+        if port: args.append(port)
+        return klass(*args)
+
+    def isConnected(self, connection):
+        return getattr(connection, 'sock', None) is not None
+
+    def connectionDropped(self, connection):
+        # an idle keep-alive socket should have nothing to read; if it selects as
+        # readable, the server either closed it or sent something we didn't ask for.
+        try:
+            readable, writable, errors = select.select([connection.sock], [], [], 0)
+        except (select.error, socket.error, ValueError):
+            return True
+        return bool(readable)
+
+class InMemoryResponse(object):
+    def __init__(self, status, headers, body):
+        self.status = status
+        self.reason = httplib.responses.get(status, '')
+        self.headers = dict([(name.lower(), str(value)) for name, value in headers.iteritems()])
+        self.body = StringIO(body)
+
+    def getheader(self, name, default=None):
+        return self.headers.get(name.lower(), default)
+
+    def getheaders(self):
+        return self.headers.items()
+
+    def read(self, size=None):
+        if size is None: return self.body.read()
+        return self.body.read(size)
+
+class InMemoryConnection(object):
+    """
+    Hands each request to <handler>, which takes (method, path, headers, body) and
+    returns (status, headers, body).
+    """
+    def __init__(self, handler):
+        self.handler = handler
+        self.connected = False
+        self.response = None
+
+    def connect(self):
+        self.connected = True
+
+    def request(self, method, path, body=None, headers={}):
+        if self.response is not None: raise httplib.CannotSendRequest()
+        self.connected = True
+        status, responseHeaders, content = self.handler(method, path, dict(headers), body or '')
+        self.response = InMemoryResponse(status, responseHeaders, content)
+
+    def getresponse(self):
+        response = self.response
+        if response is None: raise httplib.ResponseNotReady()
+        self.response = None
+        return response
+
+    def close(self):
+        self.connected = False
+        self.response = None
+
+class InMemoryTransport(object):
+    staleConnectionErrors = (httplib.HTTPException,)
+
+    def __init__(self, handler):
+        self.handler = handler
+
+    def connect(self, scheme, host, port=None):
+        return InMemoryConnection(self.handler)
+
+    def isConnected(self, connection):
+        return connection.connected
+
+    def connectionDropped(self, connection):
+        return False
+
+defaultTransport = HTTPTransport()
@@ -20,6 +20,8 @@
 
 import test_helper
 import thunderhead.rackspace
+import thunderhead.rackspace.store
+import os, shutil, tempfile
 
 class AuthorizationOverride(thunderhead.rackspace.Authorization):
     def __init__(self, user, pw):
@@ -56,6 +58,10 @@ class TestRackspaceAuthorization(test_helper.TestCase):
         self.assertEqual(session.authToken, server.authToken)
         # verify that the session connects to the manageServerURL for server operations
         conn = session.serverManager
+        self.assertTrue(isinstance(conn, thunderhead.rackspace.ConnectionPool), 'server operations go through a connection pool')
+        self.assertEqual(conn.size, AuthorizationOverride.poolSize)
+        self.assertEqual(session.storage.url, server.makeURL('/storage'))
+        self.assertEqual(session.cdn.url, server.makeURL('/cdn'))
         self.assertEqual(conn.scheme, 'http')
         self.assertEqual(conn.host, 'localhost')
         self.assertEqual(conn.port, server.port)
@@ -69,6 +75,96 @@ class TestRackspaceAuthorization(test_helper.TestCase):
         self.assertRaises(thunderhead.rackspace.exceptions.BadCredentialsException, test)
         server.finish(1)
 
+class CountingAuthorization(thunderhead.rackspace.Authorization):
+    # hands out a new token per authentication, without a round trip
+    serverURL = 'http://localhost/server'
+    authCount = 0
+
+    def getAuthorization(self, name, key):
+        CountingAuthorization.authCount += 1
+        return thunderhead.rackspace.AuthResponse({
+            'X-Auth-Token': 'token-%d' % self.authCount,
+            'X-Server-Management-URL': self.serverURL,
+            'X-Storage-URL': 'http://localhost/storage',
+            'X-CDN-Management-URL': 'http://localhost/cdn',
+        })
+
+def handleExpiringToken(server):
+    if server.headers.getheader('x-auth-token') == 'token-1':
+        test_helper.xmlResponse(server, '<unauthorized code="401"><message>Expired</message></unauthorized>', 401)
+    else:
+        test_helper.xmlResponse(server, '<ok/>')
+
+class TestReauthorization(test_helper.TestCase):
+    def setUp(self):
+        CountingAuthorization.authCount = 0
+        self.directory = tempfile.mkdtemp()
+        self.cache = thunderhead.rackspace.store.DiskStore(os.path.join(self.directory, 'tokens'))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def testReplayAfterExpiry(self):
+        server = test_helper.StubServer.test({'get': handleExpiringToken}, protocol='HTTP/1.1')
+        class Session(CountingAuthorization):
+            serverURL = 'http://localhost:' + str(server.port) + '/server'
+        session = Session('user', 'key')
+        (result, code) = session.serverManager.request('GET', '/servers')
+        first, second = server.getRequestData(), server.getRequestData()
+        session.serverManager.close()
+        server.finish(1)
+        self.assertEqual((result.nodeName, code), ('ok', 200), 'request replayed with the new token')
+        self.assertEqual(first['headers']['x-auth-token'], 'token-1')
+        self.assertEqual(second['headers']['x-auth-token'], 'token-2')
+        self.assertEqual((session.authToken, session.reauthCount), ('token-2', 1))
+        self.assertEqual(session.storage.headers['X-Auth-Token'], 'token-2', 'every pool gets the new token')
+
+    def testSharedReauthorization(self):
+        session = CountingAuthorization('user', 'key')
+        session.reauthorize('token-1')
+        session.reauthorize('token-1')
+        self.assertEqual((session.authToken, session.reauthCount, CountingAuthorization.authCount), ('token-2', 1, 2),
+            'a token already replaced is not replaced again')
+
+    def testNoReauthorizer(self):
+        pool = thunderhead.rackspace.ConnectionPool('http://localhost/server', {'X-Auth-Token': 'x'})
+        def expired(*args):
+            raise thunderhead.rackspace.exceptions.UnauthorizedException('Expired', 401, None)
+        self.assertRaises(thunderhead.rackspace.exceptions.UnauthorizedException, pool.replaying, expired)
+
+    def testTokenCache(self):
+        class Session(CountingAuthorization):
+            tokenCache = self.cache
+        first = Session('user', 'key')
+        second = Session('user', 'key')
+        self.assertEqual(CountingAuthorization.authCount, 1, 'second session authorized from the cache')
+        self.assertEqual(second.authToken, 'token-1')
+        self.assertEqual(second.manageServerURL, first.manageServerURL)
+        Session('other', 'key')
+        self.assertEqual(CountingAuthorization.authCount, 2, 'cache keyed on user name')
+        Session('user', 'wrong')
+        self.assertEqual(CountingAuthorization.authCount, 3, 'and on the key, so a wrong key is not let through')
+
+    def testTokenCacheExpiry(self):
+        class Session(CountingAuthorization):
+            tokenCache = self.cache
+            tokenLifetime = 0
+        Session('user', 'key')
+        Session('user', 'key')
+        self.assertEqual(CountingAuthorization.authCount, 2, 'stale cached token not used')
+
+    def testReauthorizeUpdatesCache(self):
+        class Session(CountingAuthorization):
+            tokenCache = self.cache
+        first = Session('user', 'key')
+        first.reauthorize('token-1')
+        self.assertEqual(Session('user', 'key').authToken, 'token-2', 'new token shared through the cache')
+        # another process already replaced the expired token: use its token
+        second = Session('user', 'key')
+        second.authToken = 'token-1'
+        second.reauthorize('token-1')
+        self.assertEqual((second.authToken, CountingAuthorization.authCount), ('token-2', 2))
+
 if __name__ == '__main__':
     test_helper.main()
 
@@ -20,6 +20,7 @@
 
 import test_helper
 import thunderhead.rackspace.exceptions as exceptions
+import calendar
 
 class StubException(Exception):
     pass
@@ -64,8 +65,28 @@ class TestResponseExceptions(test_helper.TestCase):
             klass = getattr(exceptions, fault[0].upper() + fault[1::] + 'Exception')
             self.assertEqual(exceptions.handlerFor(fault), klass)
             self.assertEqual(klass.fault, fault)
-        
-        
+
+    def testRetryDelay(self):
+        self.assertEqual(exceptions.OverLimitException().retryDelay(), None, 'no hint, no delay')
+        err = exceptions.OverLimitException('slow down', 413)
+        err.retryAfter = '30'
+        self.assertEqual(err.retryDelay(), 30, 'retryAfter as seconds')
+        err.retryAfter = '2010-08-01T00:01:00Z'
+        now = calendar.timegm((2010, 8, 1, 0, 0, 0, 0, 0, 0))
+        self.assertEqual(err.retryDelay(now), 60, 'retryAfter as a timestamp')
+        self.assertEqual(err.retryDelay(now + 120), 0, 'timestamp in the past means no delay')
+        err.retryAfter = 'whenever'
+        self.assertEqual(err.retryDelay(), None, 'unintelligible hint ignored')
+
+    def testThrowAttributes(self):
+        err = None
+        try:
+            exceptions.throw('overLimit', 'slow down', 413, retryAfter='5')
+        except exceptions.OverLimitException, e:
+            err = e
+        self.assertEqual(err.args, ('slow down', 413))
+        self.assertEqual(err.retryAfter, '5', 'throw sets keyword arguments as attributes')
+
 if __name__ == '__main__':
     test_helper.main()
 
@@ -19,7 +19,9 @@
 ##  along with Thunderhead.  If not, see <http://www.gnu.org/licenses/>.
 
 import test_helper
+import httplib
 import thunderhead.rackspace
+from thunderhead.rackspace import transport
 import xml.dom.minidom as minidom
 
 def handleResponse(server):
@@ -32,6 +34,28 @@ def handleXMLResponse(server, xml, code=200):
     server.end_headers()
     server.wfile.write(xml)
 
+def handleKeepAliveResponse(server, xml='<someNode>kept alive</someNode>'):
+    handleXMLResponse(server, xml)
+
+def handleFlakyResponse(server, failures=[1]):
+    # fail the first request with a transient fault, then succeed
+    if failures:
+        failures.pop()
+        server.send_response(503)
+        xml = '<serviceUnavailable><message>Try later</message></serviceUnavailable>'
+        server.send_header('retry-after', '0')
+        server.send_header('content-type', 'application/xml')
+        server.send_header('content-length', str(len(xml)))
+        server.end_headers()
+        server.wfile.write(xml)
+    else:
+        handleKeepAliveResponse(server)
+
+def handleClosingResponse(server):
+    # drop the connection without announcing it, as an idle-timeout on the far end would
+    handleKeepAliveResponse(server)
+    server.close_connection = 1
+
 class TestRackspaceBoundConnection(test_helper.TestCase):
     def simpleServer(self):
         self.server = test_helper.StubServer.test({'get': handleResponse, 'post': handleResponse})
@@ -79,6 +103,16 @@ class TestRackspaceBoundConnection(test_helper.TestCase):
         self.assertEqual(requestReceived['headers']['content-type'], 'application/xml')
         self.assertEqual(requestReceived['body'], node.toxml())
 
+    def testSerializedRequest(self):
+        self.simpleServer()
+        connection = thunderhead.rackspace.BoundConnection(self.url, {})
+        connection.request('POST', '/somenode/submission', u'<someNode>Caf\xe9</someNode>')
+        requestReceived = self.server.getRequestData()
+        self.server.finish(1)
+        # strings are taken as serialized XML and sent UTF-8 encoded
+        self.assertEqual(requestReceived['headers']['content-type'], 'application/xml')
+        self.assertEqual(requestReceived['body'], '<someNode>Caf\xc3\xa9</someNode>')
+
     def testPopulatedXMLResult(self):
         xml = '<someNode>some content</someNode>'
         self.server = test_helper.StubServer.test({
@@ -107,7 +141,203 @@ class TestRackspaceBoundConnection(test_helper.TestCase):
         except thunderhead.rackspace.exceptions.CloudServersFaultException, expected:
             message, code, details = expected.args
         self.assertEqual((message, code, details), ('Everything is awful', 400, 'We all perish'))
-            
+
+    def testFaultRetryAfter(self):
+        xml = '<overLimit retryAfter="2010-08-01T00:00:00Z"><message>Too many requests</message></overLimit>'
+        connection = thunderhead.rackspace.BoundConnection('http://localhost/', {})
+        retryAfter = None
+        try:
+            connection.handleFault(413, minidom.parseString(xml).documentElement)
+        except thunderhead.rackspace.exceptions.OverLimitException, e:
+            retryAfter = e.retryAfter
+        self.assertEqual(retryAfter, '2010-08-01T00:00:00Z', 'retryAfter carried on the exception')
+
+    def testKeepAlive(self):
+        self.server = test_helper.StubServer.test({'get': handleKeepAliveResponse}, protocol='HTTP/1.1')
+        self.commonConfig()
+        connection = thunderhead.rackspace.BoundConnection(self.url, {})
+        for path in ('/one', '/two', '/three'):
+            (response, code) = connection.request('GET', path)
+            self.assertEqual((response.nodeName, code), ('someNode', 200))
+            self.assertEqual(self.server.getRequestData()['path'], self.pathPrefix + path)
+        connection.close()
+        self.server.finish(1)
+        self.assertEqual(connection.requestCount, 3, 'all requests counted')
+        self.assertEqual(connection.reuseCount, 2, 'requests after the first reuse the connection')
+        self.assertEqual(connection.reconnectCount, 0, 'no reconnects needed')
+
+    def testDroppedConnectionDetected(self):
+        self.server = test_helper.StubServer.test({'get': handleClosingResponse}, protocol='HTTP/1.1', connections=2)
+        self.commonConfig()
+        connection = thunderhead.rackspace.BoundConnection(self.url, {})
+        connection.request('GET', '/one')
+        self.server.getRequestData()
+        (response, code) = connection.request('GET', '/two')
+        self.assertEqual(self.server.getRequestData()['path'], self.pathPrefix + '/two')
+        connection.close()
+        self.server.finish(1)
+        self.assertEqual(code, 200, 'request over reopened connection succeeds')
+        self.assertEqual(connection.requestCount, 2)
+        self.assertEqual(connection.reuseCount, 0, 'dropped connection is not reused')
+        self.assertEqual(connection.reconnectCount, 1, 'dropped connection is reopened')
+
+    def testStaleConnectionRetried(self):
+        self.server = test_helper.StubServer.test({'get': handleClosingResponse}, protocol='HTTP/1.1', connections=2)
+        self.commonConfig()
+        connection = thunderhead.rackspace.BoundConnection(self.url, {})
+        # defeat the up-front check so the failure surfaces mid-request
+        connection.connectionDropped = lambda: False
+        connection.request('GET', '/one')
+        self.server.getRequestData()
+        (response, code) = connection.request('GET', '/two')
+        self.assertEqual(self.server.getRequestData()['path'], self.pathPrefix + '/two')
+        connection.close()
+        self.server.finish(1)
+        self.assertEqual(code, 200, 'request retried transparently over a new connection')
+        self.assertEqual(connection.requestCount, 2)
+        self.assertEqual(connection.reconnectCount, 1, 'stale connection replaced once')
+
+    def staleConnection(self, failure):
+        # an open connection whose next request fails at <failure> ('request' or 'response')
+        handled = []
+        def handler(method, path, headers, body):
+            handled.append(method)
+            return (204, {}, '')
+        class StaleConnection(transport.InMemoryConnection):
+            failing = True
+            def request(self, *args):
+                if self.failing and failure == 'request':
+                    self.failing = False
+                    raise httplib.CannotSendRequest()
+                transport.InMemoryConnection.request(self, *args)
+            def getresponse(self):
+                response = transport.InMemoryConnection.getresponse(self)
+                if self.failing and failure == 'response':
+                    self.failing = False
+                    raise httplib.BadStatusLine('')
+                return response
+        class StaleTransport(transport.InMemoryTransport):
+            def connect(self, scheme, host, port=None):
+                connection = StaleConnection(self.handler)
+                connection.connected = True
+                return connection
+        return (thunderhead.rackspace.BoundConnection('http://memory/', {}, StaleTransport(handler)), handled)
+
+    def testStaleConnectionNotResentAfterPost(self):
+        connection, handled = self.staleConnection('response')
+        self.assertRaises(httplib.BadStatusLine, connection.request, 'POST', '/servers', '<server/>')
+        self.assertEqual(handled, ['POST'], 'a POST that may have been acted upon is not sent again')
+        connection, handled = self.staleConnection('response')
+        connection.request('DELETE', '/servers/1')
+        self.assertEqual(handled, ['DELETE', 'DELETE'], 'idempotent requests are sent again')
+        connection, handled = self.staleConnection('request')
+        connection.request('POST', '/servers', '<server/>')
+        self.assertEqual(handled, ['POST'], 'a POST that never went out is sent over a new connection')
+        self.assertEqual(connection.reconnectCount, 1)
+
+    def testRetryPolicy(self):
+        self.server = test_helper.StubServer.test({'get': handleFlakyResponse}, protocol='HTTP/1.1')
+        self.commonConfig()
+        connection = thunderhead.rackspace.BoundConnection(self.url, {})
+        connection.retryPolicy = policy = thunderhead.rackspace.RetryPolicy()
+        sleeps = []
+        policy.sleep = sleeps.append
+        (response, code) = connection.request('GET', '/flaky')
+        self.server.getRequestData()
+        self.assertEqual(self.server.getRequestData()['path'], self.pathPrefix + '/flaky')
+        connection.close()
+        self.server.finish(1)
+        self.assertEqual((response.nodeName, code), ('someNode', 200), 'request retried after the fault')
+        self.assertEqual(sleeps, [0], 'Retry-After header honored')
+        self.assertEqual(policy.retryCount, 1)
+        self.assertEqual(policy.faultCounts, {'serviceUnavailable': 1})
+
+class FlakyCall(object):
+    def __init__(self, *faults):
+        self.faults = list(faults)
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        if self.faults: raise self.faults.pop(0)
+        return 'done'
+
+class TestRetryPolicy(test_helper.TestCase):
+    def setUp(self):
+        self.policy = thunderhead.rackspace.RetryPolicy()
+        self.sleeps = []
+        self.policy.sleep = self.sleeps.append
+        self.policy.randomFraction = lambda: 0.5
+
+    def overLimit(self, retryAfter=None):
+        e = thunderhead.rackspace.exceptions.OverLimitException('Too many requests', 413, None)
+        e.retryAfter = retryAfter
+        return e
+
+    def testBackoff(self):
+        call = FlakyCall(self.overLimit(), self.overLimit(), self.overLimit())
+        self.assertEqual(self.policy.run('GET', call), 'done')
+        self.assertEqual(call.calls, 4)
+        self.assertEqual(self.sleeps, [0.75, 1.5, 3.0], 'exponential backoff, jittered downward')
+        self.assertEqual(self.policy.retryCount, 3)
+        self.assertEqual(self.policy.faultCounts, {'overLimit': 3})
+        self.assertEqual(self.policy.exhaustedCount, 0)
+
+    def testMaxDelay(self):
+        self.policy.maxDelay = 2.0
+        self.policy.jitter = 0
+        call = FlakyCall(self.overLimit(), self.overLimit(), self.overLimit())
+        self.policy.run('GET', call)
+        self.assertEqual(self.sleeps, [1.0, 2.0, 2.0], 'backoff capped at maxDelay')
+
+    def testRetryAfter(self):
+        call = FlakyCall(self.overLimit('4'))
+        self.policy.run('GET', call)
+        self.assertEqual(self.sleeps, [5.0], 'hint honored, jittered upward')
+
+    def testRetryAfterTooLong(self):
+        call = FlakyCall(self.overLimit('600'))
+        self.assertRaises(thunderhead.rackspace.exceptions.OverLimitException, self.policy.run, 'GET', call)
+        self.assertEqual((call.calls, self.sleeps), (1, []), 'a hint beyond maxDelay is not waited out')
+        self.assertEqual(self.policy.exhaustedCount, 1)
+
+    def testExhausted(self):
+        call = FlakyCall(*[self.overLimit() for i in range(5)])
+        self.assertRaises(thunderhead.rackspace.exceptions.OverLimitException, self.policy.run, 'GET', call)
+        self.assertEqual(call.calls, 4, 'original attempt plus three retries')
+        self.assertEqual(self.policy.retryCount, 3)
+        self.assertEqual(self.policy.exhaustedCount, 1)
+        try:
+            self.policy.run('GET', FlakyCall(*[self.overLimit() for i in range(5)]))
+        except thunderhead.rackspace.exceptions.OverLimitException, e:
+            self.assertTrue(e.retriesExhausted, 'exhausted faults are marked')
+
+    def testNonIdempotentMethod(self):
+        call = FlakyCall(self.overLimit())
+        self.assertRaises(thunderhead.rackspace.exceptions.OverLimitException, self.policy.run, 'POST', call)
+        self.assertEqual(call.calls, 1, 'POST is not retried')
+        self.assertEqual(self.policy.retryCount, 0)
+
+    def testFaultAllowlist(self):
+        fault = thunderhead.rackspace.exceptions.BadRequestException('Bad', 400, None)
+        call = FlakyCall(fault)
+        self.assertRaises(thunderhead.rackspace.exceptions.BadRequestException, self.policy.run, 'GET', call)
+        self.assertEqual(call.calls, 1, 'faults outside the allowlist are not retried')
+        policy = thunderhead.rackspace.RetryPolicy(faults=[thunderhead.rackspace.exceptions.BadRequestException])
+        policy.sleep = self.sleeps.append
+        self.assertEqual(policy.run('GET', FlakyCall(fault)), 'done', 'allowlist is configurable')
+
+    def testAuthorizationPolicy(self):
+        class Response(object):
+            def getheader(self, name):
+                return 'http://localhost/' + name
+        class Authorization(thunderhead.rackspace.Authorization):
+            def getAuthorization(self, name, key):
+                return Response()
+        auth = Authorization('user', 'key')
+        self.assertTrue(isinstance(auth.retryPolicy, thunderhead.rackspace.RetryPolicy))
+        self.assertTrue(auth.serverManager.retryPolicy is auth.retryPolicy, 'pools share the account policy')
+        self.assertTrue(auth.storage.retryPolicy is auth.retryPolicy)
 
 if __name__ == '__main__':
     test_helper.main()
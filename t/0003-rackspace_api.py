@@ -20,6 +20,8 @@
 
 import test_helper
 import thunderhead.rackspace.api
+import thunderhead.clock
+import thunderhead.rackspace.exceptions
 import base64, datetime
 import xml.dom.minidom as minidom
 
@@ -39,12 +41,27 @@ class TestRackspaceAPICachedResources(test_helper.TestCase):
         self.assertEqual(self.resource.timestamp, None, 'timestamp defaults to none')
 
     def testNeedsUpdate(self):
-        self.resource.timestamp = thunderhead.rackspace.api.unixNow()
+        self.assertFalse(self.resource.needsUpdate(), 'needsUpdate false before initialization')
+        self.resource.refreshedAt = self.resource.clock.monotonic()
         self.resource.interval = 60
         self.assertFalse(self.resource.needsUpdate(), 'needsUpdate false if time within interval')
         self.resource.interval = 0
         self.assertTrue(self.resource.needsUpdate(), 'needsUpdate true if time outside interval')
 
+    def testClock(self):
+        clock = thunderhead.clock.ManualClock(100, 1000000)
+        self.resource.clock = clock
+        self.resource('a')
+        self.assertEqual((self.resource.refreshedAt, self.resource.timestamp), (100, 1000000))
+        clock.wall -= 3600
+        clock.now += 59
+        self.assertFalse(self.resource.needsUpdate(), 'wall clock jumps do not affect the interval')
+        clock.advance(1)
+        self.assertTrue(self.resource.needsUpdate())
+        self.resource('b')
+        self.assertEqual(self.calls[2], (('b',), {'since': 1000000}), 'changes-since is the wall-clock time of the last fetch')
+        self.assertEqual(self.resource.timestamp, 1000000 - 3600 + 1)
+
     def testMergeFunction(self):
         self.resource.asset = {'a': 1, 'b': 2}
         self.assertEqual(
@@ -103,7 +120,132 @@ class TestRackspaceAPICachedResources(test_helper.TestCase):
             self.resource.timestamp > ts,
             'update adjusts the timestamp appropriately',
         )
-        
+
+    def testStats(self):
+        clock = thunderhead.clock.ManualClock(100, 1000000)
+        self.resource.clock = clock
+        self.resource('a')
+        self.resource('a')
+        clock.advance(60)
+        self.resource('a')
+        stats = self.resource.stats()
+        self.assertEqual(
+            (stats['calls'], stats['hits'], stats['initializations'], stats['refreshes'], stats['emptyRefreshes']),
+            (3, 1, 1, 1, 0),
+        )
+        self.assertEqual((stats['merged'], stats['removed'], stats['size']), (1, 0, 2))
+        self.resource.merge({1: {'status': 'DELETED'}, 3: {'status': 'DELETED'}})
+        self.assertEqual(self.resource.stats()['removed'], 1, 'only records actually removed are counted')
+        self.assertTrue(stats['mergeTime'] >= 0)
+
+
+class TestRackspaceAPIBackgroundRefresh(test_helper.TestCase):
+    def setUp(self):
+        self.calls = []
+        self.release = test_helper.threading.Event()
+        self.failure = None
+        def baseFunction(*args, **kwargs):
+            self.calls.append(kwargs)
+            if kwargs.has_key('since'):
+                self.release.wait(5)
+                if self.failure: raise self.failure
+            return {len(self.calls): 'fetch'}
+        self.clock = thunderhead.clock.ManualClock()
+        self.resource = thunderhead.rackspace.api.CachedResource(baseFunction)
+        self.resource.clock = self.clock
+        self.resource.backgroundRefresh = True
+        self.resource()
+        self.clock.advance(60)
+
+    def tearDown(self):
+        self.release.set()
+
+    def testStaleWhileRevalidate(self):
+        self.assertEqual(self.resource(), {1: 'fetch'}, 'stale asset returned while refresh is pending')
+        self.assertEqual(self.resource(), {1: 'fetch'})
+        self.release.set()
+        self.resource.refreshThread.join(5)
+        self.assertEqual(len(self.calls), 2, 'only one refresh in flight at a time')
+        self.assertEqual(self.resource(), {1: 'fetch', 2: 'fetch'}, 'refreshed asset merged in')
+        self.assertFalse(self.resource.needsUpdate())
+
+    def testRefreshFailure(self):
+        failures = []
+        self.resource.errorHandler = lambda resource, excInfo: failures.append((resource, excInfo[1]))
+        self.failure = thunderhead.rackspace.exceptions.ServiceUnavailableException('down')
+        self.release.set()
+        self.resource()
+        self.resource.refreshThread.join(5)
+        self.assertEqual(failures, [(self.resource, self.failure)], 'failure reported through the hook')
+        self.assertEqual(self.resource.lastError[1], self.failure)
+        self.assertEqual(self.resource(), {1: 'fetch'}, 'stale asset kept after a failure')
+        self.assertEqual(len(self.calls), 2, 'no retry before the interval passes again')
+        self.resource.errorInterval = 5
+        self.clock.advance(60)
+        self.resource()
+        self.resource.refreshThread.join(5)
+        self.assertEqual(len(self.calls), 3, 'retried a full interval after the failure')
+        self.clock.advance(5)
+        self.resource()
+        self.resource.refreshThread.join(5)
+        self.assertEqual(len(self.calls), 4, 'errorInterval shortens the wait')
+
+class TestRackspaceAPIKeyedCachedResources(test_helper.TestCase):
+    def setUp(self):
+        self.calls = []
+        def baseFunction(conn, *args, **kwargs):
+            self.calls.append((conn, args, kwargs))
+            return {len(self.calls): conn}
+        self.resource = thunderhead.rackspace.api.KeyedCachedResource(baseFunction, 2)
+
+    def testSeparateEntries(self):
+        self.assertEqual(self.resource('a'), {1: 'a'})
+        self.assertEqual(self.resource('b'), {2: 'b'}, 'different arguments get their own entry')
+        self.assertEqual(self.resource('a'), {1: 'a'}, 'same arguments reuse the cached entry')
+        self.assertEqual(self.resource('b', filter={'x': [1, 2]}), {3: 'b'}, 'unhashable arguments are normalized')
+        self.assertEqual(self.resource('b', filter={'x': [1, 2]}), {3: 'b'})
+        self.assertEqual(len(self.calls), 3)
+
+    def testConnectionKeys(self):
+        url = 'http://localhost:8080/v1.0/1234'
+        first = thunderhead.rackspace.ConnectionPool(url, {})
+        second = thunderhead.rackspace.ConnectionPool(url, {})
+        other = thunderhead.rackspace.ConnectionPool(url.replace('1234', '5678'), {})
+        self.resource(first)
+        self.resource(second)
+        self.assertEqual(len(self.calls), 1, 'connections to the same account share an entry')
+        self.resource(other)
+        self.assertEqual(len(self.calls), 2, 'connections to another account do not')
+
+    def testLRUEviction(self):
+        self.resource('a')
+        self.resource('b')
+        self.resource('a')
+        self.resource('c')
+        self.assertEqual(self.resource.evictionCount, 1)
+        self.assertEqual(len(self.resource.entries), 2, 'bounded number of entries')
+        self.resource('a')
+        self.assertEqual(len(self.calls), 3, 'recently used entry survives eviction')
+        self.resource('b')
+        self.assertEqual(len(self.calls), 4, 'least recently used entry was evicted')
+
+    def testInterval(self):
+        self.resource.interval = 0
+        self.resource('a')
+        self.assertEqual(self.resource.resourceFor('a').interval, 0, 'entries take the wrapper interval')
+        self.resource.clear()
+        self.assertEqual(self.resource.entries, {})
+
+    def testStats(self):
+        self.resource('a')
+        self.resource('a')
+        self.resource('b')
+        self.resource('c')
+        stats = self.resource.stats()
+        self.assertEqual((stats['entries'], stats['evictions'], stats['size']), (2, 1, 2))
+        self.assertEqual((stats['calls'], stats['hits'], stats['initializations']), (4, 1, 3), 'evicted entries still count')
+        self.resource.clear()
+        self.assertEqual((self.resource.stats()['calls'], self.resource.stats()['size']), (4, 0))
 
 class TestRackspaceAPIObjects(test_helper.TestCase):
     def testAPIServerManagementInterface(self):
@@ -117,13 +259,17 @@ class TestRackspaceAPIObjects(test_helper.TestCase):
                 'createSharedIPGroup',
                 'deleteServer',
                 'deleteSharedIPGroup',
-                {'name':'getFlavors', 'wrapper': thunderhead.rackspace.api.CachedResource},
-                {'name':'getImages', 'wrapper': thunderhead.rackspace.api.CachedResource},
+                {'name':'getFlavors', 'wrapper': thunderhead.rackspace.api.KeyedCachedResource},
+                {'name':'getImages', 'wrapper': thunderhead.rackspace.api.KeyedCachedResource},
                 'getPublicIPs',
-                {'name':'getServers', 'wrapper': thunderhead.rackspace.api.CachedResource},
-                {'name':'getSharedIPGroups', 'wrapper': thunderhead.rackspace.api.CachedResource},
+                {'name':'getServers', 'wrapper': thunderhead.rackspace.api.KeyedCachedResource},
+                {'name':'getSharedIPGroups', 'wrapper': thunderhead.rackspace.api.KeyedCachedResource},
+                'iterFlavors',
+                'iterImages',
+                'iterServers',
                 {'name':'Server', 'wrapper': None},
                 'shareIP',
+                'waitForServers',
             ],
             'serverManagementInterface provides appropriate functions and wrappers',
         )
@@ -197,6 +343,101 @@ class TestRackspaceAPIObjects(test_helper.TestCase):
         )
 
 
+    def testToXMLString(self):
+        api = thunderhead.rackspace.api
+        objects = [
+            api.Server(
+                id=12, name='web', imageId=2, flavorId=1,
+                publicIPs=['10.10.1.1'], privateIPs=['192.168.1.1', '192.168.70.1'],
+                metadata={'aard': 'vark'}, files={'/path/a': 'Path A file content'},
+            ),
+            api.SharedIP(configureServer='true', sharedIpGroupId=5),
+            api.SharedIPGroup(id=123, name='one', server_id=99),
+            api.SharedIPGroup(id=123, name='many', servers=[77, 88]),
+            api.SharedIPGroup(name='none'),
+        ]
+        for obj in objects:
+            self.assertEqual(obj.toXMLString(), obj.toXML().toxml(), 'string serialization matches the DOM for ' + obj.__class__.__name__)
+
+    def testToXMLStringEscaping(self):
+        server = thunderhead.rackspace.api.Server(
+            name=u'Caf\xe9 "<&>"\tnew\nline',
+            metadata={'a&b': '<text> & "quotes"'},
+        )
+        xml = server.toXMLString()
+        self.assertTrue(isinstance(xml, str), 'serialized to bytes')
+        node = minidom.parseString(xml).documentElement
+        self.assertEqual(node.getAttribute('name'), server.name, 'attribute round-trips, whitespace included')
+        meta, = node.getElementsByTagName('meta')
+        self.assertEqual(meta.getAttribute('key'), 'a&b')
+        self.assertEqual(meta.firstChild.data, '<text> & "quotes"')
+
+class ScriptedWaiter(thunderhead.rackspace.api.ServerWaiter):
+    def __init__(self, polls, *args, **kwargs):
+        thunderhead.rackspace.api.ServerWaiter.__init__(self, None, *args, **kwargs)
+        self.polls = polls
+        self.fetches = []
+        self.delays = []
+        self.clock = thunderhead.clock.ManualClock(0, 1000)
+
+    def fetch(self, since):
+        self.fetches.append(since)
+        return dict([(server.id, server) for server in self.polls.pop(0)])
+
+    def sleep(self, delay):
+        self.delays.append(delay)
+        self.clock.advance(delay)
+
+def building(id, progress, status='BUILD'):
+    return thunderhead.rackspace.api.Server(id=id, status=status, progress=progress)
+
+class TestRackspaceAPIServerWaiter(test_helper.TestCase):
+    def testSharedPolling(self):
+        finished = []
+        waiter = ScriptedWaiter([
+            [building(1, 0), building(2, 0), building(3, 100, 'ACTIVE')],
+            [building(1, 10), building(2, 20)],
+            [building(2, 100, 'ACTIVE')],
+            [building(1, 100, 'ERROR')],
+        ], [1, thunderhead.rackspace.api.Server(id=2), 3], callback=finished.append)
+        servers = waiter.wait()
+        self.assertEqual(sorted(servers.keys()), [1, 2, 3])
+        self.assertEqual([s.id for s in finished], [3, 2, 1], 'callback as each server finishes')
+        self.assertEqual(servers[1].status, 'ERROR', 'failed servers finish too')
+        self.assertEqual(waiter.fetches, [None, 1000, 1020, 1020 + waiter.delays[1]], 'one full poll, then changes-since')
+        self.assertEqual(min(waiter.delays), 20, 'changes-since polls kept within 3 a minute')
+
+    def testAdaptiveDelay(self):
+        waiter = ScriptedWaiter([
+            [building(1, 0)],
+            [],
+            [building(1, 10)],
+            [building(1, 100)],
+            [building(1, 100, 'ACTIVE')],
+        ], [1])
+        waiter.wait()
+        self.assertEqual(waiter.delays[:2], [20, 40], 'delay doubles without progress')
+        self.assertEqual(waiter.delays[2], 120, 'progress rate estimate is capped at maxInterval')
+        self.assertEqual(waiter.delays[3], waiter.minInterval, 'quick poll once progress is complete')
+
+    def testTimeout(self):
+        waiter = ScriptedWaiter([[building(1, 0), building(2, 100, 'ACTIVE')]] + [[]] * 10, [1, 2], timeout=20)
+        try:
+            waiter.wait()
+            self.fail('WaitTimeoutException expected')
+        except thunderhead.rackspace.exceptions.WaitTimeoutException, e:
+            self.assertEqual(e.pending, set([1]))
+            self.assertEqual(e.servers.keys(), [2])
+        self.assertEqual(sum(waiter.delays), 20, 'waits no longer than the timeout')
+
+    def testMissingServers(self):
+        waiter = ScriptedWaiter([[building(1, 0)], [building(1, 100, 'ACTIVE')]], [1, 9])
+        servers = waiter.wait()
+        self.assertEqual(servers.keys(), [1])
+        self.assertEqual(waiter.missing, set([9]), 'ids absent from the full listing are not waited on')
+        waiter = ScriptedWaiter([[], [building(9, 100, 'ACTIVE')]], [9], since=999)
+        self.assertEqual(waiter.wait().keys(), [9], 'a changes-since listing proves nothing missing')
+
 class TestRackspaceAPIInteractions(test_helper.TestCase):
     def setUp(self):
         self.server = test_helper.APIServer.test()
@@ -239,6 +480,28 @@ class TestRackspaceAPIInteractions(test_helper.TestCase):
         self.assertEqual(two.publicIPs, ['67.23.10.133'])
         self.assertEqual(two.privateIPs, ['10.176.42.17'])
 
+    def testWaitForServers(self):
+        servers = thunderhead.rackspace.api.waitForServers(self.connection, [5678])
+        self.assertEqual(servers[5678].status, 'ACTIVE')
+        self.assertEqual(self.server.getRequestData()['path'], '/servers/detail')
+
+    def testIterServers(self):
+        servers = thunderhead.rackspace.api.iterServers(self.connection)
+        self.assertFalse(hasattr(servers, 'has_key'), 'iterServers result is not a dictionary')
+        first = servers.next()
+        self.assertEqual((first.id, first.name), (1234, 'sample-server'))
+        self.assertEqual([s.id for s in servers], [5678], 'servers yielded in document order')
+        self.assertEqual(self.server.getRequestData()['path'], '/servers/detail')
+
+    def testIterImages(self):
+        images = thunderhead.rackspace.api.iterImages(self.connection, since='foo')
+        self.assertEqual([i['id'] for i in images], [2, 743])
+        self.assertEqual(self.server.getRequestData()['path'], '/images/detail?changes-since=foo')
+
+    def testIterFlavors(self):
+        flavors = thunderhead.rackspace.api.iterFlavors(self.connection)
+        self.assertEqual([f['name'] for f in flavors], ['256 MB Server', '512 MB Server'])
+
     def testServersDetailSince(self):
         result = thunderhead.rackspace.api.getServers(self.connection, since='foo')
         request = self.server.getRequestData()
@@ -30,6 +30,9 @@ class ProviderStub(object):
             def __call__(object, *args, **kwargs):
                 return object.func(*(('wrapper',) + args), **kwargs)
 
+            def stats(self):
+                return {'calls': 0}
+
         serverManagementInterface = [
             'funcA',
             {'name': 'funcB', 'wrapper': None},
@@ -54,6 +57,40 @@ class ProviderStub(object):
             self.kwargs = kwargs
             self.serverManager = object()
 
+class Throttled(Exception):
+    def retryDelay(self):
+        return 0.01
+
+class BulkProviderStub(object):
+    class api(object):
+        serverManagementInterface = ['single']
+        bulkInterface = [{'name': 'many', 'function': 'single'}]
+        throttleExceptions = [Throttled]
+        calls = []
+        lock = test_helper.threading.Lock()
+
+        @classmethod
+        def single(self, conn, item, *args, **kwargs):
+            self.lock.acquire()
+            try:
+                self.calls.append(item)
+                attempts = self.calls.count(item)
+            finally:
+                self.lock.release()
+            if item == 'bad': raise ValueError(item)
+            if item == 'throttled' and attempts < 3: raise Throttled()
+            if item == 'hopeless': raise Throttled()
+            if item == 'exhausted':
+                e = Throttled()
+                e.retriesExhausted = True
+                raise e
+            test_helper.time.sleep(0.01)
+            return (conn, item, args, kwargs)
+
+    class Authorization(object):
+        def __init__(self, *args, **kwargs):
+            self.serverManager = 'connection'
+
 class TestAccountComposition(test_helper.TestCase):
     def setUp(self):
         self.provider = ProviderStub()
@@ -131,6 +168,54 @@ class TestAccountComposition(test_helper.TestCase):
     def testWrappedFunction(self):
         self.checkBasicInterface('funcC', 'wrapper', self.account.session.serverManager)
 
+    def testCacheStats(self):
+        self.assertEqual(self.account.cacheStats(), {'funcC': {'calls': 0}}, 'stats of wrappers that keep them')
+
+class TestAccountBulkOperations(test_helper.TestCase):
+    def setUp(self):
+        BulkProviderStub.api.calls = []
+        self.account = thunderhead.Account(BulkProviderStub)
+
+    def testBulkFunction(self):
+        self.assertTrue(isinstance(self.account.many, thunderhead.BulkOperation), 'Account gets bulk method')
+        self.assertEqual(self.account.many.workers, thunderhead.Account.bulkWorkers)
+        items = ['item%d' % i for i in range(20)]
+        results = self.account.many(items, 'extra', key='value')
+        self.assertEqual([r.item for r in results], items, 'results preserve input order')
+        self.assertEqual(
+            [r.result for r in results],
+            [('connection', i, ('extra',), {'key': 'value'}) for i in items],
+            'each item passed through to the single-item function with the extra arguments',
+        )
+        self.assertTrue(reduce(lambda a, b: a and b, [r.succeeded() for r in results]))
+
+    def testBulkFailures(self):
+        operation = self.account.many
+        operation.retries = 3
+        results = operation(['good', 'bad', 'throttled', 'hopeless', 'exhausted'])
+        self.assertEqual([r.succeeded() for r in results], [True, False, True, False, False])
+        self.assertTrue(isinstance(results[1].exception, ValueError), 'ordinary failure recorded per item')
+        self.assertEqual(results[2].result[1], 'throttled', 'throttled item retried until it succeeds')
+        self.assertTrue(isinstance(results[3].exception, Throttled), 'throttled item gives up after retries')
+        self.assertEqual(BulkProviderStub.api.calls.count('bad'), 1, 'ordinary failures are not retried')
+        self.assertEqual(BulkProviderStub.api.calls.count('throttled'), 3)
+        self.assertEqual(BulkProviderStub.api.calls.count('hopeless'), 4)
+        self.assertEqual(BulkProviderStub.api.calls.count('exhausted'), 1, 'not retried again after retries beneath')
+
+    def testBulkConcurrency(self):
+        start = test_helper.time.time()
+        self.account.many(range(40))
+        # 40 calls of 10ms each on 4 workers should take well under the serial 400ms
+        self.assertTrue(test_helper.time.time() - start < 0.3, 'bulk calls run concurrently')
+
+    def testBulkBackoff(self):
+        operation = thunderhead.BulkOperation(lambda x: x, 2, [Throttled])
+        operation.backoff = 0.5
+        self.assertEqual(operation.delayFor(Throttled(), 3), 0.01, 'retry hint preferred')
+        self.assertEqual(operation.delayFor(ValueError(), 3), 4.0, 'exponential backoff without a hint')
+        operation.maxBackoff = 2
+        self.assertEqual(operation.delayFor(ValueError(), 3), 2, 'backoff capped')
+
 if __name__ == '__main__':
     test_helper.main()
 
@@ -143,6 +143,88 @@ class TestCachedResource(test_helper.TestCase):
             '__call__ passes along keyword args to representation on update',
         )
 
+class BlockingCache(thunderhead.CachedResource):
+    def __init__(self):
+        self.release = test_helper.threading.Event()
+        self.calls = []
+        self.failures = 0
+
+    def initialize(self, *args, **kwargs):
+        self.calls.append('initialize')
+        self.release.wait(5)
+        if self.failures:
+            self.failures -= 1
+            raise ValueError('initialize failed')
+        self.asset = len(self.calls)
+
+    def update(self, *args, **kwargs):
+        self.calls.append('update')
+        self.release.wait(5)
+        self.asset = len(self.calls)
+
+class TestCachedResourceCoalescing(test_helper.TestCase):
+    def setUp(self):
+        self.cache = BlockingCache()
+        self.results = []
+        self.errors = []
+
+    def tearDown(self):
+        self.cache.release.set()
+
+    def call(self):
+        try:
+            self.results.append(self.cache())
+        except ValueError, e:
+            self.errors.append(e)
+
+    def concurrentCalls(self, count):
+        threads = [test_helper.threading.Thread(target=self.call) for i in range(count)]
+        for thread in threads: thread.start()
+        deadline = test_helper.time.time() + 5
+        while self.cache.coalescedCount < count - 1 and test_helper.time.time() < deadline:
+            test_helper.time.sleep(0.01)
+        self.cache.release.set()
+        for thread in threads: thread.join(5)
+
+    def testCoalescedInitialize(self):
+        self.concurrentCalls(8)
+        self.assertEqual(self.cache.calls, ['initialize'], 'a single initialize for concurrent callers')
+        self.assertEqual(self.results, [1] * 8, 'all callers share the result')
+        self.assertEqual((self.cache.callCount, self.cache.coalescedCount), (8, 7))
+
+    def testCoalescedUpdate(self):
+        self.cache.release.set()
+        self.cache()
+        self.cache.release.clear()
+        self.concurrentCalls(8)
+        self.assertEqual(self.cache.calls, ['initialize', 'update'], 'a single update for concurrent callers')
+        self.assertEqual(self.results, [2] * 8)
+        self.cache()
+        self.assertEqual(self.cache.calls, ['initialize', 'update', 'update'], 'sequential calls are not coalesced')
+
+    def testFailedInitialize(self):
+        self.cache.failures = 1
+        self.concurrentCalls(4)
+        self.assertEqual(len(self.errors), 1, 'failure raised to the caller that initialized')
+        self.assertEqual(self.cache.calls, ['initialize', 'initialize'], 'a waiting caller retries initialization')
+        self.assertEqual(self.results, [2] * 3)
+
+    def testAnswerFromCache(self):
+        self.cache.release.set()
+        self.cache()
+        self.cache.release.clear()
+        updater = test_helper.threading.Thread(target=self.call)
+        updater.start()
+        deadline = test_helper.time.time() + 5
+        while len(self.cache.calls) < 2 and test_helper.time.time() < deadline:
+            test_helper.time.sleep(0.01)
+        self.cache.answerFromCache = lambda *args, **kwargs: True
+        self.assertEqual(self.cache(), 1, 'answered at once while an update is in flight')
+        self.cache.release.set()
+        updater.join(5)
+        self.assertEqual(self.cache.calls, ['initialize', 'update'], 'no update for calls answered from the cache')
+        self.assertEqual((self.cache.callCount, self.cache.coalescedCount), (3, 0))
+
 if __name__ == '__main__':
     test_helper.main()
 
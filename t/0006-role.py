@@ -2,6 +2,9 @@
 
 import test_helper
 import thunderhead
+import thunderhead.rackspace.api as api
+from thunderhead.clock import ManualClock
+from thunderhead.rackspace.recordset import IndexedRecordSet
 
 class StubAccount(object):
     def __init__(self, *args, **kwargs):
@@ -22,6 +25,27 @@ class StubAccount(object):
     def createServer(self, *args, **kwargs):
         return self.handler('createServer', args, kwargs)
 
+    def iterServers(self, *args, **kwargs):
+        self.handler('iterServers', args, kwargs)
+        return ServerStream([{'role': 'foo', 'id': 1}, {'role': 'blah', 'id': 2}, {'role': 'foo', 'id': 3}])
+
+class ServerStream(object):
+    def __init__(self, servers):
+        self.servers = servers
+        self.consumed = 0
+        self.closed = False
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        if not self.servers: raise StopIteration
+        self.consumed += 1
+        return self.servers.pop(0)
+
+    def close(self):
+        self.closed = True
+
 class StubRole(thunderhead.Role):
     serverDefaults = {'x': 'X', 'y': 'Y'}
 
@@ -64,6 +88,19 @@ class TestRoleBaseClass(test_helper.TestCase):
             'getServers passes arguments through to account.getServers',
         )
 
+    def testIterServers(self):
+        servers = self.role.iterServers('a', c='C')
+        self.assertEqual(
+            self.account.calls.pop(),
+            (('iterServers', 'a'), {'c': 'C'}),
+            'iterServers passes arguments through to account.iterServers',
+        )
+        self.assertEqual(servers.next(), {'role': 'foo', 'id': 1})
+        self.assertEqual(servers.source.consumed, 1, 'iterServers consumes the source lazily')
+        self.assertEqual(servers.next(), {'role': 'foo', 'id': 3}, 'iterServers skips non-members')
+        servers.close()
+        self.assertTrue(servers.source.closed, 'close passed through to the source')
+
     def testCreateServer(self):
         result = self.role.createServer('a', 'b', c='C', d='D')
         last = self.account.calls.pop()
@@ -78,6 +115,82 @@ class TestRoleBaseClass(test_helper.TestCase):
             'createServer returns the result of account.createServer()',
         )
 
+class DeltaAccount(object):
+    def __init__(self, servers):
+        self.servers = IndexedRecordSet(servers)
+
+    def getServers(self):
+        return self.servers
+
+    def apply(self, delta):
+        servers = self.servers.copy()
+        for id, server in delta.iteritems():
+            if server is None:
+                servers.pop(id, None)
+            else:
+                servers[id] = server
+        self.servers = servers
+
+class TestRoleMembership(test_helper.TestCase):
+    def setUp(self):
+        self.account = DeltaAccount(dict([(id, {'role': 'foo', 'id': id}) for id in range(1, 101)]))
+        self.checked = []
+        self.joined = []
+        self.left = []
+        test = self
+        class CountingRole(StubRole):
+            account = self.account
+
+            @classmethod
+            def isMember(self, server):
+                test.checked.append(server['id'])
+                return StubRole.isMember(server)
+
+            @classmethod
+            def memberJoined(self, server): test.joined.append(server['id'])
+
+            @classmethod
+            def memberLeft(self, server): test.left.append(server['id'])
+        self.role = CountingRole
+
+    def testIncremental(self):
+        self.assertEqual(len(self.role.getServers()), 100)
+        self.assertEqual((len(self.checked), len(self.joined), self.left), (100, 100, []), 'first call checks everything')
+        del self.checked[:], self.joined[:]
+        self.role.getServers()
+        self.assertEqual(self.checked, [], 'unchanged server set needs no checks')
+        self.account.apply({5: {'role': 'blah', 'id': 5}, 7: None, 101: {'role': 'foo', 'id': 101}})
+        members = self.role.getServers()
+        self.assertEqual(sorted(self.checked), [5, 101], 'only changed servers are checked')
+        self.assertEqual((self.joined, sorted(self.left)), ([101], [5, 7]))
+        self.assertEqual(sorted(members.keys()), range(1, 5) + [6] + range(8, 102))
+
+    def testFullRecheck(self):
+        self.role.getServers()
+        for i in range(self.account.servers.changeLog.size + 1):
+            self.account.apply({1: {'role': 'foo', 'id': 1}})
+        self.account.apply({2: None})
+        del self.checked[:], self.joined[:]
+        self.assertEqual(len(self.role.getServers()), 99)
+        self.assertEqual((len(self.checked), self.left), (99, [2]), 'servers rechecked once the change log is exceeded')
+        self.account.servers = IndexedRecordSet({2: {'role': 'foo', 'id': 2}})
+        self.assertEqual(self.role.getServers().keys(), [2], 'unrelated server sets get a full check')
+        self.assertEqual(self.joined, [2])
+
+    def testUnindexedCache(self):
+        deltas = [{5: {'role': 'blah', 'id': 5}, 7: {'id': 7, 'status': 'DELETED'}}]
+        full = dict(self.account.servers)
+        cache = api.CachedResource(lambda since=None: (since is None and full) or deltas.pop(0))
+        cache.clock = ManualClock()
+        self.account.getServers = cache
+        self.role.getServers()
+        del self.checked[:]
+        cache.clock.advance(cache.interval)
+        self.assertEqual(len(self.role.getServers()), 98)
+        self.assertEqual(self.checked, [5], 'deltas tracked without indexing')
+        self.assertEqual(sorted(self.left), [5, 7])
+
+
 if __name__ == '__main__':
     test_helper.main()
 
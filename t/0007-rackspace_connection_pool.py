@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+
+##  Copyright (c) 2009-2010 Ethan Rowe (ethan@endpoint.com)
+##  For more information, see http://github.com/ethanrowe/thunderhead
+##
+##  This file is part of Thunderhead.
+##
+##  Thunderhead is free software: you can redistribute it and/or modify
+##  it under the terms of the GNU General Public License as published by
+##  the Free Software Foundation, either version 3 of the License, or
+##  (at your option) any later version.
+##
+##  Thunderhead is distributed in the hope that it will be useful,
+##  but WITHOUT ANY WARRANTY; without even the implied warranty of
+##  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##  GNU General Public License for more details.
+##
+##  You should have received a copy of the GNU General Public License
+##  along with Thunderhead.  If not, see <http://www.gnu.org/licenses/>.
+
+import test_helper
+import threading
+import thunderhead.rackspace
+import thunderhead.rackspace.exceptions as exceptions
+
+class StubConnection(object):
+    active = 0
+    peak = 0
+    lock = threading.Lock()
+
+    def __init__(self, url, headers):
+        self.url = url
+        self.headers = headers
+        self.closed = False
+        self.requests = []
+
+    def request(self, method, url, body=None, headers={}):
+        klass = StubConnection
+        klass.lock.acquire()
+        klass.active += 1
+        klass.peak = max(klass.peak, klass.active)
+        klass.lock.release()
+        try:
+            self.requests.append((method, url))
+            if url == '/fault': raise exceptions.ItemNotFoundException('gone', 404)
+            if url == '/broken': raise IOError('connection exploded')
+            if url == '/slow': test_helper.time.sleep(0.05)
+            return (None, 200)
+        finally:
+            klass.lock.acquire()
+            klass.active -= 1
+            klass.lock.release()
+
+    def close(self):
+        self.closed = True
+
+class StubPool(thunderhead.rackspace.ConnectionPool):
+    connectionClass = StubConnection
+
+class TestConnectionPool(test_helper.TestCase):
+    def setUp(self):
+        StubConnection.active = StubConnection.peak = 0
+        self.pool = StubPool('http://localhost:1234/prefix', {'X-Auth-Token': 'token'}, 2)
+
+    def testAttributes(self):
+        self.assertEqual(self.pool.scheme, 'http')
+        self.assertEqual(self.pool.host, 'localhost')
+        self.assertEqual(self.pool.port, 1234)
+        self.assertEqual(self.pool.pathPrefix, '/prefix')
+        self.assertEqual(self.pool.size, 2, 'size set from constructor')
+        self.assertEqual(self.pool.idleTimeout, thunderhead.rackspace.ConnectionPool.idleTimeout)
+
+    def testConnectionReused(self):
+        self.assertEqual(self.pool.request('GET', '/a'), (None, 200))
+        self.assertEqual(self.pool.request('GET', '/b'), (None, 200))
+        self.assertEqual(self.pool.createdCount, 1, 'serial requests share one connection')
+        connection = self.pool.checkout()
+        self.assertEqual(connection.requests, [('GET', '/a'), ('GET', '/b')])
+        self.assertEqual(connection.headers, {'X-Auth-Token': 'token'}, 'connections get pool headers')
+
+    def testFaultKeepsConnection(self):
+        self.assertRaises(exceptions.ItemNotFoundException, self.pool.request, 'GET', '/fault')
+        self.assertEqual(len(self.pool.idle), 1, 'connection returned after fault response')
+        self.assertRaises(IOError, self.pool.request, 'GET', '/broken')
+        self.assertEqual(len(self.pool.idle), 0, 'connection discarded after transport error')
+        self.assertEqual(self.pool.open, 0, 'discarded connection releases its slot')
+
+    def testIdleExpiry(self):
+        self.pool.idleTimeout = 0
+        self.pool.request('GET', '/a')
+        first = self.pool.idle[0][0]
+        self.pool.request('GET', '/b')
+        self.assertTrue(first.closed, 'idle connection closed once past idleTimeout')
+        self.assertEqual(self.pool.expiredCount, 1)
+        self.assertEqual(self.pool.createdCount, 2)
+
+    def testCheckoutTimeout(self):
+        self.pool.checkoutTimeout = 0.1
+        one = self.pool.checkout()
+        two = self.pool.checkout()
+        self.assertRaises(exceptions.PoolTimeoutException, self.pool.checkout)
+        self.assertEqual(self.pool.waitCount, 1)
+        self.pool.checkin(one)
+        self.assertTrue(self.pool.checkout() is one, 'returned connection is handed out again')
+
+    def testConcurrentRequests(self):
+        errors = []
+        def worker():
+            try:
+                for i in range(3): self.pool.request('GET', '/slow')
+            except Exception, e:
+                errors.append(e)
+        threads = [threading.Thread(target=worker) for i in range(6)]
+        for thread in threads: thread.start()
+        for thread in threads: thread.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(StubConnection.peak, 2, 'concurrency bounded by pool size')
+        self.assertEqual(self.pool.createdCount, 2, 'no more connections than pool size')
+        self.assertEqual(sum([len(c.requests) for c, t in self.pool.idle]), 18)
+
+    def testClose(self):
+        self.pool.request('GET', '/a')
+        connection = self.pool.idle[0][0]
+        self.pool.close()
+        self.assertTrue(connection.closed)
+        self.assertEqual(self.pool.open, 0)
+
+if __name__ == '__main__':
+    test_helper.main()
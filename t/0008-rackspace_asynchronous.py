@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+
+##  Copyright (c) 2009-2010 Ethan Rowe (ethan@endpoint.com)
+##  For more information, see http://github.com/ethanrowe/thunderhead
+##
+##  This file is part of Thunderhead.
+##
+##  Thunderhead is free software: you can redistribute it and/or modify
+##  it under the terms of the GNU General Public License as published by
+##  the Free Software Foundation, either version 3 of the License, or
+##  (at your option) any later version.
+##
+##  Thunderhead is distributed in the hope that it will be useful,
+##  but WITHOUT ANY WARRANTY; without even the implied warranty of
+##  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##  GNU General Public License for more details.
+##
+##  You should have received a copy of the GNU General Public License
+##  along with Thunderhead.  If not, see <http://www.gnu.org/licenses/>.
+
+import test_helper
+import thunderhead.rackspace
+import thunderhead.rackspace.api
+import thunderhead.rackspace.asynchronous as asynchronous
+import thunderhead.rackspace.exceptions as exceptions
+
+def handleXMLResponse(server, xml, code=200):
+    server.send_response(code)
+    server.send_header('content-type', 'application/xml')
+    server.send_header('content-length', str(len(xml)))
+    server.end_headers()
+    server.wfile.write(xml)
+
+def handleChunkedResponse(server):
+    server.send_response(200)
+    server.send_header('content-type', 'application/xml')
+    server.send_header('transfer-encoding', 'chunked')
+    server.end_headers()
+    for chunk in ('<someNode>', 'chunked ', 'content</someNode>'):
+        server.wfile.write('%x\r\n%s\r\n' % (len(chunk), chunk))
+    server.wfile.write('0\r\n\r\n')
+
+class AsyncAuthorizationOverride(asynchronous.AsyncAuthorization):
+    pass
+
+class TestAsyncResult(test_helper.TestCase):
+    def testThen(self):
+        result = asynchronous.AsyncResult()
+        derived = result.then(lambda (x): x * 2)
+        self.assertFalse(derived.done)
+        result.succeed(21)
+        self.assertEqual(derived.get(), 42, 'then() applies function to value')
+        failed = asynchronous.AsyncResult()
+        derived = failed.then(lambda (x): x * 2)
+        failed.fail(ValueError('bad'))
+        self.assertRaises(ValueError, derived.get)
+
+    def testThenFollowsResult(self):
+        inner = asynchronous.AsyncResult()
+        outer = asynchronous.AsyncResult()
+        derived = outer.then(lambda (x): inner)
+        outer.succeed(1)
+        self.assertFalse(derived.done, 'derived result waits on returned AsyncResult')
+        inner.succeed('inner')
+        self.assertEqual(derived.get(), 'inner')
+
+    def testGather(self):
+        results = [asynchronous.AsyncResult() for i in range(3)]
+        combined = asynchronous.gather(results)
+        for i in (2, 0, 1):
+            results[i].succeed(i)
+        self.assertEqual(combined.get(), [0, 1, 2], 'gather preserves order')
+        self.assertEqual(asynchronous.gather([]).get(), [])
+
+class TestAsyncConnection(test_helper.TestCase):
+    def connection(self):
+        return asynchronous.AsyncBoundConnection(
+            'http://localhost:' + str(self.server.port),
+            {'X-Auth-Token': 'SOME-AUTH-TOKEN'},
+            4,
+            {},
+        )
+
+    def testAuthorization(self):
+        self.server = test_helper.Authenticator.test()
+        AsyncAuthorizationOverride.baseURL = 'http://localhost:' + str(self.server.port)
+        session = AsyncAuthorizationOverride.authorize('foofoo', 'password', {}).wait(5)
+        request = self.server.getRequestData()
+        self.server.finish(1)
+        self.assertEqual(request['headers']['x-auth-user'], 'foofoo')
+        self.assertEqual(request['headers']['x-auth-key'], 'password')
+        self.assertEqual(session.authToken, self.server.authToken)
+        self.assertTrue(isinstance(session.serverManager, asynchronous.AsyncBoundConnection))
+        self.assertEqual(session.serverManager.pathPrefix, '/server')
+        self.assertEqual(session.serverManager.headers, {'X-Auth-Token': self.server.authToken})
+
+    def testAuthorizationFailure(self):
+        self.server = test_helper.StubServer.test({'get': lambda (request): request.send_response(401)})
+        AsyncAuthorizationOverride.baseURL = 'http://localhost:' + str(self.server.port)
+        result = AsyncAuthorizationOverride.authorize('bah', 'blah', {})
+        self.assertRaises(exceptions.BadCredentialsException, result.wait, 5)
+        self.server.finish(1)
+
+    def testGetServers(self):
+        self.server = test_helper.APIServer.test()
+        servers = asynchronous.getServers(self.connection(), since='foo').wait(5)
+        self.assertEqual(self.server.getRequestData()['path'], '/servers/detail?changes-since=foo')
+        self.server.finish()
+        self.assertEqual(servers.keys(), [1234, 5678])
+        self.assertTrue(isinstance(servers[1234], thunderhead.rackspace.api.Server), 'same model classes as blocking api')
+        self.assertEqual(servers[1234].publicIPs, ['67.23.10.132', '67.23.10.131'])
+
+    def testFault(self):
+        xml = '<itemNotFound><message>Nope</message></itemNotFound>'
+        self.server = test_helper.StubServer.test({'delete': lambda (server): handleXMLResponse(server, xml, 404)})
+        result = asynchronous.deleteServer(self.connection(), 1234)
+        self.assertRaises(exceptions.ItemNotFoundException, result.wait, 5)
+        self.assertEqual(self.server.getRequestData()['path'], '/servers/1234')
+        self.server.finish()
+
+    def testChunkedResponse(self):
+        self.server = test_helper.StubServer.test({'get': handleChunkedResponse}, protocol='HTTP/1.1')
+        connection = self.connection()
+        (body, code) = connection.request('GET', '/chunked').wait(5)
+        connection.close()
+        self.server.finish()
+        self.assertEqual((body.nodeName, body.firstChild.data), ('someNode', 'chunked content'))
+
+    def testManyRequestsInFlight(self):
+        xml = '<someNode>content</someNode>'
+        self.server = test_helper.StubServer.test({'get': lambda (server): handleXMLResponse(server, xml)}, connections=10)
+        connection = self.connection()
+        pending = [connection.request('GET', '/item/' + str(i)) for i in range(10)]
+        self.assertEqual(len(connection.channels), 4, 'connections opened up to the limit')
+        self.assertEqual(len(connection.pending), 6, 'remaining requests queued')
+        results = asynchronous.gather(pending).wait(10)
+        paths = [self.server.getRequestData()['path'] for i in range(10)]
+        paths.sort()
+        self.server.finish()
+        self.assertEqual([code for (body, code) in results], [200] * 10)
+        self.assertEqual(paths, sorted(['/item/' + str(i) for i in range(10)]))
+
+    def testKeepAlive(self):
+        xml = '<someNode>content</someNode>'
+        self.server = test_helper.StubServer.test({'get': lambda (server): handleXMLResponse(server, xml)}, protocol='HTTP/1.1')
+        connection = self.connection()
+        for i in range(3):
+            connection.request('GET', '/item/' + str(i)).wait(5)
+        connection.close()
+        self.server.finish()
+        self.assertEqual(connection.requestCount, 3)
+        self.assertEqual(connection.reuseCount, 2, 'one connection carries all serial requests')
+
+if __name__ == '__main__':
+    test_helper.main()
@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+
+##  Copyright (c) 2009-2010 Ethan Rowe (ethan@endpoint.com)
+##  For more information, see http://github.com/ethanrowe/thunderhead
+##
+##  This file is part of Thunderhead.
+##
+##  Thunderhead is free software: you can redistribute it and/or modify
+##  it under the terms of the GNU General Public License as published by
+##  the Free Software Foundation, either version 3 of the License, or
+##  (at your option) any later version.
+##
+##  Thunderhead is distributed in the hope that it will be useful,
+##  but WITHOUT ANY WARRANTY; without even the implied warranty of
+##  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##  GNU General Public License for more details.
+##
+##  You should have received a copy of the GNU General Public License
+##  along with Thunderhead.  If not, see <http://www.gnu.org/licenses/>.
+
+import test_helper
+import StringIO
+import xml.dom.minidom as minidom
+import xml.parsers.expat as expat
+import thunderhead.rackspace
+import thunderhead.rackspace.api as api
+import thunderhead.rackspace.stream as stream
+
+class ChunkedSource(object):
+    def __init__(self, data, size):
+        self.chunks = [data[i:i + size] for i in range(0, len(data), size)]
+        self.reads = 0
+
+    def read(self, size):
+        self.reads += 1
+        return (self.chunks and self.chunks.pop(0)) or ''
+
+def flavorDocument(count):
+    return '<flavors xmlns="%s">%s</flavors>' % (api.xmlns, ''.join([
+        '<flavor id="%d" name="Flavor %d" ram="256" disk="10" />' % (i, i) for i in range(1, count + 1)
+    ]))
+
+class TestRecordStream(test_helper.TestCase):
+    def setUp(self):
+        self.released = []
+
+    def flavorStream(self, source):
+        return stream.RecordStream(
+            source,
+            stream.AttributeRecordBuilder('flavor', api.flavorAttributes),
+            self.released.append,
+            64,
+        )
+
+    def testIncremental(self):
+        source = ChunkedSource(flavorDocument(100), 64)
+        records = self.flavorStream(source)
+        first = records.next()
+        self.assertEqual(first, {'id': 1, 'name': 'Flavor 1', 'ram': 256, 'disk': 10})
+        self.assertTrue(source.reads < 3, 'first record available after reading only the first chunks')
+        self.assertEqual([r['id'] for r in records], range(2, 101), 'remaining records follow in order')
+        self.assertEqual(self.released, [True], 'exhausted stream releases a reusable connection')
+
+    def testEarlyClose(self):
+        source = ChunkedSource(flavorDocument(100), 64)
+        records = self.flavorStream(source)
+        records.next()
+        records.close()
+        self.assertEqual(source.chunks, [], 'close drains the rest of the body')
+        self.assertEqual(self.released, [True])
+        self.assertEqual(list(records), [], 'closed stream yields nothing further')
+        self.assertEqual(self.released, [True], 'release happens only once')
+
+    def testParseError(self):
+        records = self.flavorStream(ChunkedSource('<flavors><flavor id="1"></flavors>', 64))
+        self.assertRaises(expat.ExpatError, list, records)
+        self.assertEqual(self.released, [False], 'parse error releases the connection as unusable')
+
+    def testEmptySource(self):
+        self.assertEqual(list(self.flavorStream(None)), [])
+        self.assertEqual(self.released, [True])
+
+    def testServerBuilder(self):
+        xml = test_helper.APIServer(None).serversDetail()[0]
+        streamed = list(stream.RecordStream(StringIO.StringIO(xml), api.ServerBuilder(), None, 16))
+        parsed = [api.Server.fromXML(node) for node in minidom.parseString(xml).getElementsByTagName('server')]
+        self.assertEqual(len(streamed), 2)
+        for (s, p) in zip(streamed, parsed):
+            self.assertTrue(isinstance(s, api.Server))
+            self.assertEqual(s.__dict__, p.__dict__, 'streamed server matches Server.fromXML')
+
+class StubStreamConnection(object):
+    def __init__(self, url, headers):
+        self.closed = False
+
+    def requestStream(self, method, url, builder, body=None, headers={}):
+        return stream.RecordStream(StringIO.StringIO(flavorDocument(3)), builder)
+
+    def close(self):
+        self.closed = True
+
+class TestStreamingConnections(test_helper.TestCase):
+    def testPoolHoldsConnectionWhileStreaming(self):
+        pool = thunderhead.rackspace.ConnectionPool('http://localhost/', {}, 1)
+        pool.connectionClass = StubStreamConnection
+        records = pool.requestStream('GET', '/flavors/detail', stream.AttributeRecordBuilder('flavor', api.flavorAttributes))
+        records.next()
+        self.assertEqual((pool.open, len(pool.idle)), (1, 0), 'connection checked out during iteration')
+        self.assertEqual(len(list(records)), 2)
+        self.assertEqual(len(pool.idle), 1, 'connection returned once the stream is exhausted')
+
+    def testPoolRecoversDroppedStream(self):
+        pool = thunderhead.rackspace.ConnectionPool('http://localhost/', {}, 1, checkoutTimeout=0.1)
+        pool.connectionClass = StubStreamConnection
+        builder = stream.AttributeRecordBuilder('flavor', api.flavorAttributes)
+        records = pool.requestStream('GET', '/flavors/detail', builder)
+        records.next()
+        del records
+        self.assertEqual((pool.open, len(pool.idle)), (0, 0), 'dropped stream discards its connection')
+        self.assertEqual(len(list(pool.requestStream('GET', '/flavors/detail', builder))), 3)
+        self.assertEqual(len(pool.idle), 1)
+
+    def testStreamFault(self):
+        xml = '<itemNotFound><message>Nope</message></itemNotFound>'
+        server = test_helper.StubServer.test({
+            'get': lambda (handler): test_helper.xmlResponse(handler, xml, 404)
+        })
+        connection = thunderhead.rackspace.BoundConnection('http://localhost:' + str(server.port), {})
+        self.assertRaises(
+            thunderhead.rackspace.exceptions.ItemNotFoundException,
+            connection.requestStream, 'GET', '/servers/detail', api.ServerBuilder(),
+        )
+        server.finish()
+
+if __name__ == '__main__':
+    test_helper.main()
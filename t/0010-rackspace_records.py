@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+
+##  Copyright (c) 2009-2010 Ethan Rowe (ethan@endpoint.com)
+##  For more information, see http://github.com/ethanrowe/thunderhead
+##
+##  This file is part of Thunderhead.
+##
+##  Thunderhead is free software: you can redistribute it and/or modify
+##  it under the terms of the GNU General Public License as published by
+##  the Free Software Foundation, either version 3 of the License, or
+##  (at your option) any later version.
+##
+##  Thunderhead is distributed in the hope that it will be useful,
+##  but WITHOUT ANY WARRANTY; without even the implied warranty of
+##  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##  GNU General Public License for more details.
+##
+##  You should have received a copy of the GNU General Public License
+##  along with Thunderhead.  If not, see <http://www.gnu.org/licenses/>.
+
+import test_helper
+import pickle
+import xml.dom.minidom as minidom
+import thunderhead.rackspace.api as api
+import thunderhead.rackspace.records as records
+
+serverXML = '''<server xmlns="%s" id="1234" name="sample" imageId="2" flavorId="1" status="ACTIVE" hostId="abc" progress="100">
+    <metadata><meta key="Role">web</meta></metadata>
+    <addresses><public><ip addr="67.23.10.132" /></public><private><ip addr="10.176.42.16" /></private></addresses>
+</server>''' % api.xmlns
+
+class TestRecord(test_helper.TestCase):
+    def testMapping(self):
+        image = records.Image(id=2, name='CentOS', status='ACTIVE')
+        self.assertEqual(image['name'], 'CentOS')
+        self.assertEqual(image.name, 'CentOS', 'fields are attributes too')
+        self.assertTrue(image.has_key('status'))
+        self.assertFalse(image.has_key('progress'), 'unset fields are absent')
+        self.assertFalse('bogus' in image)
+        self.assertEqual(image.get('progress', 0), 0)
+        self.assertRaises(KeyError, lambda: image['progress'])
+        self.assertEqual(sorted(image.keys()), ['id', 'name', 'status'])
+        self.assertEqual(len(image), 3)
+        image['progress'] = 50
+        self.assertEqual(image.progress, 50)
+
+    def testFixedSurface(self):
+        flavor = records.Flavor(id=1)
+        self.assertRaises(AttributeError, setattr, flavor, 'bogus', 1)
+        self.assertRaises(AttributeError, records.Flavor, bogus=1)
+        self.assertFalse(hasattr(flavor, '__dict__'))
+
+    def testEquality(self):
+        values = {'id': 1, 'name': '256 server', 'ram': 256, 'disk': 10}
+        self.assertEqual(records.Flavor(**values), values)
+        self.assertEqual(values, records.Flavor(**values))
+        self.assertEqual(records.Flavor(**values), records.FrozenFlavor(**values))
+        self.assertNotEqual(records.Flavor(**values), dict(values, ram=512))
+        self.assertNotEqual(records.Flavor(**values), None)
+        self.assertEqual({1: records.Flavor(**values)}, {1: values}, 'equal within containers')
+
+    def testFrozen(self):
+        ip = records.FrozenPublicIP(addr='10.0.0.1')
+        self.assertRaises(AttributeError, setattr, ip, 'addr', '10.0.0.2')
+        self.assertRaises(AttributeError, delattr, ip, 'addr')
+        self.assertEqual(ip.addr, '10.0.0.1')
+        self.assertEqual(len(set([ip, records.FrozenPublicIP(addr='10.0.0.1')])), 1, 'frozen records hash by value')
+        self.assertRaises(TypeError, hash, records.PublicIP(addr='10.0.0.1'))
+
+    def testPickle(self):
+        image = records.FrozenImage(id=2, name='CentOS')
+        for protocol in (0, 2):
+            copy = pickle.loads(pickle.dumps(image, protocol))
+            self.assertEqual(copy, image)
+            self.assertEqual(copy.__class__, records.FrozenImage)
+
+class TestCompactModels(test_helper.TestCase):
+    def tearDown(self):
+        api.useStandardRecords()
+
+    def assertSameServer(self, compact, standard):
+        for name in api.Server.simpleAttributes + api.Server.integerAttributes:
+            self.assertEqual(getattr(compact, name, None), getattr(standard, name, None), name)
+
+    def testCompactServer(self):
+        node = minidom.parseString(serverXML).documentElement
+        standard = api.Server.fromXML(node)
+        compact = api.CompactServer.fromXML(node)
+        self.assertSameServer(compact, standard)
+        self.assertFalse(hasattr(compact, '__dict__'))
+        self.assertEqual(compact.toXML().toxml(), standard.toXML().toxml(), 'same serialization')
+        compact.name = 'renamed'
+        self.assertEqual(compact.name, 'renamed')
+        self.assertRaises(AttributeError, setattr, compact, 'bogus', 1)
+
+    def testFrozenServer(self):
+        server = api.FrozenServer.fromXML(minidom.parseString(serverXML).documentElement)
+        self.assertEqual(server.id, 1234)
+        self.assertRaises(AttributeError, setattr, server, 'name', 'renamed')
+        copy = pickle.loads(pickle.dumps(server))
+        self.assertSameServer(copy, server)
+
+    def testCompactSharedIPGroup(self):
+        group = api.FrozenSharedIPGroup(id=1, name='group', servers=[3, 2])
+        self.assertEqual(group.servers, [2, 3])
+        self.assertEqual(group.toXML().toxml(), api.SharedIPGroup(id=1, name='group', servers=[3, 2]).toXML().toxml())
+        self.assertRaises(AttributeError, setattr, group, 'name', 'renamed')
+
+    def testStandardPickle(self):
+        server = pickle.loads(pickle.dumps(api.Server(id=5, name='plain')))
+        self.assertEqual((server.id, server.name), (5, 'plain'))
+
+    def testUseCompactRecords(self):
+        xml = minidom.parseString('<images><image id="2" name="CentOS" status="ACTIVE" /></images>')
+        self.assertEqual(type(api.imagesFromXML(xml)[2]), dict)
+        api.useCompactRecords()
+        self.assertEqual(type(api.imagesFromXML(xml)[2]), records.Image)
+        self.assertEqual(type(api.serverFromXML(minidom.parseString(serverXML).documentElement)), api.CompactServer)
+        api.useCompactRecords(frozen=True)
+        self.assertEqual(type(api.imagesFromXML(xml)[2]), records.FrozenImage)
+        self.assertEqual(api.imagesFromXML(xml), {2: {'id': 2, 'name': 'CentOS', 'status': 'ACTIVE'}})
+        api.useStandardRecords()
+        self.assertEqual(type(api.serverFromXML(minidom.parseString(serverXML).documentElement)), api.Server)
+
+    def testPerConnectionRecordTypes(self):
+        class Connection(object):
+            recordTypes = None
+            def request(self, method, url, body=None, headers={}):
+                return (minidom.parseString(serverXML).documentElement, 202)
+        conn = Connection()
+        server = api.Server(id=1234, name='sample')
+        self.assertEqual(type(api.createServer(conn, server)), api.Server)
+        conn.recordTypes = api.frozenRecordTypes
+        self.assertEqual(type(api.createServer(conn, server)), api.FrozenServer)
+        self.assertEqual(type(api.createServer(Connection(), server)), api.Server, 'other connections unaffected')
+        xml = minidom.parseString('<images><image id="2" name="CentOS" status="ACTIVE" /></images>')
+        self.assertEqual(type(api.imagesFromXML(xml, api.compactRecordTypes)[2]), records.Image)
+        self.assertEqual(type(api.imagesFromXML(xml)[2]), dict)
+
+if __name__ == '__main__':
+    test_helper.main()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+
+##  Copyright (c) 2009-2010 Ethan Rowe (ethan@endpoint.com)
+##  For more information, see http://github.com/ethanrowe/thunderhead
+##
+##  This file is part of Thunderhead.
+##
+##  Thunderhead is free software: you can redistribute it and/or modify
+##  it under the terms of the GNU General Public License as published by
+##  the Free Software Foundation, either version 3 of the License, or
+##  (at your option) any later version.
+##
+##  Thunderhead is distributed in the hope that it will be useful,
+##  but WITHOUT ANY WARRANTY; without even the implied warranty of
+##  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##  GNU General Public License for more details.
+##
+##  You should have received a copy of the GNU General Public License
+##  along with Thunderhead.  If not, see <http://www.gnu.org/licenses/>.
+
+import test_helper
+import os, shutil, tempfile
+import thunderhead.clock
+import thunderhead.rackspace.api as api
+import thunderhead.rackspace.store as store
+
+class StoreTestCase(test_helper.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.store = store.DiskStore(os.path.join(self.directory, 'cache'))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+class TestDiskStore(StoreTestCase):
+    def testRoundTrip(self):
+        key = ('getServers', ('account',), ())
+        self.assertEqual(self.store.load(key), None, 'nothing stored yet')
+        asset = {1: api.Server(id=1, name='web'), 2: api.Server(id=2, name='db')}
+        self.assertTrue(self.store.save(key, 1000, asset))
+        timestamp, loaded = self.store.load(key)
+        self.assertEqual(timestamp, 1000)
+        self.assertEqual(dict([(k, v.name) for k, v in loaded.iteritems()]), {1: 'web', 2: 'db'})
+        self.assertEqual(self.store.load(('getServers', ('other',), ())), None, 'keys are separate')
+        self.assertEqual(
+            [name for name in os.listdir(self.store.directory) if name.endswith('.tmp')],
+            [],
+            'no temporary files left behind',
+        )
+
+    def testNewerWins(self):
+        self.store.save('key', 2000, {'a': 2})
+        self.assertFalse(self.store.save('key', 1000, {'a': 1}), 'older asset does not replace newer')
+        self.assertEqual(self.store.load('key'), (2000, {'a': 2}))
+        self.assertTrue(self.store.save('key', 3000, {'a': 3}))
+        self.assertEqual(self.store.load('key'), (3000, {'a': 3}))
+
+    def testVersionAndCorruption(self):
+        self.store.save('key', 1000, {'a': 1})
+        path = self.store.path('key')
+        data = open(path, 'rb').read()
+        open(path, 'wb').write(data.replace('thunderhead-cache 2', 'thunderhead-cache 0'))
+        self.assertEqual(self.store.load('key'), None, 'other format versions are ignored')
+        open(path, 'wb').write(self.store.header(1000) + 'garbage')
+        self.assertEqual(self.store.load('key'), None, 'corrupt files are ignored')
+        self.store.delete('key')
+        self.store.delete('key')
+        self.assertFalse(os.path.exists(path))
+        self.assertEqual(os.listdir(self.store.directory), [], 'lock file removed too')
+
+    def testSaveReadsOnlyHeader(self):
+        self.store.save('key', 2000, {'a': 2})
+        path = self.store.path('key')
+        # an asset that cannot be unpickled need not be, to be compared with
+        data = open(path, 'rb').read()
+        open(path, 'wb').write(data.splitlines(True)[0] + 'garbage')
+        self.assertFalse(self.store.save('key', 1000, {'a': 1}))
+        self.assertTrue(self.store.save('key', 2000.5, {'a': 3}))
+        self.assertEqual(self.store.load('key'), (2000.5, {'a': 3}))
+
+class TestCachedResourceStore(StoreTestCase):
+    def setUp(self):
+        StoreTestCase.setUp(self)
+        self.calls = []
+        self.clock = thunderhead.clock.ManualClock(0, 1000000)
+
+    def resource(self):
+        def getServers(conn, since=None):
+            self.calls.append(since)
+            return {len(self.calls): conn}
+        resource = api.KeyedCachedResource(getServers)
+        resource.store = self.store
+        resource.clock = self.clock
+        return resource
+
+    def testResume(self):
+        self.assertEqual(self.resource()('account'), {1: 'account'})
+        self.clock.advance(10)
+        resumed = self.resource()
+        self.assertEqual(resumed('account'), {1: 'account'}, 'fresh stored asset used without a request')
+        self.assertEqual(self.calls, [None])
+        self.clock.advance(50)
+        self.assertEqual(resumed('account'), {1: 'account', 2: 'account'})
+        self.assertEqual(self.calls, [None, 1000000], 'stored timestamp used for changes-since')
+        self.clock.advance(120)
+        self.assertEqual(self.resource()('account'), {1: 'account', 2: 'account', 3: 'account'},
+            'stale stored asset brought up to date on resume')
+        self.assertEqual(self.calls, [None, 1000000, 1000060])
+
+if __name__ == '__main__':
+    test_helper.main()
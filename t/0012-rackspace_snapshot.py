@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+
+##  Copyright (c) 2009-2010 Ethan Rowe (ethan@endpoint.com)
+##  For more information, see http://github.com/ethanrowe/thunderhead
+##
+##  This file is part of Thunderhead.
+##
+##  Thunderhead is free software: you can redistribute it and/or modify
+##  it under the terms of the GNU General Public License as published by
+##  the Free Software Foundation, either version 3 of the License, or
+##  (at your option) any later version.
+##
+##  Thunderhead is distributed in the hope that it will be useful,
+##  but WITHOUT ANY WARRANTY; without even the implied warranty of
+##  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##  GNU General Public License for more details.
+##
+##  You should have received a copy of the GNU General Public License
+##  along with Thunderhead.  If not, see <http://www.gnu.org/licenses/>.
+
+import test_helper
+import os, shutil, tempfile
+import thunderhead.rackspace.api as api
+import thunderhead.rackspace.snapshot as snapshot
+
+def inventory():
+    servers = [
+        api.Server(id=30, name='web1', status='ACTIVE', imageId=2, flavorId=1, hostId='a',
+            publicIPs=['67.23.10.132'], privateIPs=['10.176.42.16'], metadata={'Role': 'web'}),
+        api.Server(id=10, name=u'caf\xe9', status='BUILD', imageId=2, progress=40),
+        api.Server(id=20, name='db1', status='ACTIVE', imageId=7, sharedIpGroupId=5),
+        api.Server(id=40),
+    ]
+    return dict([(server.id, server) for server in servers])
+
+class TestServerSnapshot(test_helper.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'servers.snapshot')
+        self.servers = inventory()
+        snapshot.writeSnapshot(self.servers, self.path)
+        self.snapshot = snapshot.ServerSnapshot(self.path)
+
+    def tearDown(self):
+        self.snapshot.close()
+        shutil.rmtree(self.directory)
+
+    def assertSameServer(self, copy, original):
+        for name in api.Server.simpleAttributes + api.Server.integerAttributes:
+            self.assertEqual(getattr(copy, name, None), getattr(original, name, None), name)
+
+    def testLookup(self):
+        self.assertEqual(len(self.snapshot), 4)
+        self.assertEqual(self.snapshot.ids(), [10, 20, 30, 40])
+        for id, server in self.servers.iteritems():
+            self.assertTrue(id in self.snapshot)
+            self.assertSameServer(self.snapshot[id], server)
+        self.assertFalse(15 in self.snapshot)
+        self.assertEqual(self.snapshot.get(50), None)
+        self.assertRaises(KeyError, lambda: self.snapshot[50])
+        self.assertFalse(hasattr(self.snapshot[40], 'name'), 'absent attributes stay absent')
+
+    def testIndexes(self):
+        self.assertEqual(sorted(self.snapshot.statuses()), ['ACTIVE', 'BUILD'])
+        self.assertEqual([s.id for s in self.snapshot.withStatus('ACTIVE')], [20, 30])
+        self.assertEqual([s.id for s in self.snapshot.withStatus('DELETED')], [])
+        self.assertEqual(sorted(self.snapshot.imageIds()), [2, 7])
+        self.assertEqual([s.id for s in self.snapshot.withImage(2)], [10, 30])
+
+    def testAsset(self):
+        asset = self.snapshot.asset()
+        self.assertEqual(sorted(asset.keys()), sorted(self.servers.keys()))
+        for id, server in asset.iteritems():
+            self.assertSameServer(server, self.servers[id])
+
+    def testEmptyAndInvalid(self):
+        empty = os.path.join(self.directory, 'empty.snapshot')
+        snapshot.writeSnapshot({}, empty)
+        emptySnapshot = snapshot.ServerSnapshot(empty)
+        self.assertEqual((len(emptySnapshot), emptySnapshot.ids(), emptySnapshot.withStatus('ACTIVE')), (0, [], []))
+        emptySnapshot.close()
+        bogus = os.path.join(self.directory, 'bogus.snapshot')
+        open(bogus, 'wb').write('not a snapshot, but long enough to hold a header')
+        self.assertRaises(ValueError, snapshot.ServerSnapshot, bogus)
+
+if __name__ == '__main__':
+    test_helper.main()
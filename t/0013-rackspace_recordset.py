@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+
+##  Copyright (c) 2009-2010 Ethan Rowe (ethan@endpoint.com)
+##  For more information, see http://github.com/ethanrowe/thunderhead
+##
+##  This file is part of Thunderhead.
+##
+##  Thunderhead is free software: you can redistribute it and/or modify
+##  it under the terms of the GNU General Public License as published by
+##  the Free Software Foundation, either version 3 of the License, or
+##  (at your option) any later version.
+##
+##  Thunderhead is distributed in the hope that it will be useful,
+##  but WITHOUT ANY WARRANTY; without even the implied warranty of
+##  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##  GNU General Public License for more details.
+##
+##  You should have received a copy of the GNU General Public License
+##  along with Thunderhead.  If not, see <http://www.gnu.org/licenses/>.
+
+import test_helper
+import pickle
+import thunderhead.clock
+import thunderhead.rackspace.api as api
+from thunderhead.rackspace.recordset import RecordSet, IndexedRecordSet, AddressedRecordSet
+
+def server(id, **kwargs):
+    return api.Server(id=id, **kwargs)
+
+class TestIndexedRecordSet(test_helper.TestCase):
+    def setUp(self):
+        self.servers = AddressedRecordSet({
+            1: server(1, status='ACTIVE', imageId=2, flavorId=1, metadata={'Role': 'web'}, publicIPs=['67.23.10.1']),
+            2: server(2, status='ACTIVE', imageId=12, flavorId=1, metadata={'Role': 'db'}, privateIPs=['10.0.0.2']),
+            3: server(3, status='BUILD', imageId=12, flavorId=2),
+        })
+
+    def ids(self, records):
+        return sorted(records.keys())
+
+    def testWhere(self):
+        self.assertEqual(self.ids(self.servers.where(status='ACTIVE')), [1, 2])
+        self.assertEqual(self.ids(self.servers.where(status='ACTIVE', imageId=12)), [2])
+        self.assertEqual(self.ids(self.servers.where(imageId=12, flavorId=[1, 2])), [2, 3], 'alternative values')
+        self.assertEqual(self.ids(self.servers.where(metadataKey='Role')), [1, 2])
+        self.assertEqual(self.ids(self.servers.where(metadata=('Role', 'db'))), [2])
+        self.assertEqual(self.ids(self.servers.where(ip='10.0.0.2')), [2])
+        self.assertEqual(self.ids(self.servers.where(status='DELETED')), [])
+        self.assertEqual(self.ids(self.servers.where(id=3)), [3], 'unindexed criteria are checked directly')
+        self.assertEqual(self.ids(self.servers.where()), [1, 2, 3])
+        self.assertEqual(sorted(self.servers.indexValues('status')), ['ACTIVE', 'BUILD'])
+
+    def testMaintenance(self):
+        self.servers[3] = server(3, status='ACTIVE', imageId=12)
+        self.assertEqual(self.ids(self.servers.where(status='ACTIVE', imageId=12)), [2, 3], 'replacement reindexed')
+        self.assertEqual(self.servers.indexValues('status'), ['ACTIVE'], 'emptied buckets dropped')
+        del self.servers[1]
+        self.assertEqual(self.ids(self.servers.where(metadataKey='Role')), [2])
+        self.assertEqual(self.servers.pop(2).id, 2)
+        self.assertEqual(self.servers.pop(2, None), None)
+        self.servers.setdefault(4, server(4, status='BUILD'))
+        self.assertEqual(self.ids(self.servers.where(status='BUILD')), [4])
+        self.servers.clear()
+        self.assertEqual(self.servers.where(status='ACTIVE'), {})
+
+    def testCopy(self):
+        copy = self.servers.copy()
+        copy[1] = server(1, status='SUSPENDED', imageId=2)
+        del copy[2]
+        self.assertEqual(self.ids(copy.where(status='ACTIVE')), [])
+        self.assertEqual(self.ids(self.servers.where(status='ACTIVE')), [1, 2], 'original unaffected by the copy')
+        self.servers[3] = server(3, status='ACTIVE')
+        self.assertEqual(self.ids(copy.where(status='ACTIVE')), [], 'copy unaffected by the original')
+        self.assertEqual(self.ids(copy.where(status='BUILD')), [3])
+
+    def testCopySharesIndexes(self):
+        copy = self.servers.copy()
+        self.assertTrue(copy.indexes['imageId'] is self.servers.indexes['imageId'])
+        copy[3] = server(3, status='ACTIVE', imageId=12, flavorId=2)
+        self.assertTrue(copy.indexes['imageId'] is self.servers.indexes['imageId'], 'untouched indexes stay shared')
+        self.assertFalse(copy.indexes['status'] is self.servers.indexes['status'])
+        self.assertEqual(self.ids(self.servers.where(status='BUILD')), [3])
+
+    def testCopyVersions(self):
+        first = self.servers.copy()
+        first[1] = server(1, status='SUSPENDED')
+        second = self.servers.copy()
+        second[2] = server(2, status='SUSPENDED')
+        self.assertNotEqual(first.version, second.version, 'copies of the same set get distinct versions')
+        changeLog = self.servers.changeLog
+        self.assertEqual(changeLog.changedSince(self.servers.version, first.version), set([1]))
+        self.assertEqual(changeLog.changedSince(first.version, second.version), set([1, 2]), 'changes on both branches')
+        third = first.copy()
+        del third[3]
+        self.assertEqual(changeLog.changedSince(second.version, third.version), set([1, 2, 3]))
+        self.assertEqual(changeLog.changedSince(first.version, third.version), set([3]))
+        for i in range(changeLog.size):
+            third = third.copy()
+        self.assertEqual(changeLog.changedSince(first.version, third.version), None, 'pruned versions')
+
+    def testPickle(self):
+        copy = pickle.loads(pickle.dumps(self.servers, 2))
+        self.assertEqual(copy.__class__, AddressedRecordSet)
+        self.assertEqual(self.ids(copy.where(status='ACTIVE', imageId=2)), [1])
+
+class TestIndexedCachedResource(test_helper.TestCase):
+    def testMergeMaintainsIndexes(self):
+        deltas = [
+            {1: server(1, status='ACTIVE', imageId=2), 2: server(2, status='BUILD', imageId=2)},
+            {2: server(2, status='ACTIVE', imageId=2), 1: server(1, status='DELETED')},
+        ]
+        clock = thunderhead.clock.ManualClock()
+        resource = api.CachedResource(lambda since=None: deltas.pop(0))
+        resource.indexed = True
+        resource.clock = clock
+        servers = resource()
+        self.assertEqual(sorted(servers.where(status='ACTIVE').keys()), [1])
+        clock.advance(60)
+        updated = resource()
+        self.assertEqual(sorted(updated.where(status='ACTIVE').keys()), [2], 'delta merged and deleted servers dropped')
+        self.assertEqual(sorted(updated.where(imageId=2).keys()), [2])
+        self.assertEqual(sorted(servers.where(status='ACTIVE').keys()), [1], 'previous asset left intact')
+
+    def testRecordSetClass(self):
+        cache = api.KeyedCachedResource(lambda conn, since=None: {1: server(1, publicIPs=['67.23.10.1'])})
+        cache.indexed = True
+        cache.recordSetClass = AddressedRecordSet
+        servers = cache(None)
+        self.assertEqual(type(servers), AddressedRecordSet)
+        self.assertEqual(servers.where(ip='67.23.10.1').keys(), [1], 'IP index configured through the wrapper')
+
+    def testUnindexed(self):
+        resource = api.CachedResource(lambda since=None: {1: server(1)})
+        servers = resource()
+        self.assertEqual((type(servers), servers.indexes), (RecordSet, {}), 'indexing is opt-in')
+
+if __name__ == '__main__':
+    test_helper.main()
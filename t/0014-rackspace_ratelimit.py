@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+
+##  Copyright (c) 2009-2010 Ethan Rowe (ethan@endpoint.com)
+##  For more information, see http://github.com/ethanrowe/thunderhead
+##
+##  This file is part of Thunderhead.
+##
+##  Thunderhead is free software: you can redistribute it and/or modify
+##  it under the terms of the GNU General Public License as published by
+##  the Free Software Foundation, either version 3 of the License, or
+##  (at your option) any later version.
+##
+##  Thunderhead is distributed in the hope that it will be useful,
+##  but WITHOUT ANY WARRANTY; without even the implied warranty of
+##  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##  GNU General Public License for more details.
+##
+##  You should have received a copy of the GNU General Public License
+##  along with Thunderhead.  If not, see <http://www.gnu.org/licenses/>.
+
+import test_helper
+import thunderhead.rackspace
+from thunderhead.rackspace import exceptions
+from thunderhead.rackspace.ratelimit import RateLimiter, Limit, SlidingWindow
+from thunderhead.clock import ManualClock
+
+class TestSlidingWindow(test_helper.TestCase):
+    def grantedWithin(self, window, period):
+        granted = 0
+        now = 0
+        # reserve as fast as the window allows; count what falls within <period>
+        while True:
+            now += window.delay(now)
+            if now >= period: return granted
+            window.reserve(now)
+            granted += 1
+
+    def testFullRate(self):
+        self.assertEqual(self.grantedWithin(SlidingWindow(10, 60), 60), 10, 'the whole limit at once')
+        self.assertEqual(self.grantedWithin(SlidingWindow(3, 60), 600), 30, 'sustained at the published rate')
+        self.assertEqual(self.grantedWithin(SlidingWindow(50, 86400), 86400), 50)
+
+    def testNeverExceedsLimit(self):
+        window = SlidingWindow(3, 60)
+        for when in (0, 10, 100, 55):
+            window.reserve(when)
+        self.assertFalse(window.fits(30), 'would make four within a minute')
+        self.assertEqual(window.earliest(30), 60)
+        ahead = SlidingWindow(3, 60)
+        for when in (100, 105, 110):
+            ahead.reserve(when)
+        self.assertFalse(ahead.fits(80), 'reservations ahead count too')
+        self.assertTrue(ahead.fits(40))
+        self.assertEqual(ahead.earliest(80), 160)
+
+class TestRateLimiter(test_helper.TestCase):
+    def setUp(self):
+        self.clock = ManualClock()
+        self.limiter = RateLimiter(clock=self.clock)
+        self.sleeps = []
+        def sleep(seconds):
+            self.sleeps.append(seconds)
+            self.clock.advance(seconds)
+        self.limiter.sleep = sleep
+
+    def testLimitMatching(self):
+        createServer = Limit('POST', r'^/servers/?(\?|$)', 50, 86400)
+        self.assertTrue(createServer.matches('POST', '/servers'))
+        self.assertTrue(createServer.matches('post', '/servers?x=1'))
+        self.assertFalse(createServer.matches('POST', '/servers/1234/action'))
+        self.assertFalse(createServer.matches('GET', '/servers'))
+        self.assertEqual(len(self.limiter.windowsFor('POST', '/servers')), 2, 'POST /servers counts against both POST limits')
+        self.assertEqual(len(self.limiter.windowsFor('GET', '/servers/detail?changes-since=5')), 1)
+        self.assertEqual(len(self.limiter.windowsFor('GET', '/servers/detail')), 0, 'plain GETs are unlimited')
+
+    def testPacing(self):
+        for i in range(100):
+            self.assertEqual(self.limiter.acquire('DELETE', '/servers/%d' % i), 0)
+        self.assertEqual(self.limiter.delayCount, 0, 'the full limit goes out at once')
+        self.clock.advance(30)
+        self.assertEqual(self.limiter.acquire('DELETE', '/servers/100'), 30)
+        self.assertEqual((self.limiter.grantCount, self.limiter.delayCount), (101, 1))
+        self.assertEqual(self.limiter.delayTime, sum(self.sleeps))
+
+    def testSeparateWindows(self):
+        for i in range(10):
+            self.limiter.acquire('PUT', '/servers/1')
+        self.assertEqual(self.limiter.acquire('DELETE', '/servers/1'), 0, 'verbs have their own windows')
+        self.assertTrue(self.limiter.acquire('PUT', '/servers/1') > 0)
+
+    def testOverlappingLimits(self):
+        for i in range(50):
+            self.limiter.acquire('POST', '/servers')
+        self.assertEqual(self.clock.monotonic(), 240, 'ten a minute under the general POST limit')
+        self.limiter.maxWait = 3600
+        self.assertRaises(exceptions.RateLimitException, self.limiter.acquire, 'POST', '/servers')
+        self.clock.advance(60)
+        self.assertEqual(self.limiter.acquire('POST', '/servers/1/action'), 0, 'other POSTs not held up by the daily limit')
+
+    def testReservationOrder(self):
+        # concurrent callers each take their turn, rather than all waking at once
+        delays = [self.limiter.reserve('GET', '/servers/detail?changes-since=1') for i in range(5)]
+        self.assertEqual(delays, [0, 0, 0, 60, 60])
+        self.assertEqual(self.limiter.reserve('GET', '/servers/detail?changes-since=1'), 60)
+        self.assertEqual(self.limiter.reserve('GET', '/servers/detail?changes-since=1'), 120)
+
+    def testMaxWait(self):
+        self.limiter.maxWait = 1
+        for i in range(10):
+            self.limiter.acquire('POST', '/servers/1/action')
+        self.assertRaises(exceptions.RateLimitException, self.limiter.acquire, 'POST', '/servers/1/action')
+        self.assertEqual((self.limiter.grantCount, self.limiter.refusedCount), (10, 1))
+        self.clock.advance(60)
+        self.assertEqual(self.limiter.acquire('POST', '/servers/1/action'), 0, 'refusal took no slot')
+
+    def testThreads(self):
+        limiter = RateLimiter([Limit('GET', '.', 10, 0.5)])
+        results = []
+        def worker():
+            for i in range(5):
+                limiter.acquire('GET', '/x')
+            results.append(True)
+        started = test_helper.time.time()
+        threads = [test_helper.threading.Thread(target=worker) for i in range(4)]
+        for thread in threads: thread.start()
+        for thread in threads: thread.join()
+        elapsed = test_helper.time.time() - started
+        self.assertEqual((len(results), limiter.grantCount), (4, 20))
+        self.assertTrue(elapsed >= 0.5, 'requests beyond the limit wait for the window to move on')
+
+class TestAuthorizationRateLimiter(test_helper.TestCase):
+    def testSetRateLimiter(self):
+        class Response(object):
+            def getheader(self, name):
+                return 'http://localhost/' + name
+        class Authorization(thunderhead.rackspace.Authorization):
+            rateLimiterClass = RateLimiter
+            def getAuthorization(self, name, key):
+                return Response()
+        auth = Authorization('user', 'key')
+        self.assertTrue(isinstance(auth.rateLimiter, RateLimiter))
+        self.assertTrue(auth.serverManager.rateLimiter is auth.rateLimiter)
+        shared = RateLimiter()
+        auth.setRateLimiter(shared)
+        self.assertTrue(auth.serverManager.rateLimiter is shared)
+        self.assertTrue(auth.cdn.rateLimiter is shared)
+
+    def testPoolUsesLimiter(self):
+        requests = []
+        class Limiter(object):
+            def acquire(self, method, path):
+                requests.append((method, path))
+                raise exceptions.RateLimitException('no')
+        pool = thunderhead.rackspace.ConnectionPool('http://localhost/base', {}, rateLimiter=Limiter())
+        self.assertRaises(exceptions.RateLimitException, pool.request, 'DELETE', '/servers/1')
+        self.assertEqual(requests, [('DELETE', '/servers/1')])
+        self.assertEqual(pool.open, 0, 'no connection checked out for a refused request')
+
+if __name__ == '__main__':
+    test_helper.main()
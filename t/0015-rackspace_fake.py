@@ -0,0 +1,187 @@
+#!/usr/bin/env python
+
+##  Copyright (c) 2009-2010 Ethan Rowe (ethan@endpoint.com)
+##  For more information, see http://github.com/ethanrowe/thunderhead
+##
+##  This file is part of Thunderhead.
+##
+##  Thunderhead is free software: you can redistribute it and/or modify
+##  it under the terms of the GNU General Public License as published by
+##  the Free Software Foundation, either version 3 of the License, or
+##  (at your option) any later version.
+##
+##  Thunderhead is distributed in the hope that it will be useful,
+##  but WITHOUT ANY WARRANTY; without even the implied warranty of
+##  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##  GNU General Public License for more details.
+##
+##  You should have received a copy of the GNU General Public License
+##  along with Thunderhead.  If not, see <http://www.gnu.org/licenses/>.
+
+import test_helper
+import thunderhead.rackspace
+from thunderhead.rackspace import api, exceptions
+from thunderhead.rackspace.fake import FakeService, FakeHTTPServer, faultCodes
+from thunderhead.clock import ManualClock
+import xml.dom.minidom as minidom
+
+class TestFakeService(test_helper.TestCase):
+    def setUp(self):
+        self.clock = ManualClock(wall=1000000)
+        self.service = FakeService(self.clock, seed=1)
+        status, headers, body = self.service.handle('GET', '/v1.0', {'X-Auth-User': 'u', 'X-Auth-Key': 'k'}, '')
+        self.assertEqual(status, 204)
+        self.headers = {'X-Auth-Token': headers['X-Auth-Token']}
+        self.connection = thunderhead.rackspace.BoundConnection('http://localhost/v1.0/1000', {})
+
+    def request(self, method, path, body=''):
+        status, headers, content = self.service.handle(method, '/v1.0/1000' + path, self.headers, body)
+        return self.connection.parseResponse(status, headers.get('Content-Type', ''), content)
+
+    def createServer(self, name='web', **attributes):
+        (node, code) = self.request('POST', '/servers', api.Server(name=name, imageId=1, flavorId=1, **attributes).toXMLString())
+        self.assertEqual(code, 202)
+        return api.serverFromXML(node)
+
+    def testFaultCodes(self):
+        self.assertEqual(sorted(faultCodes.keys()), sorted(exceptions.faultList), 'every fault has a status')
+        self.assertRaises(ValueError, self.service.setFaultRate, 'noSuchFault', 0.5)
+
+    def testAuthentication(self):
+        status, headers, body = self.service.handle('GET', '/v1.0', {}, '')
+        self.assertEqual(status, 401)
+        self.headers = {'X-Auth-Token': 'bogus'}
+        self.assertRaises(exceptions.UnauthorizedException, self.request, 'GET', '/flavors/detail')
+        self.service.credentials = {'u': 'k'}
+        self.assertEqual(self.service.handle('GET', '/v1.0', {'x-auth-user': 'u', 'x-auth-key': 'x'}, '')[0], 401)
+
+    def testExpireTokens(self):
+        self.request('GET', '/flavors/detail')
+        self.service.expireTokens()
+        self.assertRaises(exceptions.UnauthorizedException, self.request, 'GET', '/flavors/detail')
+
+    def testCreateAndBuild(self):
+        created = self.createServer(metadata={'Role': 'web'})
+        self.assertEqual((created.id, created.status, created.progress), (1, 'BUILD', 0))
+        self.assertTrue(created.adminPass)
+        self.clock.advance(30)
+        (node, code) = self.request('GET', '/servers/1')
+        server = api.serverFromXML(node)
+        self.assertEqual((server.status, server.progress, server.metadata), ('BUILD', 50, {'Role': 'web'}))
+        self.clock.advance(30)
+        server = api.serversFromXML(self.request('GET', '/servers/detail')[0])[1]
+        self.assertEqual((server.status, server.progress), ('ACTIVE', 100))
+        self.assertFalse(self.service.building, 'finished builds stop advancing')
+
+    def testBadRequests(self):
+        self.assertRaises(exceptions.BadRequestException, self.request, 'POST', '/servers',
+            api.Server(name='x', imageId=999, flavorId=1).toXMLString())
+        self.assertRaises(exceptions.BadRequestException, self.request, 'POST', '/servers', 'not xml')
+        self.assertRaises(exceptions.ItemNotFoundException, self.request, 'GET', '/servers/42')
+        self.assertRaises(exceptions.ItemNotFoundException, self.request, 'GET', '/nothing')
+        self.assertRaises(exceptions.BadMethodException, self.request, 'PUT', '/servers')
+
+    def testChangesSince(self):
+        for i in range(3): self.service.addServer('s%d' % i, 1, 1, status='ACTIVE')
+        since = self.clock.wallTime() + 1
+        self.clock.advance(10)
+        self.service.updateServer(2, name='renamed')
+        self.request('DELETE', '/servers/3')
+        servers = api.serversFromXML(self.request('GET', '/servers/detail?changes-since=%d' % since)[0])
+        self.assertEqual(sorted(servers.keys()), [2, 3])
+        self.assertEqual(servers[2].name, 'renamed')
+        self.assertEqual(servers[3].status, 'DELETED', 'deleted server returned as a tombstone')
+        servers = api.serversFromXML(self.request('GET', '/servers/detail')[0])
+        self.assertEqual(sorted(servers.keys()), [1, 2], 'full list omits tombstones')
+        self.assertRaises(exceptions.BadRequestException, self.request, 'GET', '/servers/detail?changes-since=soon')
+
+    def testImages(self):
+        images = api.imagesFromXML(self.request('GET', '/images/detail')[0])
+        self.assertEqual(len(images), 4)
+        since = self.clock.wallTime() + 1
+        self.clock.advance(5)
+        self.service.addServer('s', 1, 1, status='ACTIVE')
+        (node, code) = self.request('POST', '/images', '<image name="backup" serverId="1"/>')
+        self.assertEqual((node.getAttribute('id'), code), ('5', 202))
+        self.assertEqual(self.request('DELETE', '/images/2')[1], 204)
+        images = api.imagesFromXML(self.request('GET', '/images/detail?changes-since=%d' % since)[0])
+        self.assertEqual(sorted([(id, image['status']) for id, image in images.items()]), [(2, 'DELETED'), (5, 'ACTIVE')])
+
+    def testSharedIPGroups(self):
+        self.service.addServer('a', 1, 1, status='ACTIVE')
+        self.service.addServer('b', 1, 1, status='ACTIVE')
+        (node, code) = self.request('POST', '/shared_ip_groups', api.SharedIPGroup(name='group', servers=[1]).toXMLString())
+        self.assertEqual(code, 201)
+        share = api.SharedIP(configureServer='true', sharedIpGroupId=1)
+        self.assertEqual(self.request('PUT', '/servers/2/ips/public/67.23.0.1', share.toXMLString())[1], 202)
+        groups = api.sharedIPGroupsFromXML(self.request('GET', '/shared_ip_groups')[0])
+        self.assertEqual(groups[1].servers, [1, 2])
+        self.service.removeServer(1)
+        self.assertEqual(self.service.groups[1].servers, [2], 'deleted servers leave their groups')
+        self.assertEqual(self.request('DELETE', '/shared_ip_groups/1')[1], 204)
+        self.assertEqual(api.sharedIPGroupsFromXML(self.request('GET', '/shared_ip_groups')[0]), {})
+        ips = api.publicIPsFromXML(self.request('GET', '/servers/2/ips/public')[0])
+        self.assertEqual([ip['addr'] for ip in ips.values()], ['67.23.0.2'])
+
+    def testInjectedFaults(self):
+        self.service.injectFault('serviceUnavailable')
+        self.service.injectFault('overLimit')
+        self.assertRaises(exceptions.ServiceUnavailableException, self.request, 'GET', '/flavors/detail')
+        try:
+            self.request('GET', '/flavors/detail')
+            self.fail('overLimit expected')
+        except exceptions.OverLimitException, e:
+            self.assertTrue(e.retryAfter, 'overLimit carries retryAfter')
+        self.request('GET', '/flavors/detail')
+        self.assertEqual(self.service.faultCounts, {'serviceUnavailable': 1, 'overLimit': 1})
+
+    def testFaultRates(self):
+        self.service.setFaultRate('overLimit', 0.25)
+        faults = 0
+        for i in range(400):
+            try:
+                self.request('GET', '/flavors/detail')
+            except exceptions.OverLimitException:
+                faults += 1
+        self.assertTrue(60 < faults < 140, 'fault rate roughly honored: %d' % faults)
+
+class TestFakeHTTPServer(test_helper.TestCase):
+    def setUp(self):
+        self.service = FakeService(seed=2)
+        self.server = FakeHTTPServer(self.service).start()
+        class Authorization(thunderhead.rackspace.Authorization):
+            baseURL = self.server.authURL()
+        self.session = Authorization('user', 'key')
+        self.session.retryPolicy.sleep = lambda seconds: None
+
+    def tearDown(self):
+        for pool in (self.session.serverManager, self.session.storage, self.session.cdn):
+            pool.close()
+        self.server.stop()
+
+    def testCachedDeltas(self):
+        for i in range(50): self.service.addServer('s%d' % i, 1, 1, status='ACTIVE')
+        cache = api.CachedResource(api.getServers)
+        cache.interval = 0
+        conn = self.session.serverManager
+        self.assertEqual(len(cache(conn)), 50)
+        self.service.removeServer(10)
+        self.service.updateServer(20, name='renamed')
+        created = api.createServer(conn, api.Server(name='new', imageId=1, flavorId=1))
+        servers = cache(conn)
+        self.assertEqual(sorted(servers.keys()), sorted(self.service.servers.keys()), 'deltas merged, tombstones removed')
+        self.assertEqual(servers[20].name, 'renamed')
+        self.assertEqual(servers[created.id].status, 'BUILD')
+
+    def testRetriedFaults(self):
+        self.service.injectFault('serviceUnavailable', 2)
+        self.assertEqual(len(api.getFlavors(self.session.serverManager)), 7)
+        self.assertEqual(self.session.retryPolicy.retryCount, 2)
+
+    def testReauthorization(self):
+        self.service.expireTokens()
+        self.assertEqual(len(api.getImages(self.session.serverManager)), 4)
+        self.assertEqual(self.session.reauthCount, 1)
+
+if __name__ == '__main__':
+    test_helper.main()
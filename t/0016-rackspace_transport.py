@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+
+##  Copyright (c) 2009-2010 Ethan Rowe (ethan@endpoint.com)
+##  For more information, see http://github.com/ethanrowe/thunderhead
+##
+##  This file is part of Thunderhead.
+##
+##  Thunderhead is free software: you can redistribute it and/or modify
+##  it under the terms of the GNU General Public License as published by
+##  the Free Software Foundation, either version 3 of the License, or
+##  (at your option) any later version.
+##
+##  Thunderhead is distributed in the hope that it will be useful,
+##  but WITHOUT ANY WARRANTY; without even the implied warranty of
+##  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##  GNU General Public License for more details.
+##
+##  You should have received a copy of the GNU General Public License
+##  along with Thunderhead.  If not, see <http://www.gnu.org/licenses/>.
+
+import test_helper
+import httplib
+import thunderhead.rackspace
+from thunderhead.rackspace import api, exceptions, transport
+from thunderhead.rackspace.fake import FakeService
+
+class RecordingHandler(object):
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.requests = []
+
+    def __call__(self, method, path, headers, body):
+        self.requests.append((method, path, headers, body))
+        return self.responses.pop(0)
+
+class TestHTTPTransport(test_helper.TestCase):
+    def testConnect(self):
+        http = transport.HTTPTransport()
+        self.assertTrue(isinstance(http.connect('http', 'localhost', 8080), httplib.HTTPConnection))
+        self.assertTrue(isinstance(http.connect('https', 'localhost'), httplib.HTTPSConnection))
+        self.assertFalse(http.isConnected(http.connect('http', 'localhost')))
+        self.assertTrue(thunderhead.rackspace.BoundConnection('http://localhost/', {}).transport is transport.defaultTransport)
+
+class TestInMemoryTransport(test_helper.TestCase):
+    def connection(self, handler):
+        return thunderhead.rackspace.BoundConnection(
+            'http://memory/prefix', {'X-Auth-Token': 'token'}, transport.InMemoryTransport(handler))
+
+    def testRequest(self):
+        handler = RecordingHandler(
+            (200, {'Content-Type': 'application/xml'}, '<thing/>'),
+            (204, {}, ''),
+        )
+        connection = self.connection(handler)
+        (node, code) = connection.request('GET', '/things')
+        self.assertEqual((node.nodeName, code), ('thing', 200))
+        (node, code) = connection.request('POST', '/things', '<new/>')
+        self.assertEqual((node, code), (None, 204))
+        method, path, headers, body = handler.requests[1]
+        self.assertEqual((method, path, body), ('POST', '/prefix/things', '<new/>'))
+        self.assertEqual((headers['X-Auth-Token'], headers['Content-Type']), ('token', 'application/xml'))
+        self.assertEqual((connection.requestCount, connection.reuseCount), (2, 1), 'connection kept open between requests')
+
+    def testFault(self):
+        handler = RecordingHandler((413, {'Content-Type': 'application/xml', 'Retry-After': '7'},
+            '<overLimit><message>Slow down</message></overLimit>'))
+        try:
+            self.connection(handler).request('GET', '/things')
+            self.fail('fault expected')
+        except exceptions.OverLimitException, e:
+            self.assertEqual(e.retryAfter, '7', 'response headers available')
+
+    def testStream(self):
+        servers = '<servers><server id="1" name="a"/><server id="2" name="b"/></servers>'
+        handler = RecordingHandler((200, {'Content-Type': 'application/xml'}, servers))
+        records = self.connection(handler).requestStream('GET', '/servers/detail', api.ServerBuilder())
+        self.assertEqual([server.name for server in records], ['a', 'b'])
+
+    def testResponseNotReady(self):
+        connection = transport.InMemoryConnection(RecordingHandler())
+        self.assertRaises(httplib.ResponseNotReady, connection.getresponse)
+
+class TestInMemoryService(test_helper.TestCase):
+    def setUp(self):
+        self.service = FakeService(seed=3)
+        self.service.baseURL = 'http://memory'
+        class Authorization(thunderhead.rackspace.Authorization):
+            baseURL = 'http://memory/v1.0'
+            transport = transport.InMemoryTransport(self.service.handle)
+        self.session = Authorization('user', 'key')
+
+    def testAccountOperations(self):
+        conn = self.session.serverManager
+        for i in range(20): self.service.addServer('s%d' % i, 1, 1, status='ACTIVE')
+        cache = api.CachedResource(api.getServers)
+        cache.interval = 0
+        self.assertEqual(len(cache(conn)), 20)
+        api.createServer(conn, api.Server(name='new', imageId=1, flavorId=1))
+        api.deleteServer(conn, 3)
+        self.assertEqual(sorted(cache(conn).keys()), sorted(self.service.servers.keys()))
+        self.assertEqual(len(api.getFlavors(conn)), 7)
+
+    def testReauthorization(self):
+        self.service.expireTokens()
+        self.assertEqual(len(api.getImages(self.session.serverManager)), 4)
+        self.assertEqual(self.session.reauthCount, 1)
+
+if __name__ == '__main__':
+    test_helper.main()
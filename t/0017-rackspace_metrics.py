@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+
+##  Copyright (c) 2009-2010 Ethan Rowe (ethan@endpoint.com)
+##  For more information, see http://github.com/ethanrowe/thunderhead
+##
+##  This file is part of Thunderhead.
+##
+##  Thunderhead is free software: you can redistribute it and/or modify
+##  it under the terms of the GNU General Public License as published by
+##  the Free Software Foundation, either version 3 of the License, or
+##  (at your option) any later version.
+##
+##  Thunderhead is distributed in the hope that it will be useful,
+##  but WITHOUT ANY WARRANTY; without even the implied warranty of
+##  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+##  GNU General Public License for more details.
+##
+##  You should have received a copy of the GNU General Public License
+##  along with Thunderhead.  If not, see <http://www.gnu.org/licenses/>.
+
+import test_helper
+from cStringIO import StringIO
+import thunderhead.rackspace
+from thunderhead.rackspace import api, exceptions, metrics, transport
+from thunderhead.rackspace.fake import FakeService
+
+class Recorder(object):
+    def __init__(self):
+        self.requests = []
+        self.retries = []
+        self.calls = []
+
+    def requestFinished(self, timing):
+        self.requests.append(timing)
+
+    def retryScheduled(self, method, exception, attempt, delay):
+        self.retries.append((method, exception.fault, attempt))
+
+    def callFinished(self, timing):
+        self.calls.append(timing)
+
+class TestInstrumentation(test_helper.TestCase):
+    def setUp(self):
+        self.service = FakeService(seed=5)
+        self.service.baseURL = 'http://memory'
+        class Authorization(thunderhead.rackspace.Authorization):
+            baseURL = 'http://memory/v1.0'
+            transport = transport.InMemoryTransport(self.service.handle)
+        self.session = Authorization('user', 'key')
+        self.session.retryPolicy.sleep = lambda delay: None
+        self.recorder = Recorder()
+        self.aggregator = metrics.Aggregator()
+        self.session.addObserver(self.recorder)
+        self.session.addObserver(self.aggregator)
+        self.conn = self.session.serverManager
+        for i in range(5): self.service.addServer('s%d' % i, 1, 1, status='ACTIVE')
+
+    def testRequestPhases(self):
+        api.getFlavors(self.conn)
+        api.getFlavors(self.conn)
+        first, second = self.recorder.requests
+        self.assertEqual((first.method, first.path, first.status), ('GET', '/flavors/detail', 200))
+        self.assertEqual(sorted(first.phases.keys()), ['build', 'connect', 'parse', 'read', 'send', 'wait'])
+        self.assertFalse(second.phases.has_key('connect'), 'connection kept open')
+        self.assertEqual((first.reused, second.reused), (False, True))
+        self.assertTrue(first.responseBytes > 0)
+        self.assertTrue(first.finished is not None and first.total() >= 0)
+
+    def testRequestBody(self):
+        api.createServer(self.conn, api.Server(name='new', imageId=1, flavorId=1))
+        timing = self.recorder.requests[0]
+        self.assertEqual((timing.method, timing.status), ('POST', 202))
+        self.assertTrue(timing.requestBytes > 0)
+        self.assertTrue(timing.phases.has_key('parse'))
+
+    def testFaultsAndRetries(self):
+        self.service.injectFault('serviceUnavailable')
+        self.assertEqual(len(api.getServers(self.conn)), 5)
+        self.assertEqual([(t.status, t.fault) for t in self.recorder.requests], [(503, 'serviceUnavailable'), (200, None)])
+        self.assertEqual(self.recorder.retries, [('GET', 'serviceUnavailable', 0)])
+        self.service.injectFault('itemNotFound')
+        self.assertRaises(exceptions.ItemNotFoundException, api.deleteServer, self.conn, 1)
+        data = self.aggregator.snapshot()
+        self.assertEqual((data['requests'], data['statuses']), (3, {200: 1, 503: 1, 404: 1}))
+        self.assertEqual(data['faults'], {'serviceUnavailable': 1, 'itemNotFound': 1})
+        self.assertEqual(data['retries'], {'serviceUnavailable': 1})
+        self.assertEqual(data['calls']['deleteServer']['errors'], 1)
+
+    def testCallTiming(self):
+        servers = api.getServers(self.conn)
+        call = self.recorder.calls[0]
+        self.assertEqual((call.name, call.records, call.error), ('getServers', 5, None))
+        request = self.recorder.requests[0]
+        self.assertEqual(call.requestTime, request.total() - request.phases['build'])
+        self.assertTrue(call.build() >= request.phases['build'] > 0, 'record building counts as build time')
+
+    def testStreamFinishesWhenConsumed(self):
+        records = api.iterServers(self.conn)
+        self.assertEqual(self.recorder.requests, [])
+        self.assertEqual(len(list(records)), 5)
+        timing = self.recorder.requests[0]
+        self.assertEqual((timing.status, timing.error), (200, None))
+        self.assertTrue(timing.phases['parse'] >= 0 and timing.responseBytes > 0)
+        self.assertTrue(timing.phases['build'] > 0, 'record building timed apart from parsing')
+        self.assertEqual(self.recorder.calls, [], 'iter functions are not api calls')
+
+    def testCachedResourceKeepsName(self):
+        self.assertEqual(api.getServers.__name__, 'getServers')
+        cache = api.KeyedCachedResource(api.getServers)
+        self.assertEqual(len(cache(self.conn)), 5)
+
+    def testDump(self):
+        api.getServers(self.conn)
+        out = StringIO()
+        self.aggregator.dump(out)
+        text = out.getvalue()
+        self.assertTrue(text.startswith('requests 1,'))
+        self.assertTrue('statuses: 200=1' in text)
+        self.assertTrue('call getServers: 1 calls, 0 errors, 5 records' in text)
+        self.aggregator.reset()
+        self.assertEqual(self.aggregator.snapshot()['requests'], 0)
+
+class TestUninstrumented(test_helper.TestCase):
+    def testNoObservers(self):
+        service = FakeService(seed=5)
+        connection = thunderhead.rackspace.BoundConnection('http://memory/v1.0/1000', {}, transport.InMemoryTransport(service.handle))
+        try:
+            api.getFlavors(connection)
+        except exceptions.UnauthorizedException:
+            pass
+        self.assertTrue(connection.timing is None)
+
+class TestHistogram(test_helper.TestCase):
+    def testPercentiles(self):
+        histogram = metrics.Histogram()
+        self.assertEqual(histogram.percentile(0.5), None)
+        for value in [0.0001] * 90 + [0.03] * 9 + [3.5]:
+            histogram.observe(value)
+        data = histogram.snapshot()
+        self.assertEqual((data['count'], data['min'], data['max']), (100, 0.0001, 3.5))
+        self.assertEqual((data['p50'], data['p90'], data['p99']), (0.0005, 0.0005, 0.05), 'upper bounds of buckets')
+        self.assertEqual(histogram.percentile(1.0), 3.5)
+        self.assertEqual(dict(data['buckets'])[5.0], 1)
+
+if __name__ == '__main__':
+    test_helper.main()
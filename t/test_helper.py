@@ -16,7 +16,7 @@
 ##  You should have received a copy of the GNU General Public License
 ##  along with Thunderhead.  If not, see <http://www.gnu.org/licenses/>.
 
-import sys, os.path, time, pickle, BaseHTTPServer
+import sys, os.path, time, pickle, threading, BaseHTTPServer
 import xml.dom.minidom as minidom
 from unittest import *
 
@@ -54,11 +54,19 @@ class StubServer(object):
         def do_DELETE(self):
             return self.generalHandler('delete')
 
-    def __init__(self, handlers):
-        self.server = BaseHTTPServer.HTTPServer(('127.0.0.1', 0), StubServer.Handler)
+    # HTTP version spoken by the stub, and the number of client connections it
+    # accepts before exiting; with HTTP/1.1, each connection may carry many requests.
+    protocol = 'HTTP/1.0'
+    connections = 1
+
+    def __init__(self, handlers, protocol=None, connections=None):
+        class Handler(StubServer.Handler):
+            protocol_version = protocol or self.protocol
+        self.server = BaseHTTPServer.HTTPServer(('127.0.0.1', 0), Handler)
         self.server.handlers = handlers or {}
         self.server.testStub = self
         self.port = self.server.server_port
+        if connections: self.connections = connections
 
     def sendRequestData(self, request):
         info = {
@@ -90,11 +98,12 @@ class StubServer(object):
         return self.pid
 
     def run(self):
-        self.server.handle_request()
+        for i in range(self.connections):
+            self.server.handle_request()
 
     @classmethod
-    def test(self, handlers):
-        instance = self(handlers)
+    def test(self, handlers, **options):
+        instance = self(handlers, **options)
         instance.start()
         return instance
 
@@ -121,6 +130,13 @@ class Authenticator(StubServer):
         handler.end_headers()
 
 
+def xmlResponse(handler, xml, code=200):
+    handler.send_response(code)
+    handler.send_header('content-type', 'application/xml')
+    handler.send_header('content-length', str(len(xml)))
+    handler.end_headers()
+    handler.wfile.write(xml)
+
 import re
 def transformHandler(list):
     return [(re.compile('/' + segment + '\Z'), method) for (segment, method) in list]